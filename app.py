@@ -4,15 +4,34 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from models import db, User
 from routes import register_routes
+from crm.crm_routes import register_crm_routes
+from crm.customers import ensure_search_indexes
+from crm.overview import init_overview
+from conversations import schedule_session_purge
+from schema import sync_schema
+from jobs import start_backfill, start_background_worker
+from events import broker
+from workload import init_workload
+from retrieval import init_retrieval
+from logging_config import init_logging, get_logger
+from metrics import init_metrics
+from profiler import init_profiler
+from serialization import init_json
+from passwords import init_passwords
+from auth_tokens import init_tokens
+from ratelimit import limiter
+import tasks  # noqa: F401 - registra las tareas de la cola
 from config import config
 import os
 
+logger = get_logger('app')
+
 def setup_openai():
     """Configurar OpenAI de manera robusta"""
     openai_key = os.getenv('OPENAI_API_KEY')
     
     if not openai_key or openai_key.startswith('tu_clave') or openai_key.startswith('sk-tu-'):
-        print("⚠️  OPENAI_API_KEY no configurada - IA limitada")
+        logger.warning("OPENAI_API_KEY no configurada - IA limitada")
         return None
     
     try:
@@ -28,24 +47,23 @@ def setup_openai():
                 messages=[{"role": "user", "content": "test"}],
                 max_tokens=1
             )
-            print("✅ OpenAI configurado correctamente (nueva API)")
+            logger.info("OpenAI configurado correctamente (nueva API)")
         else:
-            print("✅ OpenAI configurado para producción")
+            logger.info("OpenAI configurado para producción")
         
         return client
         
     except ImportError:
-        print("❌ Error: Versión incorrecta de OpenAI")
-        print("🔧 Instala: pip install openai==1.3.0")
+        logger.error("Versión incorrecta de OpenAI. Instala: pip install openai==1.3.0")
         return None
     except Exception as e:
         error_msg = str(e)
         if "api_key" in error_msg.lower():
-            print("❌ OpenAI API Key inválida")
+            logger.error("OpenAI API Key inválida")
         elif "quota" in error_msg.lower():
-            print("❌ Sin créditos en OpenAI")
+            logger.error("Sin créditos en OpenAI")
         else:
-            print(f"❌ Error OpenAI: {e}")
+            logger.error("Error OpenAI", extra={'error': error_msg})
         return None
 
 def create_app():
@@ -54,12 +72,19 @@ def create_app():
     # Configuración desde config.py
     app.config.from_object(config)
     
+    # Logging estructurado antes de cualquier otra inicialización
+    init_logging(app)
+    
+    # Serialización JSON con orjson cuando está disponible
+    init_json(app)
+    
     # Configurar OpenAI
     openai_client = setup_openai()
     app.config['OPENAI_CLIENT'] = openai_client
     
     # Inicializar extensiones
     db.init_app(app)
+    init_passwords(app)
     
     # Configurar CORS según entorno
     if config.is_production():
@@ -70,9 +95,26 @@ def create_app():
         CORS(app)
     
     jwt = JWTManager(app)
+    init_tokens(jwt)
+    
+    # Métricas por ruta, base de datos, archivos y OpenAI
+    init_metrics(app)
+    
+    # Límites de tasa por usuario/IP antes de llegar a las rutas
+    limiter.init_app(app)
+    
+    # Perfilador SQL por petición (PROFILER_ENABLED)
+    init_profiler(app)
+    
+    # Broker de eventos en tiempo real (SSE)
+    broker.init_app(app)
+    init_workload(broker)
+    init_overview(broker)
+    init_retrieval(app, broker)
     
     # Registrar rutas
     register_routes(app)
+    register_crm_routes(app)
     
     # Ruta principal para servir el HTML
     @app.route('/')
@@ -185,11 +227,11 @@ def create_demo_users_if_needed():
     try:
         db.session.commit()
         if not config.is_production():
-            print("✅ Usuarios de demostración verificados")
+            logger.info("Usuarios de demostración verificados")
     except Exception as e:
         db.session.rollback()
         if not config.is_production():
-            print(f"⚠️  Error al crear usuarios de demostración: {e}")
+            logger.warning("Error al crear usuarios de demostración", extra={'error': str(e)})
 
 # Crear la aplicación
 app = create_app()
@@ -198,6 +240,24 @@ app = create_app()
 with app.app_context():
     try:
         db.create_all()
+        # Columnas e índices nuevos en tablas que ya existían
+        added = sync_schema(db.engine, db.metadata)
+        if 'pqr.customer_id' in added:
+            start_backfill('crm.backfill_pqr_customers', 'crm.backfill_pqr_customers:inicial')
+            db.session.commit()
+        if 'pqr.lot_id' in added:
+            start_backfill('lots.backfill_pqr_lots', 'lots.backfill_pqr_lots:inicial')
+            db.session.commit()
+        if 'pqr.sla_due_at' in added:
+            start_backfill('sla.backfill', 'sla.backfill:inicial')
+            db.session.commit()
+        if 'pqr.duplicate_of_id' in added:
+            start_backfill('duplicates.backfill_signatures', 'duplicates.backfill_signatures:inicial')
+            db.session.commit()
+        ensure_search_indexes(db.engine)
+        # Limpieza horaria de conversaciones del asistente (se reprograma sola; la llave evita duplicados)
+        schedule_session_purge()
+        db.session.commit()
         create_demo_users_if_needed()
         
         # Crear directorio uploads si no existe
@@ -206,7 +266,11 @@ with app.app_context():
             
     except Exception as e:
         if not config.is_production():
-            print(f"⚠️  Error en inicialización: {e}")
+            logger.warning("Error en inicialización", extra={'error': str(e)})
+
+# Worker de la cola de trabajos en un hilo de este proceso
+if config.JOBS_INLINE_WORKER:
+    start_background_worker(app)
 
 if __name__ == '__main__':
     # Solo para desarrollo local
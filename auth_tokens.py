@@ -0,0 +1,125 @@
+# auth_tokens.py - Tokens de acceso + renovación con rotación y lista de revocación cacheada
+import threading
+import time
+from datetime import date, datetime
+
+from flask import current_app, jsonify
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from sqlalchemy.exc import IntegrityError
+
+from jobs import enqueue
+from logging_config import get_logger
+from models import db, RevokedToken
+
+logger = get_logger('auth_tokens')
+
+# Tope de entradas de la caché de revocación por worker
+REVOCATION_CACHE_MAX = 10000
+
+_lock = threading.Lock()
+_revocation_cache = {}
+
+
+def issue_tokens(user):
+    """Par de tokens para un usuario: acceso (corto, con el rol para el limitador) y renovación (largo)"""
+    identity = str(user.id)
+    return {
+        'access_token': create_access_token(identity=identity, additional_claims={'role': user.role}),
+        'refresh_token': create_refresh_token(identity=identity),
+        'expires_in': int(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds())
+    }
+
+
+def _cache_put(jti, revoked, ttl):
+    with _lock:
+        if len(_revocation_cache) >= REVOCATION_CACHE_MAX:
+            _revocation_cache.clear()
+        _revocation_cache[jti] = (revoked, time.monotonic() + ttl)
+
+
+def is_revoked(jwt_payload):
+    """Consulta cacheada: revocado se recuerda hasta que el token expira, vigente por REVOKED_CACHE_SECONDS"""
+    jti = jwt_payload['jti']
+    with _lock:
+        cached = _revocation_cache.get(jti)
+    if cached and time.monotonic() < cached[1]:
+        return cached[0]
+
+    revoked = db.session.get(RevokedToken, jti) is not None
+    if revoked:
+        ttl = max(jwt_payload['exp'] - time.time(), 1)
+    else:
+        ttl = current_app.config['REVOKED_CACHE_SECONDS']
+    _cache_put(jti, revoked, ttl)
+    return revoked
+
+
+def revoke(jwt_payload, reason='rotado'):
+    """Revocar un token de renovación; False si ya estaba revocado.
+
+    El INSERT sobre la llave primaria (jti) es el punto de sincronización: dos
+    renovaciones simultáneas con el mismo token, aun en workers distintos, no
+    pueden ganar las dos aunque la caché de alguno esté desactualizada.
+    """
+    jti = jwt_payload['jti']
+    db.session.add(RevokedToken(
+        jti=jti,
+        user_id=int(jwt_payload['sub']) if jwt_payload.get('sub') else None,
+        token_type=jwt_payload.get('type', 'refresh'),
+        reason=reason,
+        expires_at=datetime.utcfromtimestamp(jwt_payload['exp'])
+    ))
+    try:
+        db.session.commit()
+        newly_revoked = True
+    except IntegrityError:
+        db.session.rollback()
+        # Solo el conflicto en la llave de revoked_token significa que el token ya se había usado
+        if db.session.get(RevokedToken, jti) is None:
+            raise
+        newly_revoked = False
+    _cache_put(jti, True, max(jwt_payload['exp'] - time.time(), 1))
+
+    if newly_revoked:
+        # Limpieza diaria de revocaciones ya expiradas, en su propia transacción: un fallo no invalida la rotación
+        try:
+            enqueue('tokens.purge_revoked', idempotency_key=f'tokens.purge_revoked:{date.today().isoformat()}',
+                    delay_seconds=3600)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning('No se pudo encolar la limpieza de revocaciones', extra={'error': str(e)})
+    return newly_revoked
+
+
+def revoke_encoded(refresh_token, reason='logout'):
+    """Revocar un token de renovación recibido como texto (p. ej. en el cuerpo del logout)"""
+    try:
+        payload = decode_token(refresh_token)
+    except Exception:
+        return False
+    if payload.get('type') != 'refresh':
+        return False
+    return revoke(payload, reason)
+
+
+def purge_expired():
+    deleted = RevokedToken.query.filter(RevokedToken.expires_at < datetime.utcnow()).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def init_tokens(jwt):
+    """Registrar la consulta de revocación; solo aplica a tokens de renovación"""
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        # Los tokens de acceso son de vida corta y no se consultan en la base de datos
+        if jwt_payload.get('type') != 'refresh':
+            return False
+        return is_revoked(jwt_payload)
+
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        logger.warning('Token de renovación revocado reutilizado', extra={'user_id': jwt_payload.get('sub')})
+        return jsonify({'error': 'La sesión fue cerrada. Inicie sesión nuevamente.'}), 401
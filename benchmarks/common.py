@@ -0,0 +1,73 @@
+# benchmarks/common.py - Utilidades compartidas por los benchmarks (entorno, stub de OpenAI, percentiles)
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_PASSWORD = 'bench123'
+
+
+def prepare_environment(database_url, workdir=None):
+    """Configurar variables de entorno ANTES de importar la app y moverse a un directorio temporal.
+
+    uploads/ es relativo al directorio actual, así que los adjuntos del benchmark
+    quedan en el directorio temporal y no en el repositorio.
+    """
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('JOBS_INLINE_WORKER', 'false')
+    os.environ.setdefault('OPENAI_API_KEY', '')
+    # Todas las personas del benchmark comparten IP; el limitador sesgaría las latencias
+    os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    workdir = workdir or tempfile.mkdtemp(prefix='pqr_bench_')
+    os.makedirs(os.path.join(workdir, 'uploads'), exist_ok=True)
+    os.chdir(workdir)
+    return workdir
+
+
+def sqlite_url(path=None):
+    path = path or os.path.join(tempfile.gettempdir(), 'pqr_bench.db')
+    return f'sqlite:///{path}'
+
+
+class StubOpenAIClient:
+    """Cliente OpenAI simulado: responde con texto fijo tras una latencia configurable"""
+
+    def __init__(self, latency=0.05, reply='Respuesta simulada del asistente.'):
+        self.latency = latency
+        self.reply = reply
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        time.sleep(self.latency)
+        prompt_chars = sum(len(m.get('content', '')) for m in kwargs.get('messages', []))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))],
+            usage=SimpleNamespace(prompt_tokens=prompt_chars // 4, completion_tokens=len(self.reply) // 4)
+        )
+
+
+def percentile(sorted_values, pct):
+    """Percentil por interpolación lineal sobre una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def latency_summary(samples):
+    values = sorted(samples)
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2) if values else 0.0
+    }
@@ -0,0 +1,247 @@
+# benchmarks/load_test.py - Carga mixta sobre la API PQR con latencias p50/p95/p99 por endpoint
+#
+# Uso (en proceso, con la app importada y OpenAI simulado):
+#   python benchmarks/seed.py --database-url sqlite:////tmp/pqr_bench.db --pqrs 20000 --reset
+#   python benchmarks/load_test.py --database-url sqlite:////tmp/pqr_bench.db --duration 30 --concurrency 8
+#
+# Contra un servidor en ejecución (gunicorn local, Postgres local):
+#   python benchmarks/load_test.py --url http://localhost:5000 --duration 60 --concurrency 16 --output resultados.json
+import argparse
+import io
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+from common import BENCH_PASSWORD, StubOpenAIClient, latency_summary, prepare_environment, sqlite_url
+
+# Peso relativo de cada operación en la mezcla de carga
+DEFAULT_MIX = {
+    'login': 3,
+    'create_pqr': 8,
+    'list_pqrs': 20,
+    'search_pqrs': 15,
+    'stats': 15,
+    'comments': 15,
+    'add_comment': 6,
+    'agents': 5,
+    'ai_chat': 5,
+}
+SEARCH_TERMS = ['Salchicha', 'L00', 'KFC', 'Jamón', 'olor', 'PQR-BENCH-00001']
+
+
+class InProcessClient:
+    """Cliente sobre app.test_client(): sin red, mide la app y la base de datos"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers=None, json_body=None, form=None, files=None):
+        data = dict(form or {})
+        for field, (filename, content) in (files or {}).items():
+            data[field] = (io.BytesIO(content), filename)
+        kwargs = {'headers': headers or {}}
+        if json_body is not None:
+            kwargs['json'] = json_body
+        elif data:
+            kwargs['data'] = data
+            kwargs['content_type'] = 'multipart/form-data' if files else 'application/x-www-form-urlencoded'
+        response = self.client.open(path, method=method, **kwargs)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """Cliente HTTP con requests contra un servidor ya levantado"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, headers=None, json_body=None, form=None, files=None):
+        files = {field: (filename, content) for field, (filename, content) in (files or {}).items()} or None
+        response = self.session.request(method, self.base_url + path, headers=headers or {},
+                                        json=json_body, data=form, files=files, timeout=120)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+
+class LoadTest:
+    def __init__(self, make_client, clients=10, agents=3, mix=None, upload_bytes=50_000, seed=7):
+        self.make_client = make_client
+        self.mix = mix or DEFAULT_MIX
+        self.upload_bytes = upload_bytes
+        self.seed = seed
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        self.personas = []
+        self.n_clients = clients
+        self.n_agents = agents
+
+    def login(self, client, email):
+        status, body = client.request('POST', '/api/login', json_body={'email': email, 'password': BENCH_PASSWORD})
+        if status != 200:
+            raise RuntimeError(f'No se pudo iniciar sesión como {email} ({status}); ¿se ejecutó seed.py?')
+        return {'email': email, 'role': body['user']['role'],
+                'headers': {'Authorization': f"Bearer {body['access_token']}"}}
+
+    def setup(self):
+        """Iniciar sesión una vez por persona (fuera de la medición) y recolectar PQRs de cada cliente"""
+        client = self.make_client()
+        for i in range(self.n_clients):
+            persona = self.login(client, f'cliente{i}@bench.local')
+            status, body = client.request('GET', '/api/pqrs', headers=persona['headers'])
+            persona['pqr_ids'] = [pqr['id'] for pqr in (body or [])[:50]]
+            self.personas.append(persona)
+        for i in range(self.n_agents):
+            persona = self.login(client, f'agente{i}@bench.local')
+            persona['pqr_ids'] = []
+            self.personas.append(persona)
+        all_ids = [pqr_id for persona in self.personas for pqr_id in persona['pqr_ids']]
+        for persona in self.personas:
+            if persona['role'] != 'cliente':
+                persona['pqr_ids'] = all_ids
+
+    def operation(self, name, client, persona, rng):
+        headers = persona['headers']
+        pqr_id = rng.choice(persona['pqr_ids']) if persona['pqr_ids'] else None
+
+        if name == 'login':
+            return client.request('POST', '/api/login', json_body={'email': persona['email'], 'password': BENCH_PASSWORD})
+        if name == 'create_pqr':
+            form = {
+                'email-contacto': persona['email'], 'cliente': 'Benchmark', 'tipo-pqr': 'queja',
+                'asunto-detalle': 'Producto con olor extraño', 'nombre-producto': 'Salchicha Ranchera',
+                'lote': f'L{rng.randint(1, 400):04d}', 'descripcion': 'Prueba de carga: producto con olor extraño.',
+                'cantidad-gramos': '500', 'fecha-vencimiento': '2030-01-01'
+            }
+            files = {
+                'archivo-factura': ('factura.pdf', b'0' * self.upload_bytes),
+                'foto-producto-novedad': ('foto.jpg', b'1' * self.upload_bytes)
+            }
+            return client.request('POST', '/api/pqrs', headers=headers, form=form, files=files)
+        if name == 'list_pqrs':
+            return client.request('GET', '/api/pqrs', headers=headers)
+        if name == 'search_pqrs':
+            return client.request('GET', f'/api/pqrs?search={rng.choice(SEARCH_TERMS)}', headers=headers)
+        if name == 'stats':
+            return client.request('GET', '/api/stats', headers=headers)
+        if name == 'comments' and pqr_id:
+            return client.request('GET', f'/api/pqrs/{pqr_id}/comments/timeline', headers=headers)
+        if name == 'add_comment' and pqr_id:
+            return client.request('POST', f'/api/pqrs/{pqr_id}/comments', headers=headers,
+                                  form={'comment_text': 'Comentario de prueba de carga'})
+        if name == 'agents' and persona['role'] != 'cliente':
+            return client.request('GET', '/api/agents', headers=headers)
+        if name == 'ai_chat':
+            return client.request('POST', '/api/ai-chat', headers=headers,
+                                  json_body={'message': '¿Cuál es el estado de mis PQRs del lote L0001?'})
+        return None
+
+    def worker(self, index, deadline, max_requests):
+        rng = random.Random(self.seed + index)
+        client = self.make_client()
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        done = 0
+        while time.perf_counter() < deadline and (max_requests is None or done < max_requests):
+            name = rng.choices(names, weights)[0]
+            persona = rng.choice(self.personas)
+            started = time.perf_counter()
+            try:
+                result = self.operation(name, client, persona, rng)
+            except Exception:
+                result = (599, None)
+            if result is None:
+                continue
+            elapsed = time.perf_counter() - started
+            done += 1
+            with self.lock:
+                self.samples[name].append(elapsed)
+                if result[0] >= 400:
+                    self.errors[name] += 1
+
+    def run(self, duration=30, concurrency=4, requests_per_worker=None):
+        self.setup()
+        deadline = time.perf_counter() + (duration if requests_per_worker is None else 10 ** 9)
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self.worker, args=(i, deadline, requests_per_worker))
+                   for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return self.report(elapsed, concurrency)
+
+    def report(self, elapsed, concurrency):
+        endpoints = {}
+        for name, samples in sorted(self.samples.items()):
+            summary = latency_summary(samples)
+            summary['errors'] = self.errors[name]
+            summary['throughput_rps'] = round(len(samples) / elapsed, 2)
+            endpoints[name] = summary
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            'elapsed_seconds': round(elapsed, 2),
+            'concurrency': concurrency,
+            'total_requests': total,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'endpoints': endpoints
+        }
+
+
+def print_report(result):
+    print(f"\n📊 {result['total_requests']} peticiones en {result['elapsed_seconds']}s "
+          f"({result['throughput_rps']} req/s, concurrencia {result['concurrency']})\n")
+    header = f"{'endpoint':<14}{'n':>7}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print('-' * len(header))
+    for name, s in result['endpoints'].items():
+        print(f"{name:<14}{s['count']:>7}{s['errors']:>6}{s['throughput_rps']:>9}"
+              f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Prueba de carga mixta de la API PQR')
+    parser.add_argument('--database-url', default=None, help='Modo en proceso: URL de la base sembrada con seed.py')
+    parser.add_argument('--url', default=None, help='Modo HTTP: URL base de un servidor en ejecución')
+    parser.add_argument('--duration', type=float, default=30, help='Segundos de carga')
+    parser.add_argument('--requests-per-worker', type=int, default=None, help='Alternativa a --duration')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=10, help='Personas cliente (cliente<i>@bench.local)')
+    parser.add_argument('--agents', type=int, default=3, help='Personas internas (agente<i>@bench.local)')
+    parser.add_argument('--upload-bytes', type=int, default=50_000, help='Tamaño de cada adjunto en create_pqr')
+    parser.add_argument('--ai-latency', type=float, default=0.05, help='Latencia del OpenAI simulado (modo en proceso)')
+    parser.add_argument('--mix', default=None, help='JSON con pesos por operación, p. ej. \'{"list_pqrs": 50}\'')
+    parser.add_argument('--output', default=None, help='Guardar el resultado en JSON')
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    mix = dict(DEFAULT_MIX, **json.loads(args.mix)) if args.mix else DEFAULT_MIX
+    # prepare_environment cambia el directorio actual; la ruta relativa se resuelve antes
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        prepare_environment(args.database_url or sqlite_url())
+        from app import app
+        app.config['OPENAI_CLIENT'] = StubOpenAIClient(latency=args.ai_latency)
+        make_client = lambda: InProcessClient(app)
+
+    test = LoadTest(make_client, args.clients, args.agents, mix, args.upload_bytes)
+    result = test.run(args.duration, args.concurrency, args.requests_per_worker)
+    print_report(result)
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n💾 Resultado guardado en {output_path}")
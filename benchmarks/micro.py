@@ -0,0 +1,216 @@
+# benchmarks/micro.py - Micro-benchmarks de serialización, codificación JSON, bcrypt y decoradores de rol
+#
+# Uso:
+#   python benchmarks/micro.py --save                 # medir y guardar la línea base
+#   python benchmarks/micro.py                        # medir y comparar contra la línea base
+#   python benchmarks/micro.py --sizes 1000,10000 --threshold 15
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import ROOT_DIR, prepare_environment, sqlite_url
+
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, 'benchmarks', 'micro_baseline.json')
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def measure(fn, repeat=5, number=1):
+    """Ejecutar fn number veces por ronda; retorna mejor y mediana por ronda en ms"""
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - started) / number)
+    return {'best_ms': round(min(rounds) * 1000, 4), 'median_ms': round(statistics.median(rounds) * 1000, 4)}
+
+
+def calls(fn, iterations):
+    """Llamar fn varias veces sin retener resultados (no mantener vivos objetos del identity map)"""
+    def run():
+        for _ in range(iterations):
+            fn()
+    return run
+
+
+def build_objects(size, rng):
+    """PQRs, comentarios y usuarios transitorios (sin sesión) con relaciones ya resueltas"""
+    from models import User, PQR, PQRComment
+    from seed import PRODUCTS, CLIENTS, TYPES, STATUSES, PRIORITIES, PROBLEMS
+
+    now = datetime.utcnow()
+    users = [User(id=i, email=f'usuario{i}@bench.local', name=f'Usuario {i}', role='calidad', created_at=now)
+             for i in range(1, 51)]
+    pqrs = []
+    comments = []
+    for i in range(size):
+        created = now - timedelta(minutes=i)
+        product = rng.choice(PRODUCTS)
+        problem = rng.choice(PROBLEMS)
+        author = rng.choice(users)
+        agent = rng.choice(users + [None])
+        pqr = PQR(
+            id=f'00000000-0000-4000-8000-{i:012d}', ticket_id=f'PQR-MICRO-{i:07d}', user_id=author.id,
+            type=rng.choice(TYPES), subject=f'{problem.capitalize()} en {product}',
+            description=f'Se reporta {problem} en el producto {product}.', product_name=product,
+            batch_number=f'L{rng.randint(1, 400):04d}', expiration_date=(created + timedelta(days=30)).date(),
+            quantity_grams=rng.randint(100, 5000), devolution_type='parcial', client_name=rng.choice(CLIENTS),
+            client_email='compras@cliente.com', ideal_temperature_range='Refrigerado (0°C a 4°C)',
+            status=rng.choice(STATUSES), priority=rng.choice(PRIORITIES),
+            assigned_agent_id=agent.id if agent else None, created_at=created, updated_at=created
+        )
+        pqr.author = author
+        pqr.assigned_agent = agent
+        pqrs.append(pqr)
+        comment = PQRComment(id=i + 1, pqr_id=pqr.id, user_id=author.id, comment_text=f'Seguimiento: {problem}',
+                             is_internal=False, created_at=created)
+        comment.author = author
+        comments.append(comment)
+    return pqrs, comments, users
+
+
+def bench_serialization(app, sizes, rng):
+    results = {}
+    for size in sizes:
+        pqrs, comments, users = build_objects(size, rng)
+        repeat = 5 if size <= 10000 else 3
+        pqr_dicts = [pqr.to_dict() for pqr in pqrs]
+        results[f'pqr.to_dict[{size}]'] = measure(lambda: [pqr.to_dict() for pqr in pqrs], repeat)
+        results[f'comment.to_dict[{size}]'] = measure(lambda: [c.to_dict() for c in comments], repeat)
+        with app.app_context():
+            results[f'json.pqrs[{size}]'] = measure(lambda: app.json.dumps(pqr_dicts), repeat)
+            results[f'jsonify.pqrs[{size}]'] = measure(
+                lambda: app.json.response([pqr.to_dict() for pqr in pqrs]).get_data(), repeat)
+            # Mismo listado desde tuplas de columnas (lo que retorna la consulta proyectada)
+            from serialization import PQR_COLUMN_FIELDS, PQR_LIST_FIELDS, project_rows
+            rows = [tuple(getattr(pqr, field) for field in PQR_COLUMN_FIELDS) +
+                    (pqr.author.name, pqr.assigned_agent.name if pqr.assigned_agent else None) for pqr in pqrs]
+            results[f'projection.pqrs[{size}]'] = measure(
+                lambda: app.json.response(project_rows(rows, PQR_LIST_FIELDS)).get_data(), repeat)
+    user = users[0]
+    results['user.to_dict[x1000]'] = measure(calls(user.to_dict, 1000))
+    return results
+
+
+def bench_bcrypt(app):
+    from models import User
+
+    user = User(email='bcrypt@bench.local', name='bcrypt', role='cliente')
+    with app.app_context():
+        user.set_password('bench123')
+        return {
+            'bcrypt.check_password': measure(lambda: user.check_password('bench123'), repeat=5),
+            'bcrypt.check_password_wrong': measure(lambda: user.check_password('incorrecta'), repeat=5)
+        }
+
+
+def bench_authorization(app, iterations=500):
+    """Costo de get_current_user y de los decoradores de rol dentro de una petición con JWT"""
+    from flask_jwt_extended import create_access_token, verify_jwt_in_request
+    from models import User
+    from routes import get_current_user, require_admin, require_non_client
+
+    def endpoint():
+        return None
+
+    admin_endpoint = require_admin(endpoint)
+    staff_endpoint = require_non_client(endpoint)
+
+    with app.app_context():
+        admin = User.query.filter_by(role='administrador').first()
+        token = create_access_token(identity=str(admin.id))
+
+    headers = {'Authorization': f'Bearer {token}'}
+    results = {}
+    with app.test_request_context('/api/pqrs', headers=headers):
+        results[f'jwt.verify[x{iterations}]'] = measure(calls(verify_jwt_in_request, iterations))
+        verify_jwt_in_request()
+        results[f'get_current_user[x{iterations}]'] = measure(calls(get_current_user, iterations))
+        results[f'endpoint.sin_decorador[x{iterations}]'] = measure(calls(endpoint, iterations))
+        results[f'require_admin[x{iterations}]'] = measure(calls(admin_endpoint, iterations))
+        results[f'require_non_client[x{iterations}]'] = measure(calls(staff_endpoint, iterations))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Comparar medianas contra la línea base; retorna las métricas que empeoraron más del umbral"""
+    regressions = []
+    print(f"\n{'benchmark':<38}{'base ms':>12}{'actual ms':>12}{'cambio':>10}")
+    print('-' * 72)
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            print(f"{name:<38}{'-':>12}{current['median_ms']:>12}{'nuevo':>10}")
+            continue
+        delta = (current['median_ms'] - previous['median_ms']) / previous['median_ms'] * 100 if previous['median_ms'] else 0.0
+        mark = ' ⚠️' if delta > threshold else ''
+        print(f"{name:<38}{previous['median_ms']:>12}{current['median_ms']:>12}{delta:>+9.1f}%{mark}")
+        if delta > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'benchmark':<38}{'mejor ms':>12}{'mediana ms':>12}")
+    print('-' * 62)
+    for name, value in results.items():
+        print(f"{name:<38}{value['best_ms']:>12}{value['median_ms']:>12}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks de rutas críticas del sistema PQR')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Número de filas a serializar, separados por coma')
+    parser.add_argument('--only', default=None, help='serialization, bcrypt o authorization (separados por coma)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Archivo JSON de la línea base')
+    parser.add_argument('--save', action='store_true', help='Guardar los resultados como nueva línea base')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Porcentaje de empeoramiento tolerado')
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    baseline_path = os.path.abspath(args.baseline)
+    prepare_environment(sqlite_url(os.path.join(tempfile.gettempdir(), 'pqr_micro.db')))
+    from app import app
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    sections = set(args.only.split(',')) if args.only else {'serialization', 'bcrypt', 'authorization'}
+    rng = random.Random(42)
+
+    results = {}
+    if 'serialization' in sections:
+        results.update(bench_serialization(app, sizes, rng))
+    if 'bcrypt' in sections:
+        results.update(bench_bcrypt(app))
+    if 'authorization' in sections:
+        results.update(bench_authorization(app))
+
+    print_results(results)
+
+    if args.save:
+        with open(baseline_path, 'w') as f:
+            json.dump({
+                'created_at': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results
+            }, f, indent=2)
+        print(f"\n💾 Línea base guardada en {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} benchmark(s) empeoraron más de {args.threshold}%")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones por encima de {args.threshold}%")
+    else:
+        print(f"\nℹ️ No hay línea base en {baseline_path}; ejecute con --save para crearla")
@@ -0,0 +1,158 @@
+# benchmarks/seed.py - Poblar una base de datos con volumen configurable para benchmarks
+#
+# Uso:
+#   python benchmarks/seed.py --database-url sqlite:////tmp/pqr_bench.db --pqrs 20000
+#   python benchmarks/seed.py --database-url postgresql://localhost/pqr_bench --pqrs 100000 --reset
+import argparse
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from common import BENCH_PASSWORD, prepare_environment, sqlite_url
+
+PRODUCTS = ['Salchicha Ranchera', 'Jamón Sanduchero', 'Chorizo Santarrosano', 'Mortadela', 'Tocineta Ahumada',
+            'Pechuga Apanada Congelada', 'Nuggets de Pollo', 'Queso Doble Crema', 'Salami', 'Butifarra']
+CLIENTS = ['KFC', 'Pizzamania', 'Cubano Corral', 'Invertinos', 'Frisby', 'El Corral', 'Sandwich Qbano']
+TYPES = ['peticion', 'queja', 'reclamo', 'sugerencia']
+STATUSES = ['abierto', 'en_proceso', 'cerrado']
+PRIORITIES = ['baja', 'media', 'alta']
+PROBLEMS = ['olor extraño', 'empaque roto', 'color anormal', 'textura blanda', 'cuerpo extraño',
+            'producto vencido', 'faltante de unidades', 'temperatura inadecuada al recibir']
+ATTACHMENT_FIELDS = ['archivo-factura', 'foto-producto-novedad', 'foto-etiqueta-apertura']
+CHUNK_SIZE = 1000
+
+
+def chunked(rows, size=CHUNK_SIZE):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def seed(app, clients=50, agents=8, pqrs=5000, comments_per_pqr=3, attachments_per_pqr=1, days=365, reset=False, rng=None):
+    """Insertar usuarios, PQRs, comentarios y archivos adjuntos simulados; retorna un resumen"""
+    from models import db, User, PQR, PQRComment
+
+    rng = rng or random.Random(42)
+    started = time.perf_counter()
+
+    with app.app_context():
+        if reset:
+            db.drop_all()
+            db.create_all()
+
+        # Un solo hash bcrypt reutilizado: sembrar no debe medir el costo de bcrypt
+        template = User(email='template@bench', name='template')
+        template.set_password(BENCH_PASSWORD)
+        password_hash = template.password_hash
+
+        now = datetime.utcnow()
+        user_rows = []
+        for i in range(agents):
+            role = ['calidad', 'registrador', 'administrador'][i % 3]
+            user_rows.append({'email': f'agente{i}@bench.local', 'name': f'Agente {i}', 'role': role,
+                              'password_hash': password_hash, 'created_at': now})
+        for i in range(clients):
+            user_rows.append({'email': f'cliente{i}@bench.local', 'name': f'Cliente {i}', 'role': 'cliente',
+                              'password_hash': password_hash, 'created_at': now})
+        existing = {email for (email,) in db.session.query(User.email).filter(User.email.like('%@bench.local'))}
+        user_rows = [row for row in user_rows if row['email'] not in existing]
+        for chunk in chunked(user_rows):
+            db.session.execute(insert(User), chunk)
+        db.session.commit()
+
+        bench_users = User.query.filter(User.email.like('%@bench.local')).all()
+        agent_ids = [u.id for u in bench_users if u.role != 'cliente']
+        client_ids = [u.id for u in bench_users if u.role == 'cliente']
+
+        pqr_rows = []
+        comment_rows = []
+        for i in range(pqrs):
+            pqr_id = str(uuid.uuid4())
+            created = now - timedelta(seconds=rng.randint(0, days * 86400))
+            product = rng.choice(PRODUCTS)
+            client = rng.choice(CLIENTS)
+            problem = rng.choice(PROBLEMS)
+            pqr_rows.append({
+                'id': pqr_id,
+                'ticket_id': f'PQR-BENCH-{i:07d}-{pqr_id[:6].upper()}',
+                'user_id': rng.choice(client_ids),
+                'type': rng.choice(TYPES),
+                'subject': f'{problem.capitalize()} en {product}',
+                'description': f'El cliente {client} reporta {problem} en el producto {product}. '
+                               f'Se solicita revisión del lote y respuesta del área de calidad.',
+                'product_name': product,
+                'batch_number': f'L{rng.randint(1, 400):04d}',
+                'expiration_date': (created + timedelta(days=rng.randint(10, 90))).date(),
+                'quantity_grams': rng.randint(100, 5000),
+                'devolution_type': rng.choice(['parcial', 'completa', 'no-aplica']),
+                'client_name': client,
+                'client_email': f'compras@{client.lower().replace(" ", "")}.com',
+                'ideal_temperature_range': 'Refrigerado (0°C a 4°C)',
+                'status': rng.choice(STATUSES),
+                'priority': rng.choice(PRIORITIES),
+                'assigned_agent_id': rng.choice(agent_ids + [None]),
+                'created_at': created,
+                'updated_at': created
+            })
+            for j in range(comments_per_pqr):
+                comment_rows.append({
+                    'pqr_id': pqr_id,
+                    'user_id': rng.choice(agent_ids),
+                    'comment_text': f'Seguimiento {j + 1}: {rng.choice(PROBLEMS)} verificado en planta.',
+                    'author_name': None,
+                    'is_internal': rng.random() < 0.3,
+                    'created_at': created + timedelta(hours=j + 1)
+                })
+
+        for chunk in chunked(pqr_rows):
+            db.session.execute(insert(PQR), chunk)
+        for chunk in chunked(comment_rows):
+            db.session.execute(insert(PQRComment), chunk)
+        db.session.commit()
+
+    # Adjuntos simulados con el mismo esquema de nombres de create_pqr
+    attachments = 0
+    os.makedirs('uploads', exist_ok=True)
+    for row in pqr_rows:
+        for i in range(attachments_per_pqr):
+            field = ATTACHMENT_FIELDS[i % len(ATTACHMENT_FIELDS)]
+            name = f"{row['id']}_{field}_{row['created_at'].strftime('%Y%m%d_%H%M%S')}_{i}_stub.pdf"
+            with open(os.path.join('uploads', name), 'wb') as f:
+                f.write(b'%PDF-1.4 stub\n')
+            attachments += 1
+
+    return {
+        'users': len(user_rows),
+        'pqrs': len(pqr_rows),
+        'comments': len(comment_rows),
+        'attachments': attachments,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Poblar la base de datos para benchmarks del sistema PQR')
+    parser.add_argument('--database-url', default=None, help='URL SQLAlchemy (por defecto SQLite temporal)')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--agents', type=int, default=8)
+    parser.add_argument('--pqrs', type=int, default=5000)
+    parser.add_argument('--comments-per-pqr', type=int, default=3)
+    parser.add_argument('--attachments-per-pqr', type=int, default=1)
+    parser.add_argument('--days', type=int, default=365, help='Rango de fechas de creación hacia atrás')
+    parser.add_argument('--reset', action='store_true', help='Borrar y recrear todas las tablas antes de sembrar')
+    parser.add_argument('--workdir', default=None, help='Directorio de trabajo (uploads/ de los adjuntos)')
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    workdir = prepare_environment(args.database_url or sqlite_url(), args.workdir)
+    from app import app
+
+    summary = seed(app, args.clients, args.agents, args.pqrs, args.comments_per_pqr,
+                   args.attachments_per_pqr, args.days, args.reset)
+    print(f"🌱 Datos sembrados en {summary['seconds']}s: {summary['users']} usuarios, {summary['pqrs']} PQRs, "
+          f"{summary['comments']} comentarios, {summary['attachments']} adjuntos (uploads en {workdir})")
@@ -0,0 +1,238 @@
+# clusters.py - Detección de clústeres de PQRs por lote/producto contra una línea base móvil (incremental)
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from events import broker
+from logging_config import get_logger
+from models import db, normalize_lot_code, normalize_text, AnalyticsCursor, ComplaintAlert, ComplaintBucket, PQR
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = get_logger('clusters')
+
+CURSOR_NAME = 'complaint_clusters'
+# Las sugerencias no indican un problema del producto
+EXCLUDED_TYPES = ['sugerencia']
+ALERT_STATUSES = ['abierta', 'revisada', 'descartada']
+SCAN_BATCH_SIZE = 2000
+SCAN_MAX_BATCHES = 50
+# PQRs más recientes que esto esperan a la siguiente pasada: transacciones aún abiertas y triage pendiente
+SCAN_LAG_SECONDS = 60
+# Dispersión mínima de la línea base: con historia en cero, el pico se mide contra una desviación de 1
+MIN_STD = 1.0
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(value, hours):
+    size = timedelta(hours=hours)
+    return EPOCH + ((value - EPOCH) // size) * size
+
+
+def _upsert_bucket(connection, keys, product_name, count):
+    insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    table = ComplaintBucket.__table__
+    stmt = insert(table).values(**keys, product_name=product_name, complaint_count=count)
+    stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_={
+        'complaint_count': table.c.complaint_count + stmt.excluded.complaint_count
+    })
+    connection.execute(stmt)
+
+
+def _baseline_numpy(series_counts, cells, first_bucket, hours, window):
+    """Media y desviación de las `window` ventanas anteriores de cada celda, vectorizado sobre una matriz"""
+    rows = {key: index for index, key in enumerate(series_counts)}
+    size = timedelta(hours=hours)
+    columns = max((bucket - first_bucket) // size for _, bucket in cells) + 1
+    matrix = np.zeros((len(rows), columns), dtype=np.float64)
+    for key, counts in series_counts.items():
+        for bucket, count in counts.items():
+            column = (bucket - first_bucket) // size
+            if 0 <= column < columns:
+                matrix[rows[key], column] = count
+
+    # Sumas acumuladas: la suma de la ventana previa a t es cs[t] - cs[t - window]
+    padded = np.pad(matrix, ((0, 0), (window, 0)))
+    cs = np.concatenate([np.zeros((len(rows), 1)), np.cumsum(padded, axis=1)], axis=1)
+    cs2 = np.concatenate([np.zeros((len(rows), 1)), np.cumsum(padded ** 2, axis=1)], axis=1)
+    sums = cs[:, window:window + columns] - cs[:, :columns]
+    squares = cs2[:, window:window + columns] - cs2[:, :columns]
+    means = sums / window
+    stds = np.sqrt(np.maximum(squares / window - means ** 2, 0))
+
+    row_index = np.array([rows[key] for key, _ in cells])
+    column_index = np.array([(bucket - first_bucket) // size for _, bucket in cells])
+    return list(zip(matrix[row_index, column_index].tolist(), means[row_index, column_index].tolist(),
+                    stds[row_index, column_index].tolist()))
+
+
+def _baseline_python(series_counts, cells, first_bucket, hours, window):
+    """Mismo cálculo que _baseline_numpy sin NumPy (celda por celda)"""
+    size = timedelta(hours=hours)
+    results = []
+    for key, bucket in cells:
+        counts = series_counts[key]
+        previous = [counts.get(bucket - size * offset, 0) for offset in range(1, window + 1)]
+        mean = sum(previous) / window
+        std = math.sqrt(max(sum(value * value for value in previous) / window - mean * mean, 0))
+        results.append((counts.get(bucket, 0), mean, std))
+    return results
+
+
+def detect_spikes(touched, now=None):
+    """Evaluar las ventanas tocadas por lote y por producto; retorna las alertas nuevas"""
+    config = current_app.config
+    hours = config.get('CLUSTER_BUCKET_HOURS', 24)
+    window = config.get('CLUSTER_BASELINE_BUCKETS', 28)
+    threshold = config.get('CLUSTER_Z_THRESHOLD', 3.0)
+    min_count = config.get('CLUSTER_MIN_COUNT', 3)
+    size = timedelta(hours=hours)
+
+    # Solo ventanas recientes: un reproceso completo no llena el tablero de alertas históricas
+    recent = bucket_start(now or datetime.utcnow(), hours) - size * window
+    touched = {key for key in touched if key[2] >= recent}
+    if not touched:
+        return []
+
+    product_keys = {product_key for product_key, _, _ in touched}
+    first_bucket = min(bucket for _, _, bucket in touched) - size * window
+    last_bucket = max(bucket for _, _, bucket in touched)
+    lot_series = defaultdict(dict)
+    product_series = defaultdict(lambda: defaultdict(int))
+    names = {}
+    for product_key, lot_code, bucket, product_name, count in db.session.query(
+            ComplaintBucket.product_key, ComplaintBucket.lot_code, ComplaintBucket.bucket_start,
+            ComplaintBucket.product_name, ComplaintBucket.complaint_count
+    ).filter(ComplaintBucket.product_key.in_(product_keys),
+             ComplaintBucket.bucket_start >= first_bucket, ComplaintBucket.bucket_start <= last_bucket):
+        lot_series[('lote', product_key, lot_code)][bucket] = count
+        product_series[('producto', product_key, '')][bucket] += count
+        names.setdefault(product_key, product_name)
+
+    series_counts = {**lot_series, **product_series}
+    cells = sorted({(('lote', product_key, lot_code), bucket) for product_key, lot_code, bucket in touched if lot_code}
+                   | {(('producto', product_key, ''), bucket) for product_key, _, bucket in touched})
+    baseline = _baseline_numpy if NUMPY_AVAILABLE else _baseline_python
+    flagged = {}
+    for (key, bucket), (count, mean, std) in zip(cells, baseline(series_counts, cells, first_bucket, hours, window)):
+        z_score = (count - mean) / max(std, math.sqrt(mean), MIN_STD)
+        if count >= min_count and z_score >= threshold:
+            flagged[(*key, bucket)] = (int(count), mean, z_score)
+    if not flagged:
+        return []
+
+    existing = {
+        (alert.scope, alert.product_key, alert.lot_code, alert.bucket_start): alert
+        for alert in ComplaintAlert.query.filter(
+            ComplaintAlert.product_key.in_({key[1] for key in flagged}),
+            ComplaintAlert.bucket_start.in_({key[3] for key in flagged}))
+    }
+    created = []
+    for (scope, product_key, lot_code, bucket), (count, mean, z_score) in flagged.items():
+        alert = existing.get((scope, product_key, lot_code, bucket))
+        if alert:
+            # La ventana sigue creciendo: se actualiza la alerta en lugar de duplicarla
+            alert.complaint_count, alert.baseline_mean, alert.z_score = count, mean, z_score
+            continue
+        alert = ComplaintAlert(scope=scope, product_key=product_key, product_name=names[product_key],
+                               lot_code=lot_code, bucket_start=bucket, bucket_hours=hours,
+                               complaint_count=count, baseline_mean=mean, z_score=z_score)
+        db.session.add(alert)
+        created.append(alert)
+    db.session.commit()
+
+    for alert in created:
+        broker.publish('quality.cluster_alert', alert_id=alert.id, scope=alert.scope,
+                       product_name=alert.product_name, lot_code=alert.lot_code or None,
+                       complaint_count=alert.complaint_count, internal=True)
+    return created
+
+
+def scan_new_complaints(batch_size=SCAN_BATCH_SIZE, max_batches=SCAN_MAX_BATCHES, now=None):
+    """Sumar a las ventanas solo las PQRs posteriores al cursor y evaluar las ventanas tocadas"""
+    started = time.perf_counter()
+    hours = current_app.config.get('CLUSTER_BUCKET_HOURS', 24)
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=SCAN_LAG_SECONDS)
+    cursor = db.session.get(AnalyticsCursor, CURSOR_NAME) or AnalyticsCursor(name=CURSOR_NAME)
+    db.session.add(cursor)
+
+    processed = 0
+    touched = set()
+    for _ in range(max_batches):
+        query = db.session.query(PQR.created_at, PQR.id, PQR.product_name, PQR.batch_number)\
+            .filter(PQR.type.notin_(EXCLUDED_TYPES), PQR.created_at <= cutoff)
+        if cursor.last_created_at is not None:
+            query = query.filter(db.tuple_(PQR.created_at, PQR.id) > (cursor.last_created_at, cursor.last_id))
+        rows = query.order_by(PQR.created_at, PQR.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        deltas = defaultdict(int)
+        names = {}
+        for created_at, _, product_name, batch_number in rows:
+            product_key = normalize_text(product_name)
+            key = (product_key, normalize_lot_code(batch_number), bucket_start(created_at, hours))
+            deltas[key] += 1
+            names.setdefault(product_key, (product_name or '').strip())
+        connection = db.session.connection()
+        for (product_key, lot_code, bucket), count in deltas.items():
+            _upsert_bucket(connection, {'product_key': product_key, 'lot_code': lot_code, 'bucket_start': bucket},
+                           names[product_key], count)
+        # Ventanas y cursor avanzan en la misma transacción: un fallo no cuenta dos veces
+        cursor.last_created_at, cursor.last_id = rows[-1][0], rows[-1][1]
+        db.session.commit()
+        touched.update(deltas)
+        processed += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    alerts = detect_spikes(touched, now=now)
+    if processed < batch_size * max_batches:
+        # Sin continuación pendiente: las PQRs dentro del margen necesitan su propia pasada
+        schedule_lagging_scan(cutoff)
+        db.session.commit()
+    logger.info('Clústeres de PQRs evaluados', extra={
+        'processed': processed, 'buckets': len(touched), 'alerts': len(alerts),
+        'numpy': NUMPY_AVAILABLE, 'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+    })
+    return processed, alerts
+
+
+def reset_complaint_buckets():
+    """Borrar ventanas y cursor para reprocesar toda la historia (las alertas se conservan)"""
+    ComplaintBucket.query.delete()
+    AnalyticsCursor.query.filter_by(name=CURSOR_NAME).delete()
+    db.session.commit()
+
+
+def schedule_cluster_scan():
+    """Encolar la siguiente pasada; las PQRs creadas en el mismo intervalo comparten un trabajo"""
+    from jobs import enqueue
+
+    if not current_app.config.get('CLUSTER_SCAN_ENABLED', True):
+        return None
+    interval = max(current_app.config.get('CLUSTER_SCAN_INTERVAL_SECONDS', 300), SCAN_LAG_SECONDS)
+    bucket = int(time.time() // interval)
+    return enqueue('quality.cluster_scan', {}, idempotency_key=f'quality.cluster_scan:{bucket}',
+                   delay_seconds=interval)
+
+
+def schedule_lagging_scan(cutoff):
+    """Pasada de seguimiento si quedaron PQRs posteriores al corte de SCAN_LAG_SECONDS (el llamador hace commit)"""
+    from jobs import enqueue
+
+    pending = db.session.query(PQR.id).filter(PQR.type.notin_(EXCLUDED_TYPES), PQR.created_at > cutoff).first()
+    if pending is None:
+        return None
+    bucket = int(time.time() // SCAN_LAG_SECONDS)
+    return enqueue('quality.cluster_scan', {}, idempotency_key=f'quality.cluster_scan:rezagadas:{bucket}',
+                   delay_seconds=SCAN_LAG_SECONDS)
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,6 +21,98 @@ class Config:
         SQLALCHEMY_DATABASE_URI = 'sqlite:///database.db'
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # JWT solo en headers; el stream de eventos (EventSource) acepta ?jwt= en su propia ruta
+    JWT_TOKEN_LOCATION = ['headers']
+    # Acceso corto renovado en silencio con el token de renovación (rotado en cada uso)
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', 15)))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_DAYS', 14)))
+    # Segundos que un worker recuerda que un token de renovación NO está revocado
+    REVOKED_CACHE_SECONDS = int(os.getenv('REVOKED_CACHE_SECONDS', 30))
+
+    # Eventos en tiempo real: 'memory' (un proceso) o 'postgres' (LISTEN/NOTIFY entre workers)
+    EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', 'postgres' if SQLALCHEMY_DATABASE_URI.startswith('postgresql') else 'memory')
+    EVENTS_STREAM_TIMEOUT = int(os.getenv('EVENTS_STREAM_TIMEOUT', 300))
+    EVENTS_HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+    # Cada stream abierto ocupa un hilo de gthread (--threads 16 por worker) hasta EVENTS_STREAM_TIMEOUT.
+    # Por encima de este tope por worker se responde 503 + Retry-After y el SPA consulta periódicamente;
+    # debe dejar hilos libres para el resto de la API (3 workers x 8 = 24 pestañas en vivo)
+    EVENTS_MAX_STREAMS_PER_WORKER = int(os.getenv('EVENTS_MAX_STREAMS_PER_WORKER', 8))
+    EVENTS_RETRY_AFTER_SECONDS = int(os.getenv('EVENTS_RETRY_AFTER_SECONDS', 60))
+
+    # Cola de trabajos en segundo plano (tabla job)
+    JOBS_BATCH_SIZE = int(os.getenv('JOBS_BATCH_SIZE', 10))
+    JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 2))
+    JOBS_LOCK_TIMEOUT = int(os.getenv('JOBS_LOCK_TIMEOUT', 300))
+    JOBS_RETRY_BASE_SECONDS = float(os.getenv('JOBS_RETRY_BASE_SECONDS', 5))
+    JOBS_RETRY_MAX_SECONDS = float(os.getenv('JOBS_RETRY_MAX_SECONDS', 900))
+    # Sin proceso worker (p. ej. el start de nixpacks.toml) cada proceso web ejecuta un worker en un hilo.
+    # El Procfile despliega `worker` y por eso desactiva el hilo en `web` (JOBS_INLINE_WORKER=false)
+    JOBS_INLINE_WORKER = os.getenv('JOBS_INLINE_WORKER', 'True').lower() == 'true'
+
+    # Triage automático de PQRs nuevas
+    TRIAGE_ENABLED = os.getenv('TRIAGE_ENABLED', 'True').lower() == 'true'
+    TRIAGE_BATCH_SIZE = int(os.getenv('TRIAGE_BATCH_SIZE', 20))
+    TRIAGE_WINDOW_SECONDS = int(os.getenv('TRIAGE_WINDOW_SECONDS', 10))
+    TRIAGE_AUTO_ASSIGN = os.getenv('TRIAGE_AUTO_ASSIGN', 'True').lower() == 'true'
+    TRIAGE_MODEL = os.getenv('TRIAGE_MODEL', 'gpt-3.5-turbo')
+
+    # Detección de clústeres de PQRs por lote/producto: ventana, línea base móvil y umbral del pico
+    CLUSTER_SCAN_ENABLED = os.getenv('CLUSTER_SCAN_ENABLED', 'True').lower() == 'true'
+    CLUSTER_SCAN_INTERVAL_SECONDS = int(os.getenv('CLUSTER_SCAN_INTERVAL_SECONDS', 300))
+    CLUSTER_BUCKET_HOURS = int(os.getenv('CLUSTER_BUCKET_HOURS', 24))
+    CLUSTER_BASELINE_BUCKETS = int(os.getenv('CLUSTER_BASELINE_BUCKETS', 28))
+    CLUSTER_Z_THRESHOLD = float(os.getenv('CLUSTER_Z_THRESHOLD', 3.0))
+    CLUSTER_MIN_COUNT = int(os.getenv('CLUSTER_MIN_COUNT', 3))
+
+    # Detección de PQRs casi duplicadas al crearlas (MinHash + LSH) y similitud mínima para vincularlas
+    DUPLICATE_DETECTION_ENABLED = os.getenv('DUPLICATE_DETECTION_ENABLED', 'True').lower() == 'true'
+    DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', 0.6))
+
+    # Recuperación de PQRs relevantes para el asistente (índice TF-IDF por worker, requiere NumPy)
+    RETRIEVAL_ENABLED = os.getenv('RETRIEVAL_ENABLED', 'True').lower() == 'true'
+    RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 4))
+    RETRIEVAL_SYNC_SECONDS = int(os.getenv('RETRIEVAL_SYNC_SECONDS', 60))
+
+    # Memoria de conversación del asistente: presupuesto de tokens del historial, expiración y sesiones por usuario
+    CHAT_MEMORY_ENABLED = os.getenv('CHAT_MEMORY_ENABLED', 'True').lower() == 'true'
+    CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', 1200))
+    CHAT_SESSION_TTL_SECONDS = int(os.getenv('CHAT_SESSION_TTL_SECONDS', 7200))
+    CHAT_MAX_SESSIONS_PER_USER = int(os.getenv('CHAT_MAX_SESSIONS_PER_USER', 5))
+    CHAT_SUMMARY_MODEL = os.getenv('CHAT_SUMMARY_MODEL', 'gpt-3.5-turbo')
+
+    # Logging estructurado
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE',
+                                            0.01 if os.getenv('PRODUCTION', 'False').lower() == 'true' else 1.0))
+
+    # Métricas: si se define, /metrics exige 'Authorization: Bearer <METRICS_TOKEN>'; en producción es obligatorio
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # Perfilador SQL (opt-in): muestreo por petición y umbral de petición lenta
+    PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'False').lower() == 'true'
+    PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', 0.1))
+    PROFILER_SLOW_MS = float(os.getenv('PROFILER_SLOW_MS', 500))
+
+    # Contraseñas: costo de bcrypt (los hashes con otro costo se rehacen al iniciar sesión),
+    # hilos de bcrypt por worker y logins simultáneos admitidos antes de responder 503
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    LOGIN_MAX_CONCURRENT = int(os.getenv('LOGIN_MAX_CONCURRENT', 8))
+    LOGIN_QUEUE_TIMEOUT = float(os.getenv('LOGIN_QUEUE_TIMEOUT', 5))
+
+    # Rate limiting: buckets en memoria por worker, o compartidos con RATELIMIT_STORAGE_URL=redis://...
+    # RATELIMIT_TRUSTED_PROXIES: proxies delante de la app que agregan X-Forwarded-For
+    RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'True').lower() == 'true'
+    RATELIMIT_STORAGE_URL = os.getenv('RATELIMIT_STORAGE_URL')
+    RATELIMIT_TRUSTED_PROXIES = int(os.getenv('RATELIMIT_TRUSTED_PROXIES',
+                                              1 if os.getenv('PRODUCTION', 'False').lower() == 'true' else 0))
+
+    # CRM: meta de ventas mensual para el avance del tablero
+    CRM_MONTHLY_TARGET = float(os.getenv('CRM_MONTHLY_TARGET', 75000000))
+
+    # Proveedor JSON: auto (orjson si está instalado), orjson o stdlib
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')
     DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     PORT = int(os.getenv('PORT', 5000))
     HOST = os.getenv('HOST', '0.0.0.0')
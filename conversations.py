@@ -0,0 +1,228 @@
+# conversations.py - Memoria de conversación del asistente: sesiones en BD, presupuesto de tokens y resumen progresivo
+import json
+import math
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from jobs import enqueue
+from logging_config import get_logger
+from metrics import observe_openai_call
+from models import db, ChatSession
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = get_logger('conversations')
+
+# Sin tiktoken: estimación conservadora para español (~3.5 caracteres por token)
+CHARS_PER_TOKEN = 3.5
+# Costo fijo de cada mensaje en el formato de chat (rol y separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+MAX_STORED_MESSAGE_CHARS = 2000
+# Los últimos mensajes (2 intercambios) nunca se resumen: el seguimiento inmediato conserva el texto literal
+KEEP_RECENT_MESSAGES = 4
+SUMMARY_MAX_TOKENS = 250
+FALLBACK_EXCERPT_CHARS = 120
+PURGE_INTERVAL_SECONDS = 3600
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and TIKTOKEN_AVAILABLE:
+        try:
+            _encoding = tiktoken.get_encoding('cl100k_base')
+        except Exception as e:
+            # El vocabulario se descarga la primera vez; sin red se usa la estimación
+            logger.warning('tiktoken no disponible, se estiman los tokens', extra={'error': str(e)})
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text):
+    """Tokens del mensaje con tiktoken si está instalado; si no, una estimación por caracteres"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text or '')) + MESSAGE_OVERHEAD_TOKENS
+    return math.ceil(len(text or '') / CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _decode_turns(data):
+    return json.loads(zlib.decompress(data)) if data else []
+
+
+def _encode_turns(turns):
+    return zlib.compress(json.dumps(turns, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _session_ttl():
+    return timedelta(seconds=current_app.config.get('CHAT_SESSION_TTL_SECONDS', 7200))
+
+
+def load_session(session_id, user_id):
+    """Sesión vigente del usuario; None si no existe, expiró o es de otro usuario"""
+    if not session_id or not current_app.config.get('CHAT_MEMORY_ENABLED', True):
+        return None
+    session = db.session.get(ChatSession, str(session_id))
+    if not session or session.user_id != user_id:
+        return None
+    if session.last_used_at and session.last_used_at < datetime.utcnow() - _session_ttl():
+        return None
+    return session
+
+
+def start_session(user_id):
+    """Nueva sesión del usuario desalojando las menos usadas recientemente sobre el máximo (el llamador hace commit)"""
+    if not current_app.config.get('CHAT_MEMORY_ENABLED', True):
+        return None
+    keep = max(current_app.config.get('CHAT_MAX_SESSIONS_PER_USER', 5) - 1, 0)
+    stale = [row[0] for row in db.session.query(ChatSession.id).filter(ChatSession.user_id == user_id)
+             .order_by(ChatSession.last_used_at.desc()).offset(keep)]
+    if stale:
+        ChatSession.query.filter(ChatSession.id.in_(stale)).delete(synchronize_session=False)
+    session = ChatSession(user_id=user_id)
+    db.session.add(session)
+    return session
+
+
+def history_messages(session):
+    """(resumen, mensajes) para el prompt: los turnos más recientes que caben en el presupuesto de tokens.
+
+    El resumen se descuenta primero; si los turnos guardados aún no se resumieron,
+    los más antiguos quedan fuera del prompt en lugar de excederlo.
+    """
+    if session is None:
+        return None, []
+    budget = current_app.config.get('CHAT_HISTORY_TOKEN_BUDGET', 1200)
+    if session.summary:
+        budget -= count_tokens(session.summary)
+    messages = []
+    for role, content, tokens in reversed(_decode_turns(session.turns)):
+        if tokens > budget:
+            break
+        budget -= tokens
+        messages.append({'role': role, 'content': content})
+    messages.reverse()
+    return session.summary, messages
+
+
+def last_user_message(session):
+    for role, content, _ in reversed(_decode_turns(session.turns) if session else []):
+        if role == 'user':
+            return content
+    return None
+
+
+def record_exchange(session, user_message, reply):
+    """Agregar pregunta y respuesta a la sesión y encolar el resumen si el historial excede el presupuesto"""
+    if session is None:
+        return
+    turns = _decode_turns(session.turns)
+    for role, content in (('user', user_message), ('assistant', reply)):
+        content = content[:MAX_STORED_MESSAGE_CHARS]
+        turns.append([role, content, count_tokens(content)])
+    session.turns = _encode_turns(turns)
+    session.token_count = sum(turn[2] for turn in turns) + (count_tokens(session.summary) if session.summary else 0)
+    session.version = (session.version or 0) + 1
+    session.last_used_at = datetime.utcnow()
+    if session.token_count > current_app.config.get('CHAT_HISTORY_TOKEN_BUDGET', 1200) \
+            and len(turns) > KEEP_RECENT_MESSAGES:
+        enqueue('chat.summarize', {'session_id': session.id},
+                idempotency_key=f'chat.summarize:{session.id}:{session.version}')
+
+
+def _summarize_with_model(previous_summary, turns):
+    client = current_app.config.get('OPENAI_CLIENT')
+    if not client:
+        return None
+    transcript = '\n'.join(f"{'Usuario' if role == 'user' else 'Asistente'}: {content}" for role, content, _ in turns)
+    started = time.perf_counter()
+    try:
+        response = client.chat.completions.create(
+            model=current_app.config.get('CHAT_SUMMARY_MODEL', 'gpt-3.5-turbo'),
+            messages=[
+                {"role": "system", "content": (
+                    "Resume la conversación entre un usuario y el asistente de PQRs de Alimentos Enriko en "
+                    "español, en máximo 120 palabras. Conserva tickets, productos, lotes, fechas y decisiones; "
+                    "omite saludos.")},
+                {"role": "user", "content": f"Resumen previo: {previous_summary or '(ninguno)'}\n\n{transcript}"}
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0.2
+        )
+    except Exception as e:
+        observe_openai_call('chat_summary', time.perf_counter() - started, error=e)
+        logger.warning('No se pudo resumir la conversación con el modelo', extra={'error': str(e)})
+        return None
+    observe_openai_call('chat_summary', time.perf_counter() - started, response=response)
+    return response.choices[0].message.content.strip()
+
+
+def _summarize_extractive(previous_summary, turns):
+    """Resumen sin modelo: extracto de cada turno, conservando lo más reciente si no cabe"""
+    parts = [previous_summary] if previous_summary else []
+    for role, content, _ in turns:
+        excerpt = ' '.join(content.split())[:FALLBACK_EXCERPT_CHARS]
+        parts.append(f"{'Usuario' if role == 'user' else 'Asistente'}: {excerpt}")
+    summary = ' | '.join(parts)
+    max_chars = int(SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN)
+    return summary if len(summary) <= max_chars else '…' + summary[-max_chars:]
+
+
+def summarize_session(session_id):
+    """Plegar los turnos antiguos en el resumen; True si se aplicó"""
+    session = db.session.get(ChatSession, session_id)
+    if not session:
+        return False
+    turns = _decode_turns(session.turns)
+    folded = turns[:-KEEP_RECENT_MESSAGES]
+    if not folded:
+        return False
+    previous_summary = session.summary
+    # La transacción no queda abierta mientras responde el modelo
+    db.session.commit()
+
+    summary = _summarize_with_model(previous_summary, folded) or _summarize_extractive(previous_summary, folded)
+
+    # Releer: pudieron llegar turnos nuevos (solo se agregan al final) mientras se generaba el resumen
+    db.session.expire_all()
+    session = db.session.get(ChatSession, session_id)
+    if not session or session.summary != previous_summary:
+        return False
+    current = _decode_turns(session.turns)
+    if current[:len(folded)] != folded:
+        return False
+    remaining = current[len(folded):]
+    updated = db.session.execute(
+        db.update(ChatSession)
+        .where(ChatSession.id == session_id, ChatSession.version == session.version)
+        .values(summary=summary, turns=_encode_turns(remaining), version=session.version + 1,
+                token_count=sum(turn[2] for turn in remaining) + count_tokens(summary))
+    ).rowcount
+    db.session.commit()
+    if updated:
+        logger.info('Conversación resumida', extra={
+            'session_id': session_id, 'folded_messages': len(folded), 'summary_tokens': count_tokens(summary)
+        })
+    return bool(updated)
+
+
+def schedule_session_purge():
+    """Encolar la limpieza de la próxima hora; la tarea se vuelve a programar al terminar (el llamador hace commit)"""
+    next_hour = int(time.time() // PURGE_INTERVAL_SECONDS) + 1
+    return enqueue('chat.purge_sessions', idempotency_key=f'chat.purge_sessions:{next_hour}',
+                   delay_seconds=max(next_hour * PURGE_INTERVAL_SECONDS - time.time(), 0))
+
+
+def purge_expired_sessions():
+    cutoff = datetime.utcnow() - _session_ttl()
+    deleted = ChatSession.query.filter(ChatSession.last_used_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
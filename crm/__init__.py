@@ -6,6 +6,10 @@ Proporciona funcionalidades completas de gestión de clientes,
 productos, ventas y actividades comerciales.
 """
 
+from logging_config import get_logger
+
+logger = get_logger('crm')
+
 # Importar todos los modelos CRM desde models.py principal
 # ya que ahora están integrados en un solo archivo
 try:
@@ -18,7 +22,7 @@ try:
     CRM_MODELS_AVAILABLE = True
     
 except ImportError as e:
-    print(f"⚠️ Error importando modelos CRM: {e}")
+    logger.warning("Error importando modelos CRM", extra={'error': str(e)})
     CRM_MODELS_AVAILABLE = False
     
     # Definir clases vacías como fallback
@@ -92,9 +96,9 @@ def verify_crm_setup():
 
 # Ejecutar verificación al importar
 if CRM_MODELS_AVAILABLE:
-    print("✅ Módulo CRM cargado correctamente")
+    logger.debug("Módulo CRM cargado correctamente")
     verification = verify_crm_setup()
     if verification['status'] == 'error':
-        print(f"⚠️ Problemas en CRM: {verification['issues']}")
+        logger.warning("Problemas en CRM", extra={'issues': verification['issues']})
 else:
-    print("❌ Módulo CRM con errores - funcionalidad limitada")
\ No newline at end of file
+    logger.error("Módulo CRM con errores - funcionalidad limitada")
\ No newline at end of file
@@ -1,13 +1,56 @@
 # crm/crm_routes.py - Rutas del CRM
-from flask import jsonify, request
+from datetime import date, datetime
+from flask import Response, jsonify, request, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User
+from models import db, User, Customer, Lot, Product, Sale, SaleItem
+from routes import require_admin, require_non_client
+from jobs import enqueue, start_backfill
+from logging_config import get_logger
+from crm.rollups import SALE_STATUSES, dashboard_figures
+from crm.customers import CUSTOMERS_MAX_PAGE_SIZE, CUSTOMERS_PAGE_SIZE, customer_aggregates, customer_page
+from crm.overview import customer_overview
+from crm.lots import RECALL_MAX_LOTS, export_rows, matching_lots_query, recall_impact, resolve_lot_id
+
+logger = get_logger('crm')
+
+
+def _sale_item_lot_id(item):
+    """Lote de un ítem de venta: id del registro o código + producto (se registra si es nuevo)"""
+    if item.get('lot_id'):
+        return int(item['lot_id'])
+    if not item.get('lot_code'):
+        return None
+    product = db.session.get(Product, item['product_id']) if item.get('product_id') else None
+    product_name = product.name if product else item.get('product_name')
+    if not product_name:
+        raise ValueError('El lote requiere product_id o product_name')
+    return resolve_lot_id(product_name, item['lot_code'], product_id=product.id if product else None)
+
+
+def _recall_lots():
+    """Lotes del retiro según los filtros de la petición; ValueError si faltan filtros o son demasiados"""
+    lot_code = request.args.get('lot_code', '').strip()
+    product = request.args.get('product', '').strip()
+    expiration_from = request.args.get('expiration_from')
+    expiration_to = request.args.get('expiration_to')
+    if not (lot_code or product or expiration_from or expiration_to):
+        raise ValueError('Indique lot_code, product o un rango de vencimiento (expiration_from/expiration_to)')
+    lots = matching_lots_query(
+        lot_code=lot_code or None,
+        product=product or None,
+        expiration_from=date.fromisoformat(expiration_from) if expiration_from else None,
+        expiration_to=date.fromisoformat(expiration_to) if expiration_to else None
+    ).limit(RECALL_MAX_LOTS + 1).all()
+    if len(lots) > RECALL_MAX_LOTS:
+        raise ValueError(f'La consulta abarca más de {RECALL_MAX_LOTS} lotes; acote los filtros')
+    return lots
 
 def register_crm_routes(app):
     """Registrar todas las rutas del CRM"""
     
     @app.route('/api/crm/dashboard')
     @jwt_required()
+    @require_non_client
     def crm_dashboard():
         """Dashboard principal del CRM"""
         try:
@@ -17,22 +60,90 @@ def register_crm_routes(app):
             if not current_user:
                 return jsonify({'error': 'Usuario no encontrado'}), 404
             
-            dashboard_data = {
-                'total_customers': 45,
-                'active_opportunities': 12,
-                'total_sales_ytd': 850000000,
-                'pipeline_value': 120000000,
+            # Cifras desde los agregados diarios/mensuales, no desde un recorrido de `sale`
+            dashboard_data = dashboard_figures(current_app.config['CRM_MONTHLY_TARGET'])
+            dashboard_data.update({
                 'user_role': current_user.role,
-                'user_name': current_user.name,
-                'monthly_target': 75000000,
-                'monthly_progress': 68
-            }
+                'user_name': current_user.name
+            })
             
             return jsonify(dashboard_data), 200
             
         except Exception as e:
+            logger.exception('Error en dashboard CRM')
             return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/crm/sales', methods=['POST'])
+    @jwt_required()
+    @require_non_client
+    def create_sale():
+        """Registrar una venta u oportunidad; los agregados se actualizan en la misma transacción"""
+        data = request.get_json() or {}
+        status = data.get('status', 'cerrada')
+        if status not in SALE_STATUSES:
+            return jsonify({'error': f'Estado inválido. Use: {", ".join(SALE_STATUSES)}'}), 400
+        if not data.get('customer_id') or not db.session.get(Customer, data['customer_id']):
+            return jsonify({'error': 'Cliente no encontrado'}), 404
+
+        items = data.get('items') or []
+        try:
+            sale_items = [SaleItem(product_id=item.get('product_id'), lot_id=_sale_item_lot_id(item),
+                                   quantity=int(item.get('quantity', 1)),
+                                   unit_price=float(item.get('unit_price', 0))) for item in items]
+            total_amount = float(data['total_amount']) if data.get('total_amount') is not None else \
+                sum(item.quantity * item.unit_price for item in sale_items)
+            sale_date = datetime.fromisoformat(data['sale_date']) if data.get('sale_date') else datetime.utcnow()
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Valores numéricos o fecha inválidos'}), 400
+
+        sale = Sale(customer_id=data['customer_id'], total_amount=total_amount, status=status,
+                    sale_date=sale_date, items=sale_items)
+        db.session.add(sale)
+        db.session.commit()
+        return jsonify(sale.to_dict()), 201
+
+    @app.route('/api/crm/sales/<int:sale_id>', methods=['PUT'])
+    @jwt_required()
+    @require_non_client
+    def update_sale(sale_id):
+        """Cambiar estado o monto de una venta (p. ej. cotizada -> cerrada)"""
+        sale = db.session.get(Sale, sale_id)
+        if not sale:
+            return jsonify({'error': 'Venta no encontrada'}), 404
+        data = request.get_json() or {}
+        if 'status' in data:
+            if data['status'] not in SALE_STATUSES:
+                return jsonify({'error': f'Estado inválido. Use: {", ".join(SALE_STATUSES)}'}), 400
+            sale.status = data['status']
+        try:
+            if 'total_amount' in data:
+                sale.total_amount = float(data['total_amount'])
+            if 'sale_date' in data:
+                sale.sale_date = datetime.fromisoformat(data['sale_date'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Valores numéricos o fecha inválidos'}), 400
+        db.session.commit()
+        return jsonify(sale.to_dict()), 200
+
+    @app.route('/api/crm/rollups/rebuild', methods=['POST'])
+    @jwt_required()
+    @require_admin
+    def rebuild_sales_rollups():
+        """Recalcular los agregados de ventas en segundo plano (carga inicial o reparación)"""
+        job = enqueue('crm.rebuild_rollups', idempotency_key=f'crm.rebuild_rollups:{datetime.utcnow():%Y%m%d%H%M}')
+        db.session.commit()
+        return jsonify({'message': 'Recalculo de agregados encolado', 'job_id': job.id}), 202
     
+    @app.route('/api/crm/pqr-links/backfill', methods=['POST'])
+    @jwt_required()
+    @require_admin
+    def backfill_pqr_links():
+        """Asociar en segundo plano las PQRs sin cliente CRM (p. ej. tras importar clientes)"""
+        job = start_backfill('crm.backfill_pqr_customers',
+                             f'crm.backfill_pqr_customers:manual:{datetime.utcnow():%Y%m%d%H%M}')
+        db.session.commit()
+        return jsonify({'message': 'Asociación de PQRs encolada', 'job_id': job.id}), 202
+
     @app.route('/api/crm/test')
     @jwt_required()
     def crm_test():
@@ -47,39 +158,105 @@ def register_crm_routes(app):
     
     @app.route('/api/crm/customers')
     @jwt_required()
+    @require_non_client
     def get_customers():
-        """Obtener lista de clientes (simulada)"""
+        """Directorio de clientes con búsqueda, filtro por comercial y paginación por cursor"""
         try:
-            customers_demo = [
-                {
-                    'id': 1,
-                    'customer_code': 'KFC001',
-                    'company_name': 'KFC Colombia S.A.S.',
-                    'contact_name': 'Juan Pérez',
-                    'email': 'juan.perez@kfc.com.co',
-                    'phone': '+57 300 123 4567',
-                    'city': 'Bogotá',
-                    'segment': 'Premium',
-                    'status': 'Activo',
-                    'total_sales_ytd': 45000000,
-                    'satisfaction_score': 8.5
-                },
-                {
-                    'id': 2,
-                    'customer_code': 'PIZ001',
-                    'company_name': 'Pizzamania S.A.',
-                    'contact_name': 'Ana López',
-                    'email': 'ana.lopez@pizzamania.com',
-                    'phone': '+57 301 987 6543',
-                    'city': 'Cali',
-                    'segment': 'Standard',
-                    'status': 'Activo',
-                    'total_sales_ytd': 28000000,
-                    'satisfaction_score': 9.1
-                }
-            ]
-            
-            return jsonify(customers_demo), 200
-            
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
\ No newline at end of file
+            limit = min(int(request.args.get('limit', CUSTOMERS_PAGE_SIZE)), CUSTOMERS_MAX_PAGE_SIZE)
+            sales_rep_id = request.args.get('sales_rep_id', type=int)
+            customers, next_cursor = customer_page(
+                search=request.args.get('search', '').strip() or None,
+                sales_rep_id=sales_rep_id,
+                after=request.args.get('after') or None,
+                limit=max(limit, 1)
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        aggregates = customer_aggregates([customer.id for customer in customers])
+        items = []
+        for customer in customers:
+            item = customer.to_dict()
+            item.update(aggregates[customer.id])
+            items.append(item)
+
+        return jsonify({
+            'customers': items,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }), 200
+
+    @app.route('/api/crm/customers/<int:customer_id>/overview')
+    @jwt_required()
+    @require_non_client
+    def get_customer_overview(customer_id):
+        """Vista 360 del cliente: PQRs, ventas, contactos y actividades recientes"""
+        overview, cached = customer_overview(customer_id)
+        if overview is None:
+            return jsonify({'error': 'Cliente no encontrado'}), 404
+        response = jsonify(overview)
+        response.headers['X-Cache'] = 'HIT' if cached else 'MISS'
+        return response, 200
+
+    @app.route('/api/crm/lots', methods=['POST'])
+    @jwt_required()
+    @require_non_client
+    def register_lot():
+        """Registrar un lote producido (o completar sus fechas si ya existe)"""
+        data = request.get_json() or {}
+        if not data.get('product_name') or not data.get('lot_code'):
+            return jsonify({'error': 'product_name y lot_code son obligatorios'}), 400
+        try:
+            production_date = date.fromisoformat(data['production_date']) if data.get('production_date') else None
+            expiration_date = date.fromisoformat(data['expiration_date']) if data.get('expiration_date') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Fechas inválidas (use AAAA-MM-DD)'}), 400
+
+        lot = db.session.get(Lot, resolve_lot_id(data['product_name'], data['lot_code'],
+                                                 product_id=data.get('product_id')))
+        if lot is None:
+            return jsonify({'error': 'Código de lote inválido'}), 400
+        if production_date:
+            lot.production_date = production_date
+        if expiration_date:
+            lot.expiration_date = expiration_date
+        if data.get('product_id'):
+            lot.product_id = data['product_id']
+        db.session.commit()
+        return jsonify(lot.to_dict()), 201
+
+    @app.route('/api/crm/lots/recall')
+    @jwt_required()
+    @require_non_client
+    def lot_recall_impact():
+        """Impacto de un retiro: tickets, clientes y cantidades de los lotes filtrados"""
+        try:
+            lots = _recall_lots()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(recall_impact(lots)), 200
+
+    @app.route('/api/crm/lots/recall/export')
+    @jwt_required()
+    @require_non_client
+    def export_lot_recall():
+        """Exportación CSV del retiro para entes de control, generada por partes"""
+        try:
+            lots = _recall_lots()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        filename = f'retiro_{datetime.utcnow():%Y%m%d%H%M%S}.csv'
+        return Response(stream_with_context(export_rows(lots)), mimetype='text/csv', headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'X-Accel-Buffering': 'no'
+        })
+
+    @app.route('/api/crm/lots/backfill', methods=['POST'])
+    @jwt_required()
+    @require_admin
+    def backfill_pqr_lots():
+        """Vincular al registro de lotes las PQRs existentes (en segundo plano)"""
+        job = start_backfill('lots.backfill_pqr_lots',
+                             f'lots.backfill_pqr_lots:manual:{datetime.utcnow():%Y%m%d%H%M}')
+        db.session.commit()
+        return jsonify({'message': 'Vinculación de lotes programada', 'job_id': job.id}), 202
@@ -0,0 +1,109 @@
+# crm/customers.py - Directorio de clientes: paginación por llave, búsqueda y agregados en consultas agrupadas
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import text
+
+from logging_config import get_logger
+from models import db, normalize_text, Customer, CustomerContact, PQR, Sale
+
+logger = get_logger('crm.customers')
+
+CUSTOMERS_PAGE_SIZE = 50
+CUSTOMERS_MAX_PAGE_SIZE = 200
+# Desde esta longitud la búsqueda también encuentra coincidencias internas (índice trigram en PostgreSQL)
+CONTAINS_MIN_LENGTH = 3
+OPEN_PQR_STATUSES = ['abierto', 'en_proceso']
+
+
+def encode_cursor(name_normalized, customer_id):
+    raw = json.dumps([name_normalized, customer_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(nombre normalizado, id) del último cliente de la página anterior; ValueError si es inválido"""
+    try:
+        name_normalized, customer_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(name_normalized), int(customer_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def customer_page(search=None, sales_rep_id=None, after=None, limit=CUSTOMERS_PAGE_SIZE):
+    """Una página del directorio ordenada por (nombre normalizado, id); retorna (clientes, siguiente cursor)"""
+    query = Customer.query
+    if sales_rep_id is not None:
+        query = query.filter(Customer.sales_rep_id == sales_rep_id)
+
+    if search:
+        term = escape_like(normalize_text(search))
+        email_term = escape_like(search.strip().lower())
+        conditions = [
+            Customer.name_normalized.like(f'{term}%', escape='\\'),
+            Customer.email.like(f'{email_term}%', escape='\\')
+        ]
+        if len(term) >= CONTAINS_MIN_LENGTH:
+            conditions.append(Customer.name_normalized.like(f'%{term}%', escape='\\'))
+        query = query.filter(db.or_(*conditions))
+
+    if after:
+        name_normalized, customer_id = decode_cursor(after)
+        query = query.filter(db.tuple_(Customer.name_normalized, Customer.id) > (name_normalized, customer_id))
+
+    rows = query.order_by(Customer.name_normalized, Customer.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].name_normalized, rows[-1].id) if has_more else None
+    return rows, next_cursor
+
+
+def customer_aggregates(customer_ids):
+    """Ventas del año, PQRs abiertas y contactos por cliente: una consulta agrupada por métrica"""
+    if not customer_ids:
+        return {}
+    year_start = datetime(datetime.utcnow().year, 1, 1)
+
+    sales = dict(db.session.query(Sale.customer_id, db.func.sum(Sale.total_amount))
+                 .filter(Sale.customer_id.in_(customer_ids), Sale.status == 'cerrada', Sale.sale_date >= year_start)
+                 .group_by(Sale.customer_id).all())
+    contacts = dict(db.session.query(CustomerContact.customer_id, db.func.count(CustomerContact.id))
+                    .filter(CustomerContact.customer_id.in_(customer_ids))
+                    .group_by(CustomerContact.customer_id).all())
+
+    open_pqrs = dict(db.session.query(PQR.customer_id, db.func.count(PQR.id))
+                     .filter(PQR.customer_id.in_(customer_ids), PQR.status.in_(OPEN_PQR_STATUSES))
+                     .group_by(PQR.customer_id).all())
+
+    return {
+        customer_id: {
+            'total_sales_ytd': float(sales.get(customer_id) or 0),
+            'open_pqrs_count': open_pqrs.get(customer_id, 0),
+            'contacts_count': contacts.get(customer_id, 0)
+        }
+        for customer_id in customer_ids
+    }
+
+
+def ensure_search_indexes(engine):
+    """Índice trigram para búsquedas internas en PostgreSQL (requiere la extensión pg_trgm)"""
+    if engine.dialect.name != 'postgresql':
+        return False
+    with engine.begin() as conn:
+        # Reemplazado por ix_customer_name_id (paginación) e ix_customer_name_prefix (prefijo)
+        conn.execute(text('DROP INDEX IF EXISTS ix_customer_name_normalized_id'))
+    try:
+        with engine.begin() as conn:
+            conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_customer_name_trgm '
+                              'ON customer USING gin (name_normalized gin_trgm_ops)'))
+        return True
+    except Exception as e:
+        # Sin permisos para la extensión la búsqueda sigue funcionando, solo sin el índice
+        logger.warning('No se pudo crear el índice trigram de clientes', extra={'error': str(e)})
+        return False
@@ -0,0 +1,108 @@
+# crm/linking.py - Asociar PQRs a clientes CRM por email y nombre normalizados (caché y backfill por lotes)
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from jobs import BACKFILL_BATCH_SIZE, BACKFILL_MAX_BATCHES_PER_JOB, backfill_by_id
+from logging_config import get_logger
+from models import db, normalize_text, Customer, PQR
+
+logger = get_logger('crm.linking')
+
+LOOKUP_CACHE_SECONDS = 600
+# Un "no encontrado" se recuerda poco: el cliente puede crearse en el CRM en cualquier momento
+LOOKUP_MISS_CACHE_SECONDS = 60
+LOOKUP_CACHE_MAX = 5000
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _lookup(email, name):
+    """Email exacto primero; si no, nombre normalizado solo cuando identifica a un único cliente"""
+    if email:
+        customer_id = db.session.query(Customer.id).filter(Customer.email == email).scalar()
+        if customer_id:
+            return customer_id
+    if name:
+        matches = db.session.query(Customer.id).filter(Customer.name_normalized == name).limit(2).all()
+        if len(matches) == 1:
+            return matches[0][0]
+    return None
+
+
+def resolve_customer_id(client_email, client_name):
+    """Cliente CRM de una PQR nueva, con caché por proceso (dos lecturas indexadas en caso de fallo)"""
+    email = (client_email or '').strip().lower()
+    name = normalize_text(client_name)
+    if not email and not name:
+        return None
+
+    key = (email, name)
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(key)
+    if cached and now < cached[1]:
+        return cached[0]
+
+    customer_id = _lookup(email, name)
+    ttl = LOOKUP_CACHE_SECONDS if customer_id else LOOKUP_MISS_CACHE_SECONDS
+    with _lock:
+        if len(_cache) >= LOOKUP_CACHE_MAX:
+            _cache.clear()
+        _cache[key] = (customer_id, now + ttl)
+    return customer_id
+
+
+def clear_lookup_cache():
+    with _lock:
+        _cache.clear()
+
+
+@event.listens_for(Session, 'after_flush')
+def _on_customer_change(session, flush_context):
+    # Clientes nuevos, renombrados o borrados invalidan las resoluciones cacheadas de este proceso
+    for collection in (session.new, session.dirty, session.deleted):
+        if any(isinstance(obj, Customer) for obj in collection):
+            clear_lookup_cache()
+            return
+
+
+def _lookup_maps():
+    """Email -> id y nombre normalizado -> id (solo nombres que no se repiten) para el backfill"""
+    by_email = {}
+    by_name = {}
+    repeated = set()
+    for customer_id, email, name in db.session.query(Customer.id, Customer.email, Customer.name_normalized):
+        by_email[email] = customer_id
+        if name in by_name:
+            repeated.add(name)
+        by_name[name] = customer_id
+    for name in repeated:
+        del by_name[name]
+    return by_email, by_name
+
+
+def backfill_pqr_customers(after=None, batch_size=BACKFILL_BATCH_SIZE, max_batches=BACKFILL_MAX_BATCHES_PER_JOB):
+    """Resolver PQRs sin cliente recorriéndolas por id en lotes; retorna (actualizadas, id para continuar o None)"""
+    by_email, by_name = _lookup_maps()
+    if not by_email:
+        return 0, None
+
+    def apply_batch(rows):
+        changes = []
+        for pqr_id, client_email, client_name in rows:
+            email = (client_email or '').strip().lower()
+            customer_id = by_email.get(email) if email else None
+            if customer_id is None:
+                customer_id = by_name.get(normalize_text(client_name))
+            if customer_id:
+                changes.append({'id': pqr_id, 'customer_id': customer_id})
+        if changes:
+            db.session.execute(db.update(PQR), changes)
+        return len(changes)
+
+    query = db.session.query(PQR.id, PQR.client_email, PQR.client_name).filter(PQR.customer_id.is_(None))
+    return backfill_by_id(query, apply_batch, 'Backfill de clientes en PQRs', after, batch_size, max_batches)
@@ -0,0 +1,243 @@
+# crm/lots.py - Registro de lotes y trazabilidad: PQRs, ventas y clientes afectados por un retiro
+import csv
+import io
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from jobs import BACKFILL_BATCH_SIZE, BACKFILL_MAX_BATCHES_PER_JOB, backfill_by_id
+from logging_config import get_logger
+from models import db, normalize_lot_code, normalize_text, Customer, Lot, PQR, Sale, SaleItem
+
+logger = get_logger('crm.lots')
+
+LOT_CACHE_MAX = 5000
+RECALL_MAX_LOTS = 500
+RECALL_MAX_TICKETS = 1000
+EXPORT_YIELD_PER = 500
+EXPORT_COLUMNS = ['registro', 'lote', 'producto', 'vencimiento', 'referencia', 'fecha', 'estado',
+                  'cliente_id', 'cliente', 'email', 'cantidad', 'unidad']
+
+_lock = threading.Lock()
+# (producto normalizado, lote normalizado) -> id; un lote registrado no cambia de llave
+_cache = {}
+
+
+def lot_key(product_name, lot_code):
+    return normalize_text(product_name), normalize_lot_code(lot_code)
+
+
+def resolve_lot_id(product_name, lot_code, expiration_date=None, product_id=None):
+    """Id del lote en el registro, creándolo si es la primera vez que aparece (PQR o venta)"""
+    key = lot_key(product_name, lot_code)
+    if not all(key):
+        return None
+    with _lock:
+        lot_id = _cache.get(key)
+    if lot_id:
+        return lot_id
+
+    lot = Lot.query.filter_by(product_key=key[0], lot_code=key[1]).first()
+    if not lot:
+        try:
+            # Savepoint: si otro worker registró el mismo lote a la vez, se reutiliza el suyo
+            with db.session.begin_nested():
+                lot = Lot(product_name=product_name.strip(), lot_code=lot_code,
+                          expiration_date=expiration_date, product_id=product_id)
+                db.session.add(lot)
+            # Aún sin confirmar: no se cachea por si la transacción termina en rollback
+            return lot.id
+        except IntegrityError:
+            lot = Lot.query.filter_by(product_key=key[0], lot_code=key[1]).first()
+    if lot.expiration_date is None and expiration_date:
+        lot.expiration_date = expiration_date
+
+    with _lock:
+        if len(_cache) >= LOT_CACHE_MAX:
+            _cache.clear()
+        _cache[key] = lot.id
+    return lot.id
+
+
+def clear_lot_cache():
+    with _lock:
+        _cache.clear()
+
+
+def _ensure_lots(keys):
+    """Ids de lotes para un conjunto de llaves: una lectura y una inserción masiva de los faltantes"""
+    product_keys = {product_key for product_key, _ in keys}
+    lot_codes = {lot_code for _, lot_code in keys}
+    existing = {
+        (product_key, lot_code): lot_id
+        for lot_id, product_key, lot_code in db.session.query(Lot.id, Lot.product_key, Lot.lot_code)
+        .filter(Lot.product_key.in_(product_keys), Lot.lot_code.in_(lot_codes))
+    }
+    missing = [key for key in keys if key not in existing]
+    if missing:
+        db.session.execute(db.insert(Lot), [
+            {'product_key': key[0], 'lot_code': key[1], 'product_name': keys[key][0],
+             'expiration_date': keys[key][1]}
+            for key in missing
+        ])
+        for lot_id, product_key, lot_code in db.session.query(Lot.id, Lot.product_key, Lot.lot_code)\
+                .filter(Lot.product_key.in_({key[0] for key in missing}), Lot.lot_code.in_({key[1] for key in missing})):
+            existing[(product_key, lot_code)] = lot_id
+    return existing
+
+
+def backfill_pqr_lots(after=None, batch_size=BACKFILL_BATCH_SIZE, max_batches=BACKFILL_MAX_BATCHES_PER_JOB):
+    """Vincular PQRs sin lote al registro recorriéndolas por id; retorna (actualizadas, id para continuar o None)"""
+    def apply_batch(rows):
+        # Llave -> (nombre de producto a registrar, vencimiento) de la primera PQR que lo menciona
+        keys = {}
+        for _, product_name, batch_number, expiration_date in rows:
+            key = lot_key(product_name, batch_number)
+            if all(key) and (key not in keys or keys[key][1] is None):
+                keys[key] = ((product_name or '').strip(), expiration_date)
+        lot_ids = _ensure_lots(keys) if keys else {}
+
+        changes = []
+        for pqr_id, product_name, batch_number, _ in rows:
+            lot_id = lot_ids.get(lot_key(product_name, batch_number))
+            if lot_id:
+                changes.append({'id': pqr_id, 'lot_id': lot_id})
+        if changes:
+            db.session.execute(db.update(PQR), changes)
+        return len(changes)
+
+    query = db.session.query(PQR.id, PQR.product_name, PQR.batch_number, PQR.expiration_date)\
+        .filter(PQR.lot_id.is_(None))
+    return backfill_by_id(query, apply_batch, 'Backfill de lotes en PQRs', after, batch_size, max_batches)
+
+
+def matching_lots_query(lot_code=None, product=None, expiration_from=None, expiration_to=None):
+    """Lotes del retiro: código exacto (normalizado), producto y/o rango de vencimiento"""
+    query = Lot.query
+    if lot_code:
+        query = query.filter(Lot.lot_code == normalize_lot_code(lot_code))
+    if product:
+        query = query.filter(Lot.product_key == normalize_text(product))
+    if expiration_from:
+        query = query.filter(Lot.expiration_date >= expiration_from)
+    if expiration_to:
+        query = query.filter(Lot.expiration_date <= expiration_to)
+    return query.order_by(Lot.id)
+
+
+def _pqr_rows_query(lot_ids):
+    return db.session.query(
+        PQR.lot_id, PQR.ticket_id, PQR.type, PQR.status, PQR.created_at, PQR.customer_id,
+        PQR.client_name, PQR.client_email, PQR.quantity_grams
+    ).filter(PQR.lot_id.in_(lot_ids)).order_by(PQR.lot_id, PQR.created_at)
+
+
+def _sale_rows_query(lot_ids):
+    return db.session.query(
+        SaleItem.lot_id, Sale.id, Sale.sale_date, Sale.status, Sale.customer_id,
+        Customer.name, Customer.email, SaleItem.quantity
+    ).join(Sale, SaleItem.sale_id == Sale.id).join(Customer, Sale.customer_id == Customer.id)\
+        .filter(SaleItem.lot_id.in_(lot_ids), Sale.status == 'cerrada')\
+        .order_by(SaleItem.lot_id, Sale.sale_date)
+
+
+def recall_impact(lots):
+    """Tickets, clientes y cantidades afectadas por los lotes: consultas indexadas por lot_id"""
+    lot_ids = [lot.id for lot in lots]
+    if not lot_ids:
+        return {'lots': [], 'tickets': [], 'customers': [], 'tickets_truncated': False,
+                'totals': {'lots': 0, 'tickets': 0, 'customers': 0, 'quantity_grams': 0, 'units_sold': 0}}
+
+    pqr_stats = {
+        lot_id: (count, int(grams or 0))
+        for lot_id, count, grams in db.session.query(
+            PQR.lot_id, db.func.count(PQR.id), db.func.sum(PQR.quantity_grams)
+        ).filter(PQR.lot_id.in_(lot_ids)).group_by(PQR.lot_id)
+    }
+    tickets = _pqr_rows_query(lot_ids).limit(RECALL_MAX_TICKETS + 1).all()
+
+    # Clientes: quienes reclamaron (PQR vinculada) y quienes compraron el lote (ventas cerradas)
+    customers = {}
+    for customer_id, count in db.session.query(PQR.customer_id, db.func.count(PQR.id))\
+            .filter(PQR.lot_id.in_(lot_ids), PQR.customer_id.isnot(None)).group_by(PQR.customer_id):
+        customers[customer_id] = {'customer_id': customer_id, 'pqr_count': count, 'units_sold': 0}
+    sold_by_lot = {}
+    for customer_id, lot_id, units in db.session.query(Sale.customer_id, SaleItem.lot_id, db.func.sum(SaleItem.quantity))\
+            .join(Sale, SaleItem.sale_id == Sale.id)\
+            .filter(SaleItem.lot_id.in_(lot_ids), Sale.status == 'cerrada')\
+            .group_by(Sale.customer_id, SaleItem.lot_id):
+        entry = customers.setdefault(customer_id, {'customer_id': customer_id, 'pqr_count': 0, 'units_sold': 0})
+        entry['units_sold'] += int(units or 0)
+        sold_by_lot[lot_id] = sold_by_lot.get(lot_id, 0) + int(units or 0)
+    if customers:
+        for customer_id, name, email in db.session.query(Customer.id, Customer.name, Customer.email)\
+                .filter(Customer.id.in_(list(customers))):
+            customers[customer_id].update({'name': name, 'email': email})
+
+    lots_data = []
+    for lot in lots:
+        item = lot.to_dict()
+        count, grams = pqr_stats.get(lot.id, (0, 0))
+        item.update({'pqr_count': count, 'quantity_grams': grams, 'units_sold': sold_by_lot.get(lot.id, 0)})
+        lots_data.append(item)
+
+    codes = {lot.id: lot.lot_code for lot in lots}
+    return {
+        'lots': lots_data,
+        'tickets': [{
+            'lot_id': lot_id, 'lot_code': codes[lot_id], 'ticket_id': ticket_id, 'type': pqr_type,
+            'status': status, 'created_at': created_at.isoformat() if created_at else None,
+            'customer_id': customer_id, 'client_name': client_name, 'client_email': client_email,
+            'quantity_grams': quantity_grams
+        } for lot_id, ticket_id, pqr_type, status, created_at, customer_id, client_name, client_email, quantity_grams
+            in tickets[:RECALL_MAX_TICKETS]],
+        'tickets_truncated': len(tickets) > RECALL_MAX_TICKETS,
+        'customers': sorted(customers.values(), key=lambda entry: (-entry['units_sold'], -entry['pqr_count'])),
+        'totals': {
+            'lots': len(lot_ids),
+            'tickets': sum(count for count, _ in pqr_stats.values()),
+            'customers': len(customers),
+            'quantity_grams': sum(grams for _, grams in pqr_stats.values()),
+            'units_sold': sum(sold_by_lot.values())
+        }
+    }
+
+
+def export_rows(lots):
+    """CSV del retiro por partes: cada PQR y cada venta cerrada de los lotes, leídas por bloques"""
+    lots_by_id = {lot.id: lot for lot in lots}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    writer.writerow(EXPORT_COLUMNS)
+    yield flush()
+    if not lots_by_id:
+        return
+
+    def lot_columns(lot_id):
+        lot = lots_by_id[lot_id]
+        return [lot.lot_code, lot.product_name, lot.expiration_date.isoformat() if lot.expiration_date else '']
+
+    lot_ids = list(lots_by_id)
+    for index, (lot_id, ticket_id, pqr_type, status, created_at, customer_id, client_name, client_email,
+                quantity_grams) in enumerate(_pqr_rows_query(lot_ids).yield_per(EXPORT_YIELD_PER), 1):
+        writer.writerow([f'pqr:{pqr_type}', *lot_columns(lot_id), ticket_id,
+                         created_at.isoformat() if created_at else '', status, customer_id or '',
+                         client_name or '', client_email or '', quantity_grams or '', 'g'])
+        if index % EXPORT_YIELD_PER == 0:
+            yield flush()
+    yield flush()
+
+    for index, (lot_id, sale_id, sale_date, status, customer_id, name, email, quantity) in \
+            enumerate(_sale_rows_query(lot_ids).yield_per(EXPORT_YIELD_PER), 1):
+        writer.writerow(['venta', *lot_columns(lot_id), sale_id, sale_date.isoformat() if sale_date else '',
+                         status, customer_id, name, email, quantity, 'unidades'])
+        if index % EXPORT_YIELD_PER == 0:
+            yield flush()
+    yield flush()
@@ -0,0 +1,181 @@
+# crm/overview.py - Vista 360 de un cliente (PQRs, ventas, contactos, actividades) con caché por cliente
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload
+
+from events import broker
+from logging_config import get_logger
+from models import db, Customer, CustomerActivity, CustomerContact, PQR, Sale
+
+logger = get_logger('crm.overview')
+
+OVERVIEW_CACHE_SECONDS = 120
+OVERVIEW_CACHE_MAX = 2000
+RECENT_ACTIVITIES = 20
+OPEN_PQRS_LIMIT = 20
+TREND_MONTHS = 12
+COMPLAINT_TYPES = ['queja', 'reclamo']
+OPEN_PQR_STATUSES = ['abierto', 'en_proceso']
+# Modelos cuyo cambio invalida la vista del cliente al que pertenecen
+RELATED_MODELS = (Customer, CustomerContact, CustomerActivity, Sale, PQR)
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _months_back(today, months):
+    year, month = today.year, today.month - (months - 1)
+    while month <= 0:
+        month += 12
+        year -= 1
+    return datetime(year, month, 1)
+
+
+def build_overview(customer_id):
+    """Armar la vista con un número fijo de consultas (siete), sin cargas perezosas por fila"""
+    customer = Customer.query.options(joinedload(Customer.sales_rep)).filter(Customer.id == customer_id).first()
+    if not customer:
+        return None
+
+    now = datetime.utcnow()
+    year_start = datetime(now.year, 1, 1)
+    trend_start = _months_back(now, TREND_MONTHS)
+    last_12_months = now - timedelta(days=365)
+
+    contacts = CustomerContact.query.filter_by(customer_id=customer_id).order_by(CustomerContact.id).all()
+    activities = CustomerActivity.query.filter_by(customer_id=customer_id)\
+        .order_by(CustomerActivity.activity_date.desc()).limit(RECENT_ACTIVITIES).all()
+
+    year_col = db.func.extract('year', Sale.sale_date)
+    month_col = db.func.extract('month', Sale.sale_date)
+    trend = db.session.query(year_col, month_col, db.func.sum(Sale.total_amount), db.func.count(Sale.id))\
+        .filter(Sale.customer_id == customer_id, Sale.status == 'cerrada', Sale.sale_date >= trend_start)\
+        .group_by(year_col, month_col).order_by(year_col, month_col).all()
+
+    closed = Sale.status == 'cerrada'
+    sales_ytd, sales_12m, sales_count_12m, pipeline = db.session.query(
+        db.func.coalesce(db.func.sum(db.case((db.and_(closed, Sale.sale_date >= year_start), Sale.total_amount))), 0),
+        db.func.coalesce(db.func.sum(db.case((db.and_(closed, Sale.sale_date >= last_12_months), Sale.total_amount))), 0),
+        db.func.coalesce(db.func.sum(db.case((db.and_(closed, Sale.sale_date >= last_12_months), 1))), 0),
+        db.func.coalesce(db.func.sum(db.case((Sale.status == 'cotizada', Sale.total_amount))), 0)
+    ).filter(Sale.customer_id == customer_id).one()
+
+    by_status = {}
+    complaints_12m = 0
+    for status, pqr_type, recent, total in db.session.query(
+            PQR.status, PQR.type,
+            db.func.coalesce(db.func.sum(db.case((PQR.created_at >= last_12_months, 1))), 0),
+            db.func.count(PQR.id)
+    ).filter(PQR.customer_id == customer_id).group_by(PQR.status, PQR.type).all():
+        by_status[status] = by_status.get(status, 0) + total
+        if pqr_type in COMPLAINT_TYPES:
+            complaints_12m += int(recent)
+
+    open_pqrs = db.session.query(
+        PQR.id, PQR.ticket_id, PQR.type, PQR.subject, PQR.product_name, PQR.batch_number,
+        PQR.status, PQR.priority, PQR.created_at
+    ).filter(PQR.customer_id == customer_id, PQR.status.in_(OPEN_PQR_STATUSES))\
+        .order_by(PQR.created_at.desc()).limit(OPEN_PQRS_LIMIT).all()
+
+    customer_data = customer.to_dict()
+    customer_data['sales_rep_name'] = customer.sales_rep.name if customer.sales_rep else None
+    sales_12m = float(sales_12m)
+    return {
+        'customer': customer_data,
+        'contacts': [contact.to_dict() for contact in contacts],
+        'recent_activities': [activity.to_dict() for activity in activities],
+        'sales': {
+            'total_sales_ytd': float(sales_ytd),
+            'total_sales_12m': sales_12m,
+            'sales_count_12m': int(sales_count_12m),
+            'pipeline_value': float(pipeline),
+            'trend': [
+                {'year': int(year), 'month': int(month), 'total_amount': float(amount), 'sales_count': count}
+                for year, month, amount, count in trend
+            ]
+        },
+        'complaints': {
+            'open': [{
+                'id': pqr_id, 'ticket_id': ticket_id, 'type': pqr_type, 'subject': subject,
+                'product_name': product_name, 'batch_number': batch_number, 'status': status,
+                'priority': priority, 'created_at': created_at.isoformat() if created_at else None
+            } for pqr_id, ticket_id, pqr_type, subject, product_name, batch_number, status, priority, created_at
+                in open_pqrs],
+            'by_status': by_status,
+            'complaints_12m': complaints_12m,
+            # Quejas y reclamos por venta cerrada y por millón facturado en los últimos 12 meses
+            'complaints_per_sale': round(complaints_12m / sales_count_12m, 4) if sales_count_12m else None,
+            'complaints_per_million': round(complaints_12m / (sales_12m / 1_000_000), 4) if sales_12m else None
+        },
+        'generated_at': now.isoformat()
+    }
+
+
+def customer_overview(customer_id):
+    """Vista 360 cacheada; retorna (datos o None, si vino de caché)"""
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(customer_id)
+    if cached and now < cached[1]:
+        return cached[0], True
+
+    data = build_overview(customer_id)
+    if data is not None:
+        with _lock:
+            if len(_cache) >= OVERVIEW_CACHE_MAX:
+                _cache.clear()
+            _cache[customer_id] = (data, now + OVERVIEW_CACHE_SECONDS)
+    return data, False
+
+
+def invalidate_overview(customer_id=None):
+    with _lock:
+        if customer_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(customer_id, None)
+
+
+def _customer_ids_of(obj):
+    """Cliente actual y, si la fila cambió de cliente, también el anterior"""
+    if isinstance(obj, Customer):
+        return [obj.id]
+    return [obj.customer_id] + list(inspect(obj).attrs.customer_id.history.deleted)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_customers(session, flush_context):
+    # Se acumulan en la sesión y se invalidan recién en el commit
+    changed = session.info.setdefault('crm_changed_customers', set())
+    for collection in (session.new, session.dirty, session.deleted):
+        for obj in collection:
+            if isinstance(obj, RELATED_MODELS):
+                changed.update(customer_id for customer_id in _customer_ids_of(obj) if customer_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_customers(session):
+    session.info.pop('crm_changed_customers', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_changed_customers(session):
+    # Por el broker para que todos los workers (incluido este) descarten su copia
+    changed = session.info.pop('crm_changed_customers', None)
+    for customer_id in changed or ():
+        broker.publish('crm.customer_changed', customer_id=customer_id, internal=True)
+
+
+def init_overview(broker):
+    """Invalidar la vista cacheada con los cambios CRM confirmados y los eventos de PQR"""
+
+    def _on_event(event_data):
+        customer_id = event_data.get('customer_id')
+        if customer_id and (event_data.get('type') == 'crm.customer_changed'
+                            or event_data.get('type', '').startswith('pqr.')):
+            invalidate_overview(customer_id)
+
+    broker.add_listener(_on_event)
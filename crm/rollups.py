@@ -0,0 +1,144 @@
+# crm/rollups.py - Agregados de ventas por día y por mes, mantenidos en la misma transacción que cada venta
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import db, Customer, Sale, SalesRollupDaily, SalesRollupMonthly
+
+SALE_STATUSES = ['cotizada', 'cerrada', 'perdida']
+DEFAULT_SALE_STATUS = 'cerrada'
+
+
+def _upsert(connection, model, keys, amount, count):
+    """Sumar (amount, count) a una fila del agregado creándola si no existe, en una sola sentencia"""
+    insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    table = model.__table__
+    stmt = insert(table).values(**keys, total_amount=amount, sales_count=count)
+    stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_={
+        'total_amount': table.c.total_amount + stmt.excluded.total_amount,
+        'sales_count': table.c.sales_count + stmt.excluded.sales_count
+    })
+    connection.execute(stmt)
+
+
+def _previous(state, attr):
+    """Valor de un atributo antes de los cambios pendientes de esta transacción"""
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.obj(), attr)
+
+
+def _as_day(value):
+    value = value or datetime.utcnow()
+    return value.date() if isinstance(value, datetime) else value
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_sale_deltas(session, flush_context):
+    """Trasladar al agregado las ventas insertadas, modificadas o borradas en este flush"""
+    deltas = defaultdict(lambda: [0.0, 0])
+
+    def add(sale_date, status, amount, count):
+        delta = deltas[(_as_day(sale_date), status or DEFAULT_SALE_STATUS)]
+        delta[0] += amount or 0
+        delta[1] += count
+
+    for obj in session.new:
+        if isinstance(obj, Sale):
+            add(obj.sale_date, obj.status, obj.total_amount, 1)
+    for obj in session.deleted:
+        if isinstance(obj, Sale):
+            state = inspect(obj)
+            add(_previous(state, 'sale_date'), _previous(state, 'status'), -(_previous(state, 'total_amount') or 0), -1)
+    for obj in session.dirty:
+        if isinstance(obj, Sale) and session.is_modified(obj):
+            state = inspect(obj)
+            add(_previous(state, 'sale_date'), _previous(state, 'status'), -(_previous(state, 'total_amount') or 0), -1)
+            add(obj.sale_date, obj.status, obj.total_amount, 1)
+
+    deltas = {key: value for key, value in deltas.items() if value[1] or value[0]}
+    if not deltas:
+        return
+
+    monthly = defaultdict(lambda: [0.0, 0])
+    connection = session.connection()
+    for (day, status), (amount, count) in deltas.items():
+        _upsert(connection, SalesRollupDaily, {'day': day, 'status': status}, amount, count)
+        month = monthly[(day.year, day.month, status)]
+        month[0] += amount
+        month[1] += count
+    for (year, month, status), (amount, count) in monthly.items():
+        _upsert(connection, SalesRollupMonthly, {'year': year, 'month': month, 'status': status}, amount, count)
+
+
+def rebuild_rollups():
+    """Recalcular ambos agregados desde `sale` (carga inicial o reparación); retorna filas diarias"""
+    rows = db.session.query(
+        db.func.date(Sale.sale_date), Sale.status, db.func.sum(Sale.total_amount), db.func.count(Sale.id)
+    ).group_by(db.func.date(Sale.sale_date), Sale.status).all()
+
+    SalesRollupDaily.query.delete()
+    SalesRollupMonthly.query.delete()
+    monthly = defaultdict(lambda: [0.0, 0])
+    daily = []
+    for day, status, amount, count in rows:
+        if day is None:
+            continue
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        status = status or DEFAULT_SALE_STATUS
+        daily.append({'day': day, 'status': status, 'total_amount': amount or 0, 'sales_count': count})
+        month = monthly[(day.year, day.month, status)]
+        month[0] += amount or 0
+        month[1] += count
+    if daily:
+        db.session.execute(db.insert(SalesRollupDaily), daily)
+        db.session.execute(db.insert(SalesRollupMonthly), [
+            {'year': year, 'month': month, 'status': status, 'total_amount': amount, 'sales_count': count}
+            for (year, month, status), (amount, count) in monthly.items()
+        ])
+    db.session.commit()
+    return len(daily)
+
+
+def dashboard_figures(monthly_target, today=None, trend_days=30):
+    """Cifras del tablero CRM desde los agregados: lecturas indexadas de pocas filas"""
+    today = today or datetime.utcnow().date()
+
+    year_rows = SalesRollupMonthly.query.filter(SalesRollupMonthly.year == today.year).all()
+    closed = [row for row in year_rows if row.status == 'cerrada']
+    sales_ytd = sum(row.total_amount for row in closed)
+    sales_this_month = sum(row.total_amount for row in closed if row.month == today.month)
+
+    pipeline_value, opportunities = db.session.query(
+        db.func.coalesce(db.func.sum(SalesRollupMonthly.total_amount), 0),
+        db.func.coalesce(db.func.sum(SalesRollupMonthly.sales_count), 0)
+    ).filter(SalesRollupMonthly.status == 'cotizada').one()
+
+    since = today - timedelta(days=trend_days - 1)
+    daily_rows = SalesRollupDaily.query.filter(
+        SalesRollupDaily.status == 'cerrada', SalesRollupDaily.day >= since
+    ).order_by(SalesRollupDaily.day).all()
+
+    return {
+        'total_customers': db.session.query(db.func.count(Customer.id)).scalar(),
+        'active_opportunities': int(opportunities),
+        'total_sales_ytd': sales_ytd,
+        'pipeline_value': float(pipeline_value),
+        'monthly_target': monthly_target,
+        'sales_this_month': sales_this_month,
+        'monthly_progress': round(sales_this_month / monthly_target * 100) if monthly_target else 0,
+        'sales_by_month': [
+            {'month': row.month, 'total_amount': row.total_amount, 'sales_count': row.sales_count}
+            for row in sorted(closed, key=lambda row: row.month)
+        ],
+        'daily_sales': [
+            {'day': row.day.isoformat(), 'total_amount': row.total_amount, 'sales_count': row.sales_count}
+            for row in daily_rows
+        ]
+    }
@@ -0,0 +1,219 @@
+# duplicates.py - Detección de PQRs casi duplicadas: firmas MinHash e índice LSH en memoria por worker
+import random
+import threading
+import time
+import zlib
+from array import array
+from collections import defaultdict
+
+from flask import current_app
+
+from jobs import BACKFILL_BATCH_SIZE, BACKFILL_MAX_BATCHES_PER_JOB, backfill_by_id
+from logging_config import get_logger
+from models import db, normalize_lot_code, normalize_text, PQR, PQRSignature, User
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = get_logger('duplicates')
+
+NUM_PERMUTATIONS = 64
+# 16 bandas de 4 filas: pares con similitud >= ~0.5 caen juntos en alguna banda con alta probabilidad
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_WORDS = 3
+# Primo de Mersenne 2^31 - 1: (a * x + b) cabe en 64 bits sin desbordar, igual en Python y en NumPy
+MERSENNE_PRIME = (1 << 31) - 1
+SYNC_BATCH_SIZE = 5000
+# Las transacciones pueden confirmarse fuera de orden de `seq`: cada sincronización relee este margen
+SYNC_OVERLAP = 50
+# Candidatos por similitud a revisar antes de filtrar por dueño
+CANDIDATE_LIMIT = 20
+
+# Semilla fija: las firmas guardadas deben ser comparables entre procesos y reinicios
+_random = random.Random(20240611)
+PERMUTATION_A = [_random.randrange(1, MERSENNE_PRIME) for _ in range(NUM_PERMUTATIONS)]
+PERMUTATION_B = [_random.randrange(0, MERSENNE_PRIME) for _ in range(NUM_PERMUTATIONS)]
+if NUMPY_AVAILABLE:
+    _A = np.array(PERMUTATION_A, dtype=np.uint64).reshape(-1, 1)
+    _B = np.array(PERMUTATION_B, dtype=np.uint64).reshape(-1, 1)
+
+
+def shingles(subject, description, batch_number):
+    """Trigramas de palabras del texto normalizado más el lote como elemento propio"""
+    words = normalize_text(f'{subject or ""} {description or ""}').split()
+    if len(words) < SHINGLE_WORDS:
+        items = set(words)
+    else:
+        items = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    lot_code = normalize_lot_code(batch_number)
+    if lot_code:
+        items.add(f'lote:{lot_code}')
+    return items
+
+
+def signature(subject, description, batch_number):
+    """Firma MinHash (NUM_PERMUTATIONS enteros de 32 bits) serializada en bytes; None si no hay texto"""
+    items = shingles(subject, description, batch_number)
+    if not items:
+        return None
+    hashes = [zlib.crc32(item.encode('utf-8')) for item in items]
+    if NUMPY_AVAILABLE:
+        values = (_A * np.array(hashes, dtype=np.uint64) + _B) % MERSENNE_PRIME
+        return values.min(axis=1).astype(np.uint32).tobytes()
+    return array('I', [
+        min((a * x + b) % MERSENNE_PRIME for x in hashes) for a, b in zip(PERMUTATION_A, PERMUTATION_B)
+    ]).tobytes()
+
+
+def similarity(first, second):
+    """Jaccard estimado: fracción de posiciones iguales entre dos firmas"""
+    first, second = array('I', first), array('I', second)
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERMUTATIONS
+
+
+def _band_keys(sig):
+    width = LSH_ROWS * 4
+    return [(band, sig[band * width:(band + 1) * width]) for band in range(LSH_BANDS)]
+
+
+class DuplicateIndex:
+    """Índice LSH del proceso; se pone al día leyendo solo las firmas con `seq` mayor a la última cargada"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = defaultdict(list)
+        self._signatures = {}
+        self._last_seq = 0
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _add(self, pqr_id, sig):
+        if pqr_id in self._signatures:
+            return
+        self._signatures[pqr_id] = sig
+        for key in _band_keys(sig):
+            self._buckets[key].append(pqr_id)
+
+    def sync(self):
+        """Cargar firmas nuevas de otros workers (o todas en el primer uso): lectura indexada por seq"""
+        while True:
+            start = self._last_seq
+            rows = db.session.query(PQRSignature.seq, PQRSignature.pqr_id, PQRSignature.signature)\
+                .filter(PQRSignature.seq > max(start - SYNC_OVERLAP, 0))\
+                .order_by(PQRSignature.seq).limit(SYNC_BATCH_SIZE).all()
+            if not rows:
+                return
+            with self._lock:
+                for seq, pqr_id, sig in rows:
+                    self._add(pqr_id, bytes(sig))
+                self._last_seq = max(self._last_seq, rows[-1][0])
+            if len(rows) < SYNC_BATCH_SIZE or self._last_seq == start:
+                return
+
+    def candidates(self, sig, threshold, exclude=None, limit=5):
+        """PQRs que comparten alguna banda con la firma y superan el umbral, de mayor a menor similitud"""
+        with self._lock:
+            found = set()
+            for key in _band_keys(sig):
+                found.update(self._buckets.get(key, ()))
+            found.discard(exclude)
+            scored = [(pqr_id, similarity(sig, self._signatures[pqr_id])) for pqr_id in found]
+        scored = [item for item in scored if item[1] >= threshold]
+        return sorted(scored, key=lambda item: -item[1])[:limit]
+
+
+index = DuplicateIndex()
+
+
+def same_owner_filter(pqr):
+    """PQRs del mismo remitente: mismo cliente CRM, mismo correo de contacto o, si la registró un cliente, mismo usuario.
+
+    Quejas parecidas de clientes distintos sobre un lote no son duplicados (son un clúster)
+    y vincularlas expondría el ticket de otro cliente.
+    """
+    conditions = []
+    if pqr.customer_id:
+        conditions.append(PQR.customer_id == pqr.customer_id)
+    if pqr.client_email:
+        conditions.append(db.func.lower(PQR.client_email) == pqr.client_email.strip().lower())
+    # El personal registra PQRs de muchos clientes: su usuario no identifica al remitente
+    if db.session.query(User.role).filter(User.id == pqr.user_id).scalar() == 'cliente':
+        conditions.append(PQR.user_id == pqr.user_id)
+    return db.or_(*conditions) if conditions else None
+
+
+def check_new_pqr(pqr):
+    """Buscar un duplicado probable del mismo remitente para una PQR recién agregada (con id) y registrar su firma.
+
+    Retorna (id del duplicado, similitud) o None. La firma queda en la misma
+    transacción que la PQR; los índices de cada worker la cargan tras el commit.
+    """
+    if not current_app.config.get('DUPLICATE_DETECTION_ENABLED', True):
+        return None
+    sig = signature(pqr.subject, pqr.description, pqr.batch_number)
+    if sig is None:
+        return None
+
+    with db.session.no_autoflush:
+        index.sync()
+        started = time.perf_counter()
+        matches = index.candidates(sig, current_app.config.get('DUPLICATE_THRESHOLD', 0.6), exclude=pqr.id,
+                                   limit=CANDIDATE_LIMIT)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # Después de consultar: una firma sin confirmar nunca entra al índice
+        db.session.add(PQRSignature(pqr_id=pqr.id, signature=sig))
+        owner_filter = same_owner_filter(pqr)
+        if not matches or owner_filter is None:
+            return None
+        scores = dict(matches)
+        rows = dict(db.session.query(PQR.id, PQR.duplicate_of_id)
+                    .filter(PQR.id.in_(list(scores)), owner_filter).all())
+        if not rows:
+            return None
+        duplicate_id = max(rows, key=lambda pqr_id: scores[pqr_id])
+        score = scores[duplicate_id]
+        # Se vincula al original de la cadena, no a otro duplicado, si también es del mismo remitente
+        original_id = rows[duplicate_id]
+        if not original_id or not db.session.query(PQR.id).filter(PQR.id == original_id, owner_filter).first():
+            original_id = duplicate_id
+
+    pqr.duplicate_of_id = original_id
+    pqr.duplicate_score = round(score, 3)
+    logger.info('Posible PQR duplicada', extra={
+        'pqr_id': pqr.id, 'duplicate_of_id': original_id, 'score': pqr.duplicate_score,
+        'lookup_ms': round(elapsed_ms, 3)
+    })
+    return original_id, score
+
+
+def similar_pqrs(pqr, limit=5):
+    """Candidatos a duplicado de una PQR existente (para revisión manual)"""
+    sig = db.session.query(PQRSignature.signature).filter(PQRSignature.pqr_id == pqr.id).scalar()
+    if sig is None:
+        return []
+    index.sync()
+    return index.candidates(bytes(sig), current_app.config.get('DUPLICATE_THRESHOLD', 0.6),
+                            exclude=pqr.id, limit=limit)
+
+
+def backfill_signatures(after=None, batch_size=BACKFILL_BATCH_SIZE, max_batches=BACKFILL_MAX_BATCHES_PER_JOB):
+    """Calcular en bloque las firmas de PQRs que no tienen; retorna (calculadas, id para continuar o None)"""
+    def apply_batch(rows):
+        signatures = []
+        for pqr_id, subject, description, batch_number in rows:
+            sig = signature(subject, description, batch_number)
+            if sig is not None:
+                signatures.append({'pqr_id': pqr_id, 'signature': sig})
+        if signatures:
+            db.session.execute(db.insert(PQRSignature), signatures)
+        return len(signatures)
+
+    query = db.session.query(PQR.id, PQR.subject, PQR.description, PQR.batch_number)\
+        .outerjoin(PQRSignature, PQRSignature.pqr_id == PQR.id)\
+        .filter(PQRSignature.pqr_id.is_(None))
+    return backfill_by_id(query, apply_batch, 'Backfill de firmas MinHash', after, batch_size, max_batches)
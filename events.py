@@ -0,0 +1,191 @@
+# events.py - Publicación de eventos en tiempo real (SSE) para PQRs y comentarios
+import json
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+
+from logging_config import get_logger
+
+logger = get_logger('events')
+
+EVENTS_CHANNEL = 'pqr_events'
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class MemoryBackend:
+    """Backend en memoria: los eventos solo llegan a los suscriptores del mismo proceso"""
+
+    def start(self, dispatch):
+        self.dispatch = dispatch
+
+    def publish(self, event):
+        self.dispatch(event)
+
+
+class PostgresBackend:
+    """Backend con LISTEN/NOTIFY de PostgreSQL para repartir eventos entre workers de gunicorn"""
+
+    def __init__(self, app, channel=EVENTS_CHANNEL):
+        self.app = app
+        self.channel = channel
+        self.dispatch = None
+
+    def start(self, dispatch):
+        self.dispatch = dispatch
+        listener = threading.Thread(target=self._listen, name='pqr-events-listener', daemon=True)
+        listener.start()
+
+    def publish(self, event):
+        # NOTIFY usa una conexión del pool; el listener de cada worker hace el reparto local
+        from models import db
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                conn.execute(text('SELECT pg_notify(:channel, :payload)'),
+                             {'channel': self.channel, 'payload': json.dumps(event)})
+                conn.commit()
+
+    def _listen(self):
+        import select
+        import psycopg2
+
+        dsn = self.app.config['SQLALCHEMY_DATABASE_URI']
+        while True:
+            try:
+                conn = psycopg2.connect(dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel};')
+                while True:
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.dispatch(json.loads(notify.payload))
+            except Exception as e:
+                logger.warning('Listener de eventos desconectado, reintentando', extra={'error': str(e)})
+                time.sleep(2)
+
+
+class Subscription:
+    """Cola de eventos de un cliente SSE conectado"""
+
+    def __init__(self, user_id, role):
+        self.user_id = user_id
+        self.role = role
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def can_see(self, event):
+        if self.role in ['administrador', 'registrador', 'calidad']:
+            return True
+        # Clientes (y roles desconocidos) solo reciben eventos de sus propias PQRs, nunca internos
+        return event.get('owner_id') == self.user_id and not event.get('internal')
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+
+class EventBroker:
+    """Broker en proceso con backend intercambiable (memoria o PostgreSQL)"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._backend = MemoryBackend()
+        self._started = False
+
+    def init_app(self, app):
+        backend = app.config.get('EVENTS_BACKEND', 'memory')
+        if backend == 'postgres':
+            self._backend = PostgresBackend(app)
+        else:
+            self._backend = MemoryBackend()
+        app.extensions['event_broker'] = self
+        # Primera petición de cada worker: los listeners internos reciben eventos aunque nadie publique ni se suscriba
+        app.before_request(self._start_on_request)
+
+    def _start_on_request(self):
+        if not self._started:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        # El listener se inicia de forma perezosa para que cada worker (post-fork) tenga el suyo
+        with self._lock:
+            if not self._started:
+                self._backend.start(self._dispatch)
+                self._started = True
+
+    def subscribe(self, user_id, role):
+        self._ensure_started()
+        subscription = Subscription(user_id, role)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def add_listener(self, callback):
+        """Registrar un callback interno (p. ej. invalidación de caché) que recibe todos los eventos"""
+        # No inicia el listener: se registra al importar la app, antes del fork de gunicorn
+        self._listeners.append(callback)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type, **data):
+        """Publicar un evento; llamar solo después de db.session.commit()"""
+        self._ensure_started()
+        event = {
+            'id': str(uuid.uuid4()),
+            'type': event_type,
+            'timestamp': datetime.utcnow().isoformat(),
+            **data
+        }
+        try:
+            self._backend.publish(event)
+        except Exception as e:
+            # Un fallo de notificación nunca debe romper la operación ya confirmada
+            logger.warning('No se pudo publicar evento', extra={'event_type': event_type, 'error': str(e)})
+
+    def _dispatch(self, event):
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.warning('Error en listener de eventos', extra={'event_type': event.get('type'), 'error': str(e)})
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if not subscription.can_see(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # Cliente lento: se descarta el evento, el front hará un refresco completo al reconectar
+                pass
+
+
+broker = EventBroker()
+
+
+def publish_pqr_event(event_type, pqr, **extra):
+    """Publicar un evento de PQR con los campos necesarios para filtrar por rol"""
+    broker.publish(
+        event_type,
+        pqr_id=pqr.id,
+        ticket_id=pqr.ticket_id,
+        owner_id=pqr.user_id,
+        assigned_agent_id=pqr.assigned_agent_id,
+        status=pqr.status,
+        customer_id=pqr.customer_id,
+        **extra
+    )
+
+
+def format_sse(event):
+    """Serializar un evento en formato text/event-stream"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,22 @@
+# gunicorn.conf.py - Hooks de gunicorn (se carga automáticamente desde el directorio del proyecto)
+import os
+import shutil
+import tempfile
+
+# Métricas Prometheus en modo multiproceso: cada worker escribe sus valores en este directorio
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'pqr_prometheus'))
+
+
+def on_starting(server):
+    # Limpiar valores de ejecuciones anteriores antes de crear los workers
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
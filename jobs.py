@@ -0,0 +1,214 @@
+# jobs.py - Cola de trabajos en segundo plano respaldada por la tabla job
+import json
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from logging_config import get_logger
+from models import db, Job
+
+logger = get_logger('jobs')
+
+# Registro de tareas: nombre -> función(payload)
+TASKS = {}
+
+JOB_PENDING = 'pendiente'
+JOB_RUNNING = 'en_ejecucion'
+JOB_DONE = 'completado'
+JOB_FAILED = 'fallido'
+
+# Backfills por id: filas por bloque (un commit cada uno) y bloques por trabajo antes de encadenar otro
+BACKFILL_BATCH_SIZE = 500
+BACKFILL_MAX_BATCHES_PER_JOB = 20
+
+
+def task(name):
+    """Decorador para registrar una función como tarea de la cola"""
+    def decorator(f):
+        TASKS[name] = f
+        return f
+    return decorator
+
+
+def enqueue(name, payload=None, idempotency_key=None, delay_seconds=0, max_attempts=5):
+    """Encolar un trabajo dentro de la transacción actual.
+
+    El trabajo se agrega a db.session, así que solo es visible para el worker
+    después del commit de la petición; si la transacción hace rollback, el
+    trabajo desaparece con ella. Con idempotency_key la inserción usa
+    ON CONFLICT DO NOTHING: si otra transacción encola la misma llave a la vez,
+    el trabajo ya está encolado y la transacción del llamador no falla.
+    """
+    values = {
+        'name': name,
+        'payload': json.dumps(payload or {}),
+        'idempotency_key': idempotency_key,
+        'max_attempts': max_attempts,
+        'run_at': datetime.utcnow() + timedelta(seconds=delay_seconds)
+    }
+    if not idempotency_key:
+        job = Job(**values)
+        db.session.add(job)
+        return job
+
+    with db.session.no_autoflush:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing
+        connection = db.session.connection()
+        insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+        connection.execute(insert(Job.__table__).values(**values)
+                           .on_conflict_do_nothing(index_elements=['idempotency_key']))
+        # El nuestro o el de la transacción concurrente que ganó la llave
+        return Job.query.filter_by(idempotency_key=idempotency_key).first()
+
+
+def start_backfill(name, key):
+    """Encolar una corrida de un backfill encadenado; su llave es la raíz de la cadena (el llamador hace commit)"""
+    return enqueue(name, {'root': key}, idempotency_key=key)
+
+
+def backfill_task(name, backfill):
+    """Registrar backfill(after=...) como tarea que encadena otro trabajo de la misma corrida si quedan pendientes"""
+    def run(payload):
+        _, after = backfill(after=payload.get('after'))
+        if after:
+            # La llave incluye la corrida: otra corrida que llegue al mismo id no choca con esta cadena
+            root = payload.get('root', name)
+            enqueue(name, {'root': root, 'after': after}, idempotency_key=f'{root}:{after}')
+            db.session.commit()
+    run.__doc__ = backfill.__doc__
+    return task(name)(run)
+
+
+def backfill_by_id(query, apply_batch, message, after=None, batch_size=BACKFILL_BATCH_SIZE,
+                   max_batches=BACKFILL_MAX_BATCHES_PER_JOB):
+    """Recorrer por id las filas de `query` en bloques con un commit por bloque.
+
+    La primera columna de la consulta es el id; apply_batch(rows) aplica los cambios
+    y retorna cuántas filas actualizó. Retorna (actualizadas, id para continuar o None).
+    """
+    id_column = query.column_descriptions[0]['expr']
+    updated = 0
+    for _ in range(max_batches):
+        batch = query.filter(id_column > after) if after else query
+        rows = batch.order_by(id_column).limit(batch_size).all()
+        if not rows:
+            return updated, None
+        changed = apply_batch(rows)
+        db.session.commit()
+        updated += changed
+        after = rows[-1][0]
+        logger.info(message, extra={'batch': len(rows), 'updated': changed})
+    return updated, after
+
+
+def backoff_seconds(attempts, base=None, cap=None):
+    """Backoff exponencial con jitter para el reintento número `attempts`"""
+    from config import config
+    base = base if base is not None else config.JOBS_RETRY_BASE_SECONDS
+    cap = cap if cap is not None else config.JOBS_RETRY_MAX_SECONDS
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class Worker:
+    """Worker que reclama trabajos pendientes y los ejecuta dentro del contexto de la app"""
+
+    def __init__(self, app, batch_size=None, poll_interval=None, lock_timeout=None):
+        self.app = app
+        self.batch_size = batch_size or app.config.get('JOBS_BATCH_SIZE', 10)
+        self.poll_interval = poll_interval or app.config.get('JOBS_POLL_INTERVAL', 2)
+        self.lock_timeout = lock_timeout or app.config.get('JOBS_LOCK_TIMEOUT', 300)
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def release_stale(self):
+        """Devolver a la cola trabajos bloqueados por un worker que murió"""
+        stale_before = datetime.utcnow() - timedelta(seconds=self.lock_timeout)
+        Job.query.filter(Job.status == JOB_RUNNING, Job.locked_at < stale_before)\
+            .update({'status': JOB_PENDING, 'locked_at': None, 'locked_by': None}, synchronize_session=False)
+        db.session.commit()
+
+    def claim(self):
+        """Reclamar hasta batch_size trabajos; el UPDATE condicional evita que dos workers tomen el mismo"""
+        now = datetime.utcnow()
+        candidate_ids = [row.id for row in db.session.query(Job.id)
+                         .filter(Job.status == JOB_PENDING, Job.run_at <= now)
+                         .order_by(Job.run_at)
+                         .limit(self.batch_size).all()]
+        claimed = []
+        for job_id in candidate_ids:
+            updated = Job.query.filter(Job.id == job_id, Job.status == JOB_PENDING)\
+                .update({'status': JOB_RUNNING, 'locked_at': now, 'locked_by': self.worker_id,
+                         'attempts': Job.attempts + 1},
+                        synchronize_session=False)
+            if updated:
+                claimed.append(job_id)
+        db.session.commit()
+        return claimed
+
+    def execute(self, job_id):
+        job = db.session.get(Job, job_id)
+        handler = TASKS.get(job.name)
+        try:
+            if not handler:
+                raise LookupError(f"Tarea no registrada: {job.name}")
+            handler(json.loads(job.payload or '{}'))
+            job = db.session.get(Job, job_id)
+            job.status = JOB_DONE
+            job.last_error = None
+            job.locked_at = None
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.last_error = f"{e}\n{traceback.format_exc()}"[-4000:]
+            job.locked_at = None
+            job.locked_by = None
+            if job.attempts >= job.max_attempts:
+                job.status = JOB_FAILED
+                logger.error('Trabajo fallido definitivamente', extra={'job_id': job.id, 'job_name': job.name, 'attempts': job.attempts, 'error': str(e)})
+            else:
+                job.status = JOB_PENDING
+                job.run_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(job.attempts))
+                logger.warning('Trabajo fallido, se reintentará', extra={'job_id': job.id, 'job_name': job.name, 'attempts': job.attempts, 'error': str(e)})
+            db.session.commit()
+
+    def run_once(self):
+        """Procesar un lote de trabajos; retorna cuántos se ejecutaron"""
+        with self.app.app_context():
+            self.release_stale()
+            claimed = self.claim()
+            for job_id in claimed:
+                self.execute(job_id)
+            db.session.remove()
+            return len(claimed)
+
+    def run_forever(self):
+        logger.info('Worker de trabajos iniciado', extra={'worker_id': self.worker_id})
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                logger.exception('Error en el worker de trabajos')
+                processed = 0
+            if not processed:
+                self._stop.wait(self.poll_interval)
+
+
+def start_background_worker(app):
+    """Iniciar un worker en un hilo del mismo proceso (desarrollo sin proceso worker separado)"""
+    worker = Worker(app)
+    thread = threading.Thread(target=worker.run_forever, name='pqr-jobs-worker', daemon=True)
+    thread.start()
+    return worker
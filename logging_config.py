@@ -0,0 +1,125 @@
+# logging_config.py - Logging estructurado (JSON por línea) con tiempos por petición
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Campos estándar de LogRecord que no se repiten en la salida JSON
+_RESERVED_ATTRS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro, con el contexto de la petición actual si existe"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Agrega request_id, ruta y rol; descarta DEBUG en peticiones no muestreadas"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = getattr(g, 'request_id', None)
+            record.route = request.url_rule.rule if request.url_rule else request.path
+            record.user_role = getattr(g, 'current_user_role', None)
+            if record.levelno <= logging.DEBUG and not getattr(g, 'log_sampled', True):
+                return False
+        return True
+
+
+def get_logger(name):
+    return logging.getLogger(f'pqr.{name}')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start'].pop()
+    if has_request_context() and hasattr(g, 'db_queries'):
+        g.db_queries += 1
+        g.db_time += time.perf_counter() - started
+
+
+def request_db_stats():
+    """(consultas, segundos en BD) de la petición actual"""
+    return getattr(g, 'db_queries', 0), getattr(g, 'db_time', 0.0)
+
+
+def init_logging(app):
+    """Configurar logging JSON no bloqueante (QueueHandler) y el log de acceso por petición"""
+    global _listener
+
+    level = getattr(logging, app.config.get('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+    sample_rate = app.config.get('LOG_DEBUG_SAMPLE_RATE', 1.0)
+
+    root = logging.getLogger('pqr')
+    root.setLevel(level)
+    root.propagate = False
+
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter())
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(RequestContextFilter())
+        root.addHandler(queue_handler)
+        # La escritura a stdout ocurre en el hilo del listener, no en el worker que atiende la petición
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    access_logger = get_logger('access')
+
+    @app.before_request
+    def log_request_start():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+        # Muestreo de DEBUG por petición (LOG_DEBUG_SAMPLE_RATE < 1 en producción)
+        g.log_sampled = random.random() < sample_rate
+
+    @app.after_request
+    def log_request_end(response):
+        if not hasattr(g, 'request_started'):
+            return response
+        duration = time.perf_counter() - g.request_started
+        db_queries, db_time = request_db_stats()
+        response.headers['X-Request-ID'] = g.request_id
+        access_logger.info('request', extra={
+            'method': request.method,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_time_ms': round(db_time * 1000, 2),
+            'db_queries': db_queries
+        })
+        return response
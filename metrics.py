@@ -0,0 +1,140 @@
+# metrics.py - Endpoint /metrics estilo Prometheus (agregado entre workers de gunicorn)
+import os
+import time
+
+from flask import Response, g, request
+
+from config import config
+from logging_config import request_db_stats
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+UPLOAD_BYTES_BUCKETS = (10_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000, 16_000_000)
+
+if PROMETHEUS_AVAILABLE:
+    HTTP_REQUESTS = Counter(
+        'pqr_http_requests_total', 'Peticiones HTTP atendidas', ['method', 'route', 'status'])
+    HTTP_LATENCY = Histogram(
+        'pqr_http_request_duration_seconds', 'Latencia de peticiones HTTP', ['method', 'route'],
+        buckets=LATENCY_BUCKETS)
+    DB_QUERIES = Histogram(
+        'pqr_db_queries_per_request', 'Consultas SQL por petición', ['route'], buckets=QUERY_COUNT_BUCKETS)
+    DB_TIME = Histogram(
+        'pqr_db_time_per_request_seconds', 'Tiempo en base de datos por petición', ['route'],
+        buckets=LATENCY_BUCKETS)
+    UPLOAD_BYTES = Histogram(
+        'pqr_upload_bytes', 'Tamaño de archivos adjuntos recibidos', ['field'], buckets=UPLOAD_BYTES_BUCKETS)
+    UPLOAD_DURATION = Histogram(
+        'pqr_upload_duration_seconds', 'Tiempo de escritura de archivos adjuntos', ['field'],
+        buckets=LATENCY_BUCKETS)
+    OPENAI_LATENCY = Histogram(
+        'pqr_openai_request_duration_seconds', 'Latencia de llamados a OpenAI', ['endpoint'],
+        buckets=LATENCY_BUCKETS)
+    OPENAI_TOKENS = Counter(
+        'pqr_openai_tokens_total', 'Tokens consumidos en OpenAI', ['endpoint', 'kind'])
+    OPENAI_ERRORS = Counter(
+        'pqr_openai_errors_total', 'Errores en llamados a OpenAI', ['endpoint', 'error_type'])
+    RATELIMIT_DECISIONS = Counter(
+        'pqr_ratelimit_requests_total', 'Decisiones del limitador de tasa', ['policy', 'result'])
+    DB_POOL_CHECKED_OUT = Gauge(
+        'pqr_db_pool_checked_out', 'Conexiones del pool en uso', multiprocess_mode='livesum')
+    DB_POOL_SIZE = Gauge(
+        'pqr_db_pool_size', 'Tamaño configurado del pool de conexiones', multiprocess_mode='livemax')
+
+
+def openai_error_type(error_msg):
+    """Clasificar un error de OpenAI con las mismas reglas que usan las rutas"""
+    error_msg = error_msg.lower()
+    if 'api_key' in error_msg:
+        return 'invalid_key'
+    if 'quota' in error_msg:
+        return 'quota_exceeded'
+    if 'rate_limit' in error_msg:
+        return 'rate_limit'
+    return 'unknown'
+
+
+def observe_upload(field, nbytes, seconds):
+    if PROMETHEUS_AVAILABLE:
+        UPLOAD_BYTES.labels(field).observe(nbytes)
+        UPLOAD_DURATION.labels(field).observe(seconds)
+
+
+def observe_openai_call(endpoint, seconds, response=None, error=None):
+    """Registrar latencia, tokens (response.usage) o el tipo de error de un llamado a OpenAI"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    OPENAI_LATENCY.labels(endpoint).observe(seconds)
+    if error is not None:
+        OPENAI_ERRORS.labels(endpoint, openai_error_type(str(error))).inc()
+        return
+    usage = getattr(response, 'usage', None)
+    if usage:
+        OPENAI_TOKENS.labels(endpoint, 'prompt').inc(getattr(usage, 'prompt_tokens', 0) or 0)
+        OPENAI_TOKENS.labels(endpoint, 'completion').inc(getattr(usage, 'completion_tokens', 0) or 0)
+
+
+def observe_ratelimit(policy, allowed):
+    if PROMETHEUS_AVAILABLE:
+        RATELIMIT_DECISIONS.labels(policy, 'permitida' if allowed else 'limitada').inc()
+
+
+def _observe_pool():
+    from models import db
+    pool = db.engine.pool
+    if hasattr(pool, 'checkedout'):
+        DB_POOL_CHECKED_OUT.set(pool.checkedout())
+    if hasattr(pool, 'size'):
+        DB_POOL_SIZE.set(pool.size())
+
+
+def init_metrics(app):
+    """Registrar hooks de medición por petición y el endpoint /metrics"""
+    if not PROMETHEUS_AVAILABLE:
+        @app.route('/metrics')
+        def metrics_unavailable():
+            return Response('prometheus_client no instalado\n', status=501, mimetype='text/plain')
+        return
+
+    @app.before_request
+    def metrics_request_start():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def metrics_request_end(response):
+        if not hasattr(g, 'metrics_started') or request.path == '/metrics':
+            return response
+        route = request.url_rule.rule if request.url_rule else 'no_encontrada'
+        HTTP_REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+        HTTP_LATENCY.labels(request.method, route).observe(time.perf_counter() - g.metrics_started)
+        db_queries, db_time = request_db_stats()
+        DB_QUERIES.labels(route).observe(db_queries)
+        DB_TIME.labels(route).observe(db_time)
+        _observe_pool()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if not token and config.is_production():
+            # Rutas, errores y estado del pool no se publican sin token en producción
+            return Response('METRICS_TOKEN no configurado\n', status=403, mimetype='text/plain')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('No autorizado\n', status=401, mimetype='text/plain')
+
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            # Agregar los archivos de todos los workers de gunicorn
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            data = generate_latest(registry)
+        else:
+            data = generate_latest()
+        return Response(data, mimetype=CONTENT_TYPE_LATEST)
@@ -2,11 +2,30 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from datetime import datetime, date
+from sqlalchemy.orm import validates
+import re
+import unicodedata
 import uuid
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 
+def normalize_text(value):
+    """Minúsculas, sin tildes ni puntuación y con espacios colapsados (búsqueda y emparejamiento)"""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch)).lower()
+    value = re.sub(r'[^\w@.\s-]', ' ', value)
+    return re.sub(r'\s+', ' ', value).strip()
+
+def normalize_lot_code(value):
+    """Código de lote comparable: mayúsculas, sin prefijo "Lote"/"Lot" ni espacios internos"""
+    if not value:
+        return ''
+    value = re.sub(r'^\s*LOTE?\b\s*[:#.-]?', '', value.strip().upper())
+    return re.sub(r'\s+', '', value)
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -31,6 +50,16 @@ class User(db.Model):
         }
 
 class PQR(db.Model):
+    __table_args__ = (
+        # Analítica de PQRs por cliente CRM (abiertas, recientes) con joins indexados
+        db.Index('ix_pqr_customer_status', 'customer_id', 'status'),
+        # Impacto de un retiro: todas las PQRs de un lote
+        db.Index('ix_pqr_lot_created', 'lot_id', 'created_at'),
+        # PQRs vencidas o por vencer (SLA) por estado, ordenadas por fecha límite
+        db.Index('ix_pqr_status_sla_due', 'status', 'sla_due_at'),
+        db.Index('ix_pqr_status_response_due', 'status', 'response_due_at'),
+    )
+
     id = db.Column(db.String(50), primary_key=True, default=lambda: str(uuid.uuid4()))
     ticket_id = db.Column(db.String(100), unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -44,12 +73,19 @@ class PQR(db.Model):
     product_name = db.Column(db.String(200), nullable=False)
     batch_number = db.Column(db.String(100), nullable=False)
     expiration_date = db.Column(db.Date, nullable=True)
+    # Lote normalizado del registro de trazabilidad (batch_number conserva el texto original)
+    lot_id = db.Column(db.Integer, db.ForeignKey('lot.id'), nullable=True)
     quantity_grams = db.Column(db.Integer, nullable=True)
     devolution_type = db.Column(db.String(50), nullable=True)  # parcial, completa, no-aplica
     
     # Información del cliente
     client_name = db.Column(db.String(200), nullable=True)
     client_email = db.Column(db.String(120), nullable=True)
+    # Cliente CRM resuelto por email/nombre al crear la PQR (o por el backfill)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=True)
+    # Posible duplicado detectado al crear la PQR (similitud MinHash estimada)
+    duplicate_of_id = db.Column(db.String(50), db.ForeignKey('pqr.id'), nullable=True, index=True)
+    duplicate_score = db.Column(db.Float, nullable=True)
     
     # Temperatura
     ideal_temperature_range = db.Column(db.String(100), nullable=True)
@@ -58,6 +94,13 @@ class PQR(db.Model):
     status = db.Column(db.String(50), default='abierto')  # abierto, en_proceso, cerrado
     priority = db.Column(db.String(20), default='baja')  # baja, media, alta
     assigned_agent_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    # SLA: los mantiene sla.py en cada cambio (ver PQRStatusHistory)
+    status_changed_at = db.Column(db.DateTime, nullable=True)
+    first_response_at = db.Column(db.DateTime, nullable=True)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+    response_due_at = db.Column(db.DateTime, nullable=True)
+    sla_due_at = db.Column(db.DateTime, nullable=True)
     
     # Metadatos
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -80,19 +123,84 @@ class PQR(db.Model):
             'product_name': self.product_name,
             'batch_number': self.batch_number,
             'expiration_date': self.expiration_date.isoformat() if self.expiration_date else None,
+            'lot_id': self.lot_id,
             'quantity_grams': self.quantity_grams,
             'devolution_type': self.devolution_type,
             'client_name': self.client_name,
             'client_email': self.client_email,
+            'customer_id': self.customer_id,
+            'duplicate_of_id': self.duplicate_of_id,
+            'duplicate_score': self.duplicate_score,
             'ideal_temperature_range': self.ideal_temperature_range,
             'status': self.status,
             'priority': self.priority,
             'assigned_agent_id': self.assigned_agent_id,
+            'status_changed_at': self.status_changed_at.isoformat() if self.status_changed_at else None,
+            'first_response_at': self.first_response_at.isoformat() if self.first_response_at else None,
+            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None,
+            'response_due_at': self.response_due_at.isoformat() if self.response_due_at else None,
+            'sla_due_at': self.sla_due_at.isoformat() if self.sla_due_at else None,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
+class PQRSignature(db.Model):
+    """Firma MinHash de asunto + descripción + lote de una PQR; `seq` permite cargas incrementales"""
+    __tablename__ = 'pqr_signature'
+
+    seq = db.Column(db.Integer, primary_key=True)
+    pqr_id = db.Column(db.String(50), db.ForeignKey('pqr.id'), nullable=False, unique=True)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PQRStatusHistory(db.Model):
+    """Historial inmutable de cambios de estado, prioridad y agente de una PQR"""
+    __tablename__ = 'pqr_status_history'
+    __table_args__ = (
+        db.Index('ix_pqr_status_history_pqr_changed', 'pqr_id', 'changed_at'),
+        # Tiempo en estado y resoluciones por periodo
+        db.Index('ix_pqr_status_history_field_changed', 'field', 'changed_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    pqr_id = db.Column(db.String(50), db.ForeignKey('pqr.id'), nullable=False)
+    field = db.Column(db.String(30), nullable=False)  # status, priority, assigned_agent_id
+    old_value = db.Column(db.String(50), nullable=True)
+    new_value = db.Column(db.String(50), nullable=True)
+    # Para `status`: segundos que la PQR pasó en el estado anterior
+    duration_seconds = db.Column(db.Float, nullable=True)
+    changed_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    pqr = db.relationship('PQR', backref=db.backref('status_history', lazy='dynamic'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'pqr_id': self.pqr_id,
+            'field': self.field,
+            'old_value': self.old_value,
+            'new_value': self.new_value,
+            'duration_seconds': self.duration_seconds,
+            'changed_by_id': self.changed_by_id,
+            'changed_at': self.changed_at.isoformat()
+        }
+
+class AgentResolutionBucket(db.Model):
+    """Histograma de tiempos de resolución por agente (percentiles sin recorrer el historial)"""
+    __tablename__ = 'agent_resolution_bucket'
+
+    agent_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    resolved_count = db.Column(db.Integer, nullable=False, default=0)
+    total_seconds = db.Column(db.Float, nullable=False, default=0)
+
 class PQRComment(db.Model):
+    __table_args__ = (
+        # Línea de tiempo por PQR: paginación por id y consultas incrementales
+        db.Index('ix_pqr_comment_pqr_id_id', 'pqr_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     pqr_id = db.Column(db.String(50), db.ForeignKey('pqr.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -114,4 +222,408 @@ class PQRComment(db.Model):
             'comment_text': self.comment_text,
             'is_internal': self.is_internal,
             'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        }
+
+class PQRTriage(db.Model):
+    """Resultado del triage automático de una PQR (una fila por PQR nueva; pendiente hasta clasificarla)"""
+    __table_args__ = (
+        # PQRs pendientes de triage en orden de llegada
+        db.Index('ix_pqr_triage_source_created', 'source', 'created_at'),
+    )
+
+    pqr_id = db.Column(db.String(50), db.ForeignKey('pqr.id'), primary_key=True)
+    suggested_type = db.Column(db.String(50), nullable=True)
+    suggested_priority = db.Column(db.String(20), nullable=True)
+    suggested_agent_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    temperature_range = db.Column(db.String(100), nullable=True)
+    source = db.Column(db.String(20), nullable=False)  # pendiente, modelo, local
+    reason = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    pqr = db.relationship('PQR', backref=db.backref('triage', uselist=False))
+
+    def to_dict(self):
+        return {
+            'pqr_id': self.pqr_id,
+            'suggested_type': self.suggested_type,
+            'suggested_priority': self.suggested_priority,
+            'suggested_agent_id': self.suggested_agent_id,
+            'temperature_range': self.temperature_range,
+            'source': self.source,
+            'reason': self.reason,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class ComplaintBucket(db.Model):
+    """PQRs por producto, lote y ventana de tiempo; la etapa de clústeres la actualiza de forma incremental"""
+    __tablename__ = 'complaint_bucket'
+    __table_args__ = (
+        db.Index('ix_complaint_bucket_start', 'bucket_start'),
+    )
+
+    product_key = db.Column(db.String(200), primary_key=True)
+    lot_code = db.Column(db.String(100), primary_key=True)  # '' cuando la PQR no trae lote
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    product_name = db.Column(db.String(200), nullable=False)
+    complaint_count = db.Column(db.Integer, nullable=False, default=0)
+
+class AnalyticsCursor(db.Model):
+    """Última PQR procesada por una etapa analítica incremental (created_at, id)"""
+    __tablename__ = 'analytics_cursor'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_created_at = db.Column(db.DateTime, nullable=True)
+    last_id = db.Column(db.String(50), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ComplaintAlert(db.Model):
+    """Pico anómalo de PQRs sobre un lote o un producto en una ventana de tiempo"""
+    __tablename__ = 'complaint_alert'
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'product_key', 'lot_code', 'bucket_start', name='uq_complaint_alert_bucket'),
+        db.Index('ix_complaint_alert_status_created', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # lote, producto
+    product_key = db.Column(db.String(200), nullable=False)
+    product_name = db.Column(db.String(200), nullable=False)
+    lot_code = db.Column(db.String(100), nullable=False, default='')
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    bucket_hours = db.Column(db.Integer, nullable=False)
+    complaint_count = db.Column(db.Integer, nullable=False)
+    baseline_mean = db.Column(db.Float, nullable=False, default=0)
+    z_score = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='abierta')  # abierta, revisada, descartada
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'scope': self.scope,
+            'product_name': self.product_name,
+            'lot_code': self.lot_code or None,
+            'bucket_start': self.bucket_start.isoformat(),
+            'bucket_hours': self.bucket_hours,
+            'complaint_count': self.complaint_count,
+            'baseline_mean': round(self.baseline_mean, 3),
+            'z_score': round(self.z_score, 2),
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class Job(db.Model):
+    """Trabajo en segundo plano persistido en la base de datos (cola sin broker externo)"""
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='pendiente')  # pendiente, en_ejecucion, completado, fallido
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=True)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'idempotency_key': self.idempotency_key,
+            'run_at': self.run_at.isoformat() if self.run_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class RevokedToken(db.Model):
+    """Tokens de renovación (refresh) revocados: usados en una rotación o cerrados con logout"""
+    __table_args__ = (
+        db.Index('ix_revoked_token_expires_at', 'expires_at'),
+    )
+
+    jti = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    token_type = db.Column(db.String(20), nullable=False, default='refresh')
+    reason = db.Column(db.String(20), nullable=False, default='rotado')  # rotado, logout
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChatSession(db.Model):
+    """Conversación con el asistente: resumen de los turnos antiguos y turnos recientes comprimidos"""
+    __table_args__ = (
+        # Sesiones de un usuario por uso reciente (desalojo LRU) y expiración por inactividad (TTL)
+        db.Index('ix_chat_session_user_last_used', 'user_id', 'last_used_at'),
+        db.Index('ix_chat_session_last_used', 'last_used_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    summary = db.Column(db.Text)
+    # JSON comprimido con zlib: [[rol, texto, tokens], ...]
+    turns = db.Column(db.LargeBinary)
+    token_count = db.Column(db.Integer, nullable=False, default=0)
+    # Control optimista: el resumen en segundo plano no pisa turnos agregados mientras tanto
+    version = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# --- CRM: clientes, productos y ventas (antes en crm/*_models.py con otra instancia de db) ---
+
+class Customer(db.Model):
+    __tablename__ = 'customer'
+    __table_args__ = (
+        # Paginación por llave (nombre normalizado, id); pattern_ops no sirve para ORDER BY ni la comparación de tuplas
+        db.Index('ix_customer_name_id', 'name_normalized', 'id'),
+        # Búsqueda por prefijo (LIKE 'term%') independiente de la collation
+        db.Index('ix_customer_name_prefix', 'name_normalized', postgresql_ops={'name_normalized': 'varchar_pattern_ops'}),
+        db.Index('ix_customer_email_prefix', 'email', postgresql_ops={'email': 'varchar_pattern_ops'}),
+        db.Index('ix_customer_sales_rep_name', 'sales_rep_id', 'name_normalized', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    name_normalized = db.Column(db.String(100), nullable=False, default='')
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    phone = db.Column(db.String(20))
+    address = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    sales_rep_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    pqrs = db.relationship('PQR', backref='customer', lazy=True)
+
+    sales_rep = db.relationship('User', backref='customers_as_sales_rep', foreign_keys=[sales_rep_id])
+
+    @validates('name')
+    def _set_name(self, key, value):
+        self.name_normalized = normalize_text(value)
+        return value
+
+    @validates('email')
+    def _set_email(self, key, value):
+        return value.strip().lower() if value else value
+
+    def __repr__(self):
+        return f'<Customer {self.name}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'email': self.email,
+            'phone': self.phone,
+            'address': self.address,
+            'sales_rep_id': self.sales_rep_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class CustomerContact(db.Model):
+    __tablename__ = 'customer_contact'
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(120))
+    phone = db.Column(db.String(20))
+    role = db.Column(db.String(50))
+
+    customer = db.relationship('Customer', backref='contacts', lazy=True)
+
+    def __repr__(self):
+        return f'<CustomerContact {self.name} for Customer {self.customer_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'customer_id': self.customer_id,
+            'name': self.name,
+            'email': self.email,
+            'phone': self.phone,
+            'role': self.role
+        }
+
+class CustomerActivity(db.Model):
+    __tablename__ = 'customer_activity'
+    __table_args__ = (
+        db.Index('ix_customer_activity_customer_date', 'customer_id', 'activity_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    activity_type = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.Text)
+    activity_date = db.Column(db.DateTime, default=datetime.utcnow)
+    recorded_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    customer = db.relationship('Customer', backref='activities', lazy=True)
+    recorded_by = db.relationship('User', backref='recorded_activities', foreign_keys=[recorded_by_id])
+
+    def __repr__(self):
+        return f'<CustomerActivity {self.activity_type} for Customer {self.customer_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'customer_id': self.customer_id,
+            'activity_type': self.activity_type,
+            'description': self.description,
+            'activity_date': self.activity_date.isoformat() if self.activity_date else None,
+            'recorded_by_id': self.recorded_by_id
+        }
+
+class ProductCategory(db.Model):
+    __tablename__ = 'product_category'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    description = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<ProductCategory {self.name}>'
+
+class Product(db.Model):
+    __tablename__ = 'product'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    price = db.Column(db.Float)
+    stock = db.Column(db.Integer)
+    category_id = db.Column(db.Integer, db.ForeignKey('product_category.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    category = db.relationship('ProductCategory', backref='products', lazy=True)
+
+    def __repr__(self):
+        return f'<Product {self.name}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'price': self.price,
+            'stock': self.stock,
+            'category_id': self.category_id
+        }
+
+class Lot(db.Model):
+    """Registro de lotes producidos: producto + código de lote normalizados, con fechas"""
+    __tablename__ = 'lot'
+    __table_args__ = (
+        db.UniqueConstraint('product_key', 'lot_code', name='uq_lot_product_code'),
+        db.Index('ix_lot_lot_code', 'lot_code'),
+        db.Index('ix_lot_expiration_date', 'expiration_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    lot_code = db.Column(db.String(100), nullable=False)
+    product_name = db.Column(db.String(200), nullable=False)
+    product_key = db.Column(db.String(200), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=True)
+    production_date = db.Column(db.Date, nullable=True)
+    expiration_date = db.Column(db.Date, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    product = db.relationship('Product')
+    pqrs = db.relationship('PQR', backref='lot', lazy='dynamic')
+
+    @validates('product_name')
+    def _set_product_key(self, key, value):
+        self.product_key = normalize_text(value)
+        return value
+
+    @validates('lot_code')
+    def _normalize_lot_code(self, key, value):
+        return normalize_lot_code(value)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'lot_code': self.lot_code,
+            'product_name': self.product_name,
+            'product_id': self.product_id,
+            'production_date': self.production_date.isoformat() if self.production_date else None,
+            'expiration_date': self.expiration_date.isoformat() if self.expiration_date else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class Sale(db.Model):
+    __tablename__ = 'sale'
+    __table_args__ = (
+        db.Index('ix_sale_customer_date', 'customer_id', 'sale_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    sale_date = db.Column(db.DateTime, default=datetime.utcnow)
+    total_amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='cerrada')  # cotizada (oportunidad), cerrada, perdida
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    customer = db.relationship('Customer', backref='sales', lazy=True)
+
+    def __repr__(self):
+        return f'<Sale {self.id} for Customer {self.customer_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'customer_id': self.customer_id,
+            'sale_date': self.sale_date.isoformat() if self.sale_date else None,
+            'total_amount': self.total_amount,
+            'status': self.status,
+            'items': [item.to_dict() for item in self.items]
+        }
+
+class SaleItem(db.Model):
+    __tablename__ = 'sale_item'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=True)
+    # Lote despachado: clientes y cantidades afectadas por un retiro
+    lot_id = db.Column(db.Integer, db.ForeignKey('lot.id'), nullable=True, index=True)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    unit_price = db.Column(db.Float, nullable=False, default=0)
+
+    sale = db.relationship('Sale', backref='items')
+    product = db.relationship('Product')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'product_id': self.product_id,
+            'lot_id': self.lot_id,
+            'quantity': self.quantity,
+            'unit_price': self.unit_price
+        }
+
+class SalesRollupDaily(db.Model):
+    """Total de ventas por día y estado, mantenido en la misma transacción que cada venta"""
+    __tablename__ = 'sales_rollup_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+
+class SalesRollupMonthly(db.Model):
+    """Total de ventas por mes y estado (YTD, pipeline y avance mensual sin recorrer `sale`)"""
+    __tablename__ = 'sales_rollup_monthly'
+
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
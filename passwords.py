@@ -0,0 +1,87 @@
+# passwords.py - bcrypt en un pool acotado de hilos, límite de logins concurrentes y rehash al iniciar sesión
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app
+
+from logging_config import get_logger
+from models import db, bcrypt
+
+logger = get_logger('passwords')
+
+_executor = None
+_login_slots = None
+
+
+class LoginBusy(Exception):
+    """No hay cupo para verificar otra contraseña en este worker"""
+
+
+def hash_cost(password_hash):
+    """Factor de costo de un hash bcrypt ($2b$12$...), None si no se reconoce"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _run(fn, *args):
+    # Sin init_passwords (scripts, shell) se ejecuta en el hilo actual
+    if _executor is None:
+        return fn(*args)
+    return _executor.submit(fn, *args).result()
+
+
+def _verify_and_rehash(password_hash, password, rounds):
+    if not bcrypt.check_password_hash(password_hash, password):
+        return False, None
+    if hash_cost(password_hash) != rounds:
+        return True, bcrypt.generate_password_hash(password, rounds).decode('utf-8')
+    return True, None
+
+
+def hash_password(password):
+    """Hash bcrypt con el costo configurado, calculado en el pool"""
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    return _run(lambda: bcrypt.generate_password_hash(password, rounds).decode('utf-8'))
+
+
+def verify_password(user, password):
+    """Verificar la contraseña en el pool; si el costo del hash guardado cambió, se rehace y se guarda"""
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    valid, new_hash = _run(_verify_and_rehash, user.password_hash, password, rounds)
+    if new_hash:
+        previous = hash_cost(user.password_hash)
+        user.password_hash = new_hash
+        try:
+            db.session.commit()
+            logger.info('Hash de contraseña actualizado', extra={
+                'user_id': user.id, 'from_cost': previous, 'to_cost': rounds})
+        except Exception as e:
+            db.session.rollback()
+            logger.warning('No se pudo actualizar el hash de contraseña', extra={'user_id': user.id, 'error': str(e)})
+    return valid
+
+
+@contextmanager
+def login_slot():
+    """Cupo de login por worker: espera hasta LOGIN_QUEUE_TIMEOUT y luego LoginBusy"""
+    if _login_slots is None:
+        yield
+        return
+    if not _login_slots.acquire(timeout=current_app.config['LOGIN_QUEUE_TIMEOUT']):
+        raise LoginBusy()
+    try:
+        yield
+    finally:
+        _login_slots.release()
+
+
+def init_passwords(app):
+    """Costo de bcrypt desde BCRYPT_LOG_ROUNDS, pool de verificación y cupos de login"""
+    global _executor, _login_slots
+    bcrypt.init_app(app)
+    # bcrypt libera el GIL: el pool acota cuántos núcleos consume el login sin frenar las demás peticiones
+    _executor = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'], thread_name_prefix='bcrypt')
+    _login_slots = threading.BoundedSemaphore(app.config['LOGIN_MAX_CONCURRENT'])
@@ -0,0 +1,162 @@
+# profiler.py - Perfilador SQL por petición: conteo, tiempo en BD, detección N+1 y log de peticiones lentas
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from logging_config import get_logger
+
+logger = get_logger('profiler')
+
+# Una misma consulta repetida estas veces en una petición se reporta como posible N+1
+N_PLUS_ONE_THRESHOLD = 3
+# Límite de huellas SQL guardadas por ruta para acotar la memoria del agregado
+MAX_FINGERPRINTS_PER_ROUTE = 25
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|:\w+|\?|__\[POSTCOMPILE_\w+\]")
+_WHITESPACE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_route_stats = {}
+
+
+def fingerprint(statement):
+    """Normalizar una sentencia SQL: sin literales ni listas de parámetros, espacios colapsados"""
+    sql = _STRING_LITERAL.sub('?', statement)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(?+)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and getattr(g, 'sql_profile', None) is not None:
+        conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and getattr(g, 'sql_profile', None) is not None and conn.info.get('profile_start'):
+        started = conn.info['profile_start'].pop()
+        g.sql_profile.append((fingerprint(statement), time.perf_counter() - started))
+
+
+def summarize(profile):
+    """Resumen de las consultas de una petición: total, tiempo y huellas repetidas"""
+    counts = Counter()
+    times = Counter()
+    for fp, duration in profile:
+        counts[fp] += 1
+        times[fp] += duration
+    duplicates = [
+        {'sql': fp, 'count': count, 'time_ms': round(times[fp] * 1000, 2)}
+        for fp, count in counts.most_common() if count >= N_PLUS_ONE_THRESHOLD
+    ]
+    return {
+        'queries': len(profile),
+        'db_time': sum(duration for _, duration in profile),
+        'counts': counts,
+        'times': times,
+        'duplicates': duplicates
+    }
+
+
+def _record(route, summary):
+    with _lock:
+        stats = _route_stats.setdefault(route, {
+            'requests': 0,
+            'queries': 0,
+            'db_time': 0.0,
+            'max_db_time': 0.0,
+            'max_queries': 0,
+            'n_plus_one_requests': 0,
+            'fingerprints': Counter(),
+            'fingerprint_time': Counter()
+        })
+        stats['requests'] += 1
+        stats['queries'] += summary['queries']
+        stats['db_time'] += summary['db_time']
+        stats['max_db_time'] = max(stats['max_db_time'], summary['db_time'])
+        stats['max_queries'] = max(stats['max_queries'], summary['queries'])
+        if summary['duplicates']:
+            stats['n_plus_one_requests'] += 1
+        stats['fingerprints'].update(summary['counts'])
+        stats['fingerprint_time'].update(summary['times'])
+        if len(stats['fingerprint_time']) > MAX_FINGERPRINTS_PER_ROUTE:
+            keep = dict(stats['fingerprint_time'].most_common(MAX_FINGERPRINTS_PER_ROUTE))
+            stats['fingerprint_time'] = Counter(keep)
+            stats['fingerprints'] = Counter({fp: stats['fingerprints'][fp] for fp in keep})
+
+
+def top_offenders(limit=10):
+    """Rutas con más tiempo acumulado en BD en este worker, con sus consultas más costosas"""
+    offenders = []
+    # Todo bajo el lock: _record actualiza o reemplaza los Counter desde otros hilos
+    with _lock:
+        for route, stats in _route_stats.items():
+            requests = stats['requests'] or 1
+            offenders.append({
+                'route': route,
+                'requests': stats['requests'],
+                'avg_queries': round(stats['queries'] / requests, 2),
+                'max_queries': stats['max_queries'],
+                'avg_db_time_ms': round(stats['db_time'] / requests * 1000, 2),
+                'max_db_time_ms': round(stats['max_db_time'] * 1000, 2),
+                'n_plus_one_requests': stats['n_plus_one_requests'],
+                'top_statements': [
+                    {'sql': fp, 'count': stats['fingerprints'][fp], 'time_ms': round(total * 1000, 2)}
+                    for fp, total in stats['fingerprint_time'].most_common(5)
+                ]
+            })
+    offenders.sort(key=lambda item: item['avg_db_time_ms'] * item['requests'], reverse=True)
+    return {'worker_pid': os.getpid(), 'routes': offenders[:limit]}
+
+
+def reset():
+    with _lock:
+        _route_stats.clear()
+
+
+def init_profiler(app):
+    """Activar el perfilador SQL (PROFILER_ENABLED) con muestreo por petición"""
+    if not app.config.get('PROFILER_ENABLED'):
+        return
+
+    sample_rate = app.config.get('PROFILER_SAMPLE_RATE', 0.1)
+    slow_ms = app.config.get('PROFILER_SLOW_MS', 500)
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def profiler_request_start():
+        g.sql_profile = [] if random.random() < sample_rate else None
+
+    @app.after_request
+    def profiler_request_end(response):
+        profile = getattr(g, 'sql_profile', None)
+        if profile is None:
+            return response
+        g.sql_profile = None
+        # Rutas no encontradas comparten una llave: escáneres y 404 no hacen crecer las estadísticas
+        route = request.url_rule.rule if request.url_rule else 'no_encontrada'
+        summary = summarize(profile)
+        _record(route, summary)
+
+        if summary['db_time'] * 1000 >= slow_ms or summary['duplicates']:
+            logger.warning('Petición lenta o con consultas repetidas', extra={
+                'status': response.status_code,
+                'db_queries': summary['queries'],
+                'db_time_ms': round(summary['db_time'] * 1000, 2),
+                'duplicated_statements': summary['duplicates'][:5],
+                'top_statements': [fp for fp, _ in summary['times'].most_common(3)]
+            })
+        return response
@@ -0,0 +1,223 @@
+# ratelimit.py - Limitación de tasa con token buckets por usuario/rol o IP y políticas por ruta
+import math
+import threading
+import time
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+from logging_config import get_logger
+from metrics import observe_ratelimit
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = get_logger('ratelimit')
+
+# Políticas: `rate` tokens recargados cada `per` segundos, ráfaga máxima `burst`,
+# cobradas a la IP (peticiones sin sesión), al usuario autenticado o a la cuenta indicada en el cuerpo
+POLICIES = {
+    'general': {'rate': 300, 'per': 60, 'burst': 100, 'scope': 'user'},
+    # Por IP es holgado: el personal de una tienda inicia sesión a la vez detrás de la misma IP (NAT)
+    'login': {'rate': 60, 'per': 60, 'burst': 60, 'scope': 'ip'},
+    # Por cuenta es estricto: frena la fuerza bruta sobre un email sin afectar a los demás
+    'login_cuenta': {'rate': 5, 'per': 60, 'burst': 10, 'scope': 'account'},
+    'registro': {'rate': 5, 'per': 3600, 'burst': 5, 'scope': 'ip'},
+    'token': {'rate': 30, 'per': 60, 'burst': 10, 'scope': 'ip'},
+    'ia': {'rate': 10, 'per': 60, 'burst': 5, 'scope': 'user'},
+    'busqueda': {'rate': 60, 'per': 60, 'burst': 20, 'scope': 'user'},
+    'creacion': {'rate': 20, 'per': 60, 'burst': 10, 'scope': 'user'},
+}
+# Endpoint de Flask -> política (los no listados usan 'general')
+ENDPOINT_POLICIES = {
+    'login_user': 'login',
+    'register_user': 'registro',
+    'refresh_token': 'token',
+    'ai_chat': 'ia',
+    'ai_suggestions': 'ia',
+    'create_pqr': 'creacion',
+}
+# Política -> política adicional cobrada a la cuenta (email del cuerpo JSON)
+ACCOUNT_POLICIES = {'login': 'login_cuenta'}
+# Multiplicador de tasa y ráfaga por rol para políticas por usuario
+ROLE_MULTIPLIERS = {'cliente': 1, 'registrador': 2, 'calidad': 2, 'administrador': 3}
+EXEMPT_ENDPOINTS = {'metrics', 'health_check', 'static', 'index'}
+
+# Entre podas del almacén en memoria (número de consultas)
+MEMORY_PRUNE_EVERY = 1000
+
+_REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class MemoryStore:
+    """Buckets en memoria del worker (los límites aplican por proceso)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._calls = 0
+
+    def take(self, key, rate, burst, cost=1):
+        """Consumir `cost` tokens; retorna (permitido, tokens restantes)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._calls += 1
+            if self._calls % MEMORY_PRUNE_EVERY == 0:
+                self._prune(now)
+        return allowed, tokens
+
+    def _prune(self, now):
+        # Un bucket inactivo se considera lleno; basta con olvidarlo tras una hora sin uso
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated > 3600]
+        for key in idle:
+            del self._buckets[key]
+
+
+class RedisStore:
+    """Buckets compartidos entre workers en Redis, actualizados atómicamente con un script Lua"""
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._script = self._client.register_script(_REDIS_TOKEN_BUCKET)
+
+    def take(self, key, rate, burst, cost=1):
+        allowed, tokens = self._script(keys=[f'pqr:ratelimit:{key}'], args=[rate, burst, cost])
+        return bool(allowed), float(tokens)
+
+
+class RateLimiter:
+    def __init__(self):
+        self.store = None
+        self.fallback = MemoryStore()
+        self.trusted_proxies = 0
+
+    def init_app(self, app):
+        """Activar el limitador (RATELIMIT_ENABLED) con almacén en memoria o Redis (RATELIMIT_STORAGE_URL)"""
+        if not app.config.get('RATELIMIT_ENABLED', True):
+            return
+        self.trusted_proxies = app.config.get('RATELIMIT_TRUSTED_PROXIES', 0)
+        storage_url = app.config.get('RATELIMIT_STORAGE_URL')
+        if storage_url and REDIS_AVAILABLE:
+            self.store = RedisStore(storage_url)
+        else:
+            if storage_url:
+                logger.warning('RATELIMIT_STORAGE_URL definido pero redis no está instalado; límites por worker')
+            self.store = self.fallback
+        app.before_request(self.check)
+        app.after_request(self.add_headers)
+
+    def client_ip(self):
+        # Con N proxies de confianza, la IP real es la N-ésima desde el final de X-Forwarded-For
+        route = request.access_route
+        if self.trusted_proxies and len(route) >= self.trusted_proxies:
+            return route[-self.trusted_proxies]
+        return request.remote_addr or 'desconocida'
+
+    def identity(self):
+        """(usuario, rol) del token de acceso si viene uno válido; (None, None) en otro caso"""
+        try:
+            verify_jwt_in_request(optional=True)
+            claims = get_jwt()
+        except Exception:
+            return None, None
+        return claims.get('sub'), claims.get('role')
+
+    def policy_name(self):
+        if request.endpoint == 'get_pqrs' and request.args.get('search', '').strip():
+            return 'busqueda'
+        return ENDPOINT_POLICIES.get(request.endpoint, 'general')
+
+    def take(self, key, rate, burst):
+        try:
+            return self.store.take(key, rate, burst)
+        except Exception as e:
+            # Si el almacén compartido falla se limita por worker en lugar de dejar pasar todo
+            logger.warning('Almacén de rate limit no disponible', extra={'error': str(e)})
+            return self.fallback.take(key, rate, burst)
+
+    def account(self):
+        """Email del cuerpo JSON normalizado; None si no viene"""
+        data = request.get_json(silent=True)
+        email = data.get('email') if isinstance(data, dict) else None
+        if not isinstance(email, str):
+            return None
+        return email.strip().lower() or None
+
+    def check(self):
+        if request.endpoint in EXEMPT_ENDPOINTS or request.method == 'OPTIONS':
+            return None
+
+        name = self.policy_name()
+        policy = POLICIES[name]
+        rate = policy['rate'] / policy['per']
+        burst = policy['burst']
+
+        user_id, role = (None, None) if policy['scope'] == 'ip' else self.identity()
+        if user_id:
+            multiplier = ROLE_MULTIPLIERS.get(role, 1)
+            rate, burst = rate * multiplier, burst * multiplier
+            key, scope = f'{name}:usuario:{user_id}', 'usuario'
+        else:
+            key, scope = f'{name}:ip:{self.client_ip()}', 'ip'
+
+        allowed, remaining = self.take(key, rate, burst)
+        observe_ratelimit(name, allowed)
+        g.ratelimit = (burst, remaining)
+
+        account = self.account() if allowed and name in ACCOUNT_POLICIES else None
+        if account:
+            name = ACCOUNT_POLICIES[name]
+            policy = POLICIES[name]
+            rate = policy['rate'] / policy['per']
+            allowed, remaining = self.take(f'{name}:cuenta:{account}', rate, policy['burst'])
+            observe_ratelimit(name, allowed)
+            scope = 'cuenta'
+        if allowed:
+            return None
+
+        retry_after = max(1, math.ceil((1 - remaining) / rate))
+        logger.warning('Límite de tasa excedido', extra={'policy': name, 'scope': scope})
+        response = jsonify({
+            'error': f'Demasiadas solicitudes. Intente de nuevo en {retry_after} segundos.',
+            'retry_after': retry_after
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def add_headers(self, response):
+        limit = getattr(g, 'ratelimit', None)
+        if limit:
+            response.headers['X-RateLimit-Limit'] = str(int(limit[0]))
+            response.headers['X-RateLimit-Remaining'] = str(int(limit[1]))
+        return response
+
+
+limiter = RateLimiter()
@@ -0,0 +1,379 @@
+# retrieval.py - Índice TF-IDF de PQRs por worker para dar al asistente los tickets relevantes a la consulta
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from logging_config import get_logger
+from models import db, normalize_text, PQR, PQRComment
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = get_logger('retrieval')
+
+# Sin NumPy el asistente sigue usando las PQRs recientes como contexto
+RETRIEVAL_AVAILABLE = NUMPY_AVAILABLE
+
+SYSTEM_AUTHOR = 'Sistema Automatizado'
+# Las palabras se recortan a este prefijo: "reclamos"/"reclamo" y "vencido"/"vencimiento" comparten término
+STEM_LENGTH = 6
+MIN_TOKEN_LENGTH = 3
+MAX_DOCUMENT_CHARS = 4000
+SNIPPET_CHARS = 160
+BUILD_BATCH_SIZE = 500
+CATCH_UP_MAX_COMMENTS = 5000
+# Las transacciones pueden confirmarse fuera de orden: cada puesta al día relee este margen
+SYNC_OVERLAP_SECONDS = 120
+SYNC_OVERLAP_ROWS = 50
+# Las filas reemplazadas se descartan al superar la mitad del índice
+COMPACT_MIN_DEAD_ROWS = 1000
+# Resultados por debajo de esta fracción del mejor puntaje son ruido (una palabra común en común)
+RELATIVE_SCORE_CUTOFF = 0.25
+
+STOPWORDS = {
+    'para', 'por', 'con', 'sin', 'del', 'los', 'las', 'una', 'uno', 'unos', 'unas', 'que', 'como', 'cual',
+    'cuales', 'cuando', 'donde', 'esta', 'este', 'esto', 'estos', 'estas', 'ese', 'esa', 'eso', 'son', 'fue',
+    'ser', 'hay', 'han', 'has', 'muy', 'mas', 'pero', 'sus', 'mis', 'tus', 'les', 'nos', 'ya', 'algo', 'todo',
+    'todas', 'todos', 'sobre', 'entre', 'desde', 'hasta', 'tiene', 'tengo', 'puede', 'puedo', 'quiero',
+    'necesito', 'hola', 'gracias', 'favor', 'pqr', 'pqrs', 'the', 'and'
+}
+
+
+def tokenize(text):
+    """Términos del texto normalizado: sin palabras vacías; códigos con dígitos (tickets, lotes) completos"""
+    terms = []
+    for token in normalize_text(text).split():
+        token = token.strip('.-@')
+        if len(token) < MIN_TOKEN_LENGTH or token in STOPWORDS:
+            continue
+        terms.append(token if any(ch.isdigit() for ch in token) else token[:STEM_LENGTH])
+    return terms
+
+
+def _grow(array, size):
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, len(array) * 2), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class SimilarityIndex:
+    """Matriz TF-IDF dispersa (CSR) en arreglos NumPy con capacidad que se duplica al agregar documentos.
+
+    Cada fila es una PQR con pesos de término normalizados (1 + log tf); el IDF se
+    calcula al consultar con las frecuencias de documento vigentes. Reemplazar una
+    PQR marca su fila como muerta y agrega una nueva.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vocabulary = {}
+        self._df = np.zeros(1024, dtype=np.int32)
+        self._terms = np.zeros(4096, dtype=np.int32)
+        self._weights = np.zeros(4096, dtype=np.float16)
+        # starts[fila] .. starts[fila + 1]: términos de la fila
+        self._starts = np.zeros(257, dtype=np.int64)
+        self._owners = np.zeros(256, dtype=np.int64)
+        self._alive = np.zeros(256, dtype=bool)
+        self._pqr_ids = []
+        self._rows = {}
+        self._nnz = 0
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _term_id(self, term):
+        term_id = self._vocabulary.get(term)
+        if term_id is None:
+            term_id = self._vocabulary[term] = len(self._vocabulary)
+            self._df = _grow(self._df, term_id + 1)
+        return term_id
+
+    def _remove(self, pqr_id):
+        row = self._rows.pop(pqr_id)[0]
+        self._alive[row] = False
+        self._df[self._terms[self._starts[row]:self._starts[row + 1]]] -= 1
+        self._dead += 1
+
+    def add(self, pqr_id, owner_id, text, version):
+        """Indexar (o reemplazar) una PQR; no hace nada si la versión ya está indexada"""
+        counts = Counter(tokenize(text))
+        with self._lock:
+            current = self._rows.get(pqr_id)
+            if current and current[1] == version:
+                return
+            if current:
+                self._remove(pqr_id)
+            if counts:
+                self._append(pqr_id, owner_id, counts, version)
+            if self._dead >= COMPACT_MIN_DEAD_ROWS and self._dead * 2 > len(self._pqr_ids):
+                self._compact()
+
+    def discard(self, pqr_id):
+        with self._lock:
+            if pqr_id in self._rows:
+                self._remove(pqr_id)
+
+    def _append(self, pqr_id, owner_id, counts, version):
+        term_ids = np.array([self._term_id(term) for term in counts], dtype=np.int32)
+        weights = 1 + np.log(np.array(list(counts.values()), dtype=np.float32))
+        weights /= np.linalg.norm(weights)
+
+        row, start, end = len(self._pqr_ids), self._nnz, self._nnz + len(term_ids)
+        self._terms = _grow(self._terms, end)
+        self._weights = _grow(self._weights, end)
+        self._starts = _grow(self._starts, row + 2)
+        self._owners = _grow(self._owners, row + 1)
+        self._alive = _grow(self._alive, row + 1)
+
+        self._terms[start:end] = term_ids
+        self._weights[start:end] = weights
+        self._starts[row + 1] = end
+        self._owners[row] = owner_id
+        self._alive[row] = True
+        self._df[term_ids] += 1
+        self._pqr_ids.append(pqr_id)
+        self._rows[pqr_id] = (row, version)
+        self._nnz = end
+
+    def _compact(self):
+        rows = len(self._pqr_ids)
+        alive = self._alive[:rows]
+        lengths = np.diff(self._starts[:rows + 1])
+        keep = np.repeat(alive, lengths)
+        self._terms = self._terms[:self._nnz][keep]
+        self._weights = self._weights[:self._nnz][keep]
+        alive_rows = np.flatnonzero(alive)
+        self._starts = np.concatenate([[0], np.cumsum(lengths[alive_rows])]).astype(np.int64)
+        self._owners = self._owners[alive_rows]
+        self._alive = np.ones(len(alive_rows), dtype=bool)
+        self._pqr_ids = [self._pqr_ids[row] for row in alive_rows]
+        self._rows = {pqr_id: (row, self._rows[pqr_id][1]) for row, pqr_id in enumerate(self._pqr_ids)}
+        self._nnz = len(self._terms)
+        self._dead = 0
+
+    def search(self, text, limit, owner_id=None):
+        """Las `limit` PQRs con mayor puntaje TF-IDF para el texto; con owner_id solo las de ese usuario"""
+        counts = Counter(tokenize(text))
+        with self._lock:
+            matched = [(self._vocabulary[term], count) for term, count in counts.items() if term in self._vocabulary]
+            if not matched:
+                return []
+            rows = len(self._pqr_ids)
+            term_ids = np.array([term_id for term_id, _ in matched], dtype=np.int64)
+            idf = np.log((1 + len(self._rows)) / (1 + self._df[term_ids])) + 1
+            query = np.zeros(len(self._vocabulary), dtype=np.float32)
+            query[term_ids] = (1 + np.log([count for _, count in matched])) * idf * idf
+
+            # Una sola lectura indexada de la matriz: solo los términos de la consulta aportan puntaje
+            contributions = query[self._terms[:self._nnz]]
+            hits = np.flatnonzero(contributions)
+            hit_rows = np.searchsorted(self._starts[:rows + 1], hits, side='right') - 1
+            scores = np.bincount(hit_rows, weights=contributions[hits] * self._weights[hits], minlength=rows)
+            scores[~self._alive[:rows]] = 0
+            if owner_id is not None:
+                scores[self._owners[:rows] != owner_id] = 0
+
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > limit:
+                candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            results = [(self._pqr_ids[row], float(scores[row])) for row in candidates]
+        if results:
+            cutoff = results[0][1] * RELATIVE_SCORE_CUTOFF
+            results = [item for item in results if item[1] >= cutoff]
+        return results
+
+
+_index = None
+_sync_lock = threading.Lock()
+_dirty_lock = threading.Lock()
+_dirty = set()
+_state = {'synced_at': 0.0, 'updated_since': None, 'last_comment_id': 0, 'warming': False}
+
+
+def _public_comments_filter():
+    # Solo respuestas visibles para el cliente: el texto indexado nunca expone notas internas
+    return db.and_(PQRComment.is_internal.isnot(True),
+                   db.func.coalesce(PQRComment.author_name, '') != SYSTEM_AUTHOR)
+
+
+def _load_documents(pqr_ids):
+    """(id, dueño, texto, versión) de las PQRs: asunto, descripción, producto, lote y respuestas públicas"""
+    comments = {}
+    last_comment_ids = {}
+    for pqr_id, comment_id, text in db.session.query(PQRComment.pqr_id, PQRComment.id, PQRComment.comment_text)\
+            .filter(PQRComment.pqr_id.in_(pqr_ids), _public_comments_filter()).order_by(PQRComment.id):
+        comments.setdefault(pqr_id, []).append(text or '')
+        last_comment_ids[pqr_id] = comment_id
+
+    documents = []
+    for pqr_id, owner_id, ticket_id, subject, description, product_name, batch_number, updated_at in db.session.query(
+            PQR.id, PQR.user_id, PQR.ticket_id, PQR.subject, PQR.description, PQR.product_name,
+            PQR.batch_number, PQR.updated_at).filter(PQR.id.in_(pqr_ids)):
+        # Las respuestas más recientes (las de resolución) primero por si el texto se recorta
+        text = ' '.join([ticket_id or '', subject or '', product_name or '', batch_number or '', description or '',
+                         *reversed(comments.get(pqr_id, []))])[:MAX_DOCUMENT_CHARS]
+        documents.append((pqr_id, owner_id, text, (updated_at, last_comment_ids.get(pqr_id))))
+    return documents
+
+
+def _refresh(index, pqr_ids):
+    pqr_ids = list(pqr_ids)
+    for start in range(0, len(pqr_ids), BUILD_BATCH_SIZE):
+        batch = pqr_ids[start:start + BUILD_BATCH_SIZE]
+        documents = _load_documents(batch)
+        for document in documents:
+            index.add(*document)
+        for pqr_id in set(batch) - {document[0] for document in documents}:
+            index.discard(pqr_id)
+
+
+def _build():
+    """Índice completo leyendo las PQRs por bloques de id (primer uso en cada worker)"""
+    started = time.perf_counter()
+    _state['updated_since'] = datetime.utcnow() - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+    _state['last_comment_id'] = db.session.query(db.func.max(PQRComment.id)).scalar() or 0
+    index = SimilarityIndex()
+    after = None
+    while True:
+        query = db.session.query(PQR.id)
+        if after:
+            query = query.filter(PQR.id > after)
+        pqr_ids = [row[0] for row in query.order_by(PQR.id).limit(BUILD_BATCH_SIZE)]
+        if not pqr_ids:
+            break
+        _refresh(index, pqr_ids)
+        after = pqr_ids[-1]
+    _state['synced_at'] = time.monotonic()
+    logger.info('Índice de recuperación construido', extra={
+        'documents': len(index), 'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+    })
+    return index
+
+
+def _catch_up(index):
+    """Cambios que no llegaron por eventos (otros workers con backend en memoria): edición y comentarios nuevos"""
+    now = datetime.utcnow()
+    pqr_ids = {row[0] for row in db.session.query(PQR.id).filter(PQR.updated_at >= _state['updated_since'])}
+    comments = db.session.query(PQRComment.id, PQRComment.pqr_id)\
+        .filter(PQRComment.id > max(_state['last_comment_id'] - SYNC_OVERLAP_ROWS, 0))\
+        .order_by(PQRComment.id).limit(CATCH_UP_MAX_COMMENTS).all()
+    pqr_ids.update(pqr_id for _, pqr_id in comments)
+    if comments:
+        _state['last_comment_id'] = max(_state['last_comment_id'], comments[-1][0])
+    _state['updated_since'] = now - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+    _state['synced_at'] = time.monotonic()
+    # Las versiones ya indexadas no se reemplazan: releer el margen solo cuesta la lectura
+    _refresh(index, pqr_ids)
+
+
+def _warm_up(app):
+    global _index
+    with app.app_context():
+        try:
+            with _sync_lock:
+                if _index is None:
+                    _index = _build()
+        except Exception:
+            logger.exception('No se pudo construir el índice de recuperación')
+        finally:
+            db.session.remove()
+            # Si falló, la siguiente petición lo vuelve a intentar
+            _state['warming'] = _index is not None
+
+
+def start_warmup(app):
+    """Construir el índice en un hilo de fondo, una vez por worker (después del fork de gunicorn)"""
+    with _dirty_lock:
+        if _state['warming']:
+            return
+        _state['warming'] = True
+    threading.Thread(target=_warm_up, args=(app,), name='pqr-retrieval-warmup', daemon=True).start()
+
+
+def _ensure_fresh():
+    """Índice al día; None mientras se construye en segundo plano (ninguna petición paga la construcción)"""
+    if _index is None:
+        start_warmup(current_app._get_current_object())
+        return None
+    interval = current_app.config.get('RETRIEVAL_SYNC_SECONDS', 60)
+    if time.monotonic() - _state['synced_at'] >= interval and _sync_lock.acquire(blocking=False):
+        try:
+            _catch_up(_index)
+        finally:
+            _sync_lock.release()
+    with _dirty_lock:
+        dirty = list(_dirty)
+        _dirty.clear()
+    if dirty:
+        _refresh(_index, dirty)
+    return _index
+
+
+def retrieve_related_pqrs(question, limit=None, owner_id=None):
+    """PQRs más relevantes para la pregunta con su última respuesta pública: [(pqr, respuesta, puntaje)].
+
+    Con owner_id (clientes) solo se consideran las PQRs de ese usuario. Retorna
+    una lista vacía si NumPy no está instalado o la recuperación está desactivada.
+    """
+    if not RETRIEVAL_AVAILABLE or not current_app.config.get('RETRIEVAL_ENABLED', True):
+        return []
+    limit = limit or current_app.config.get('RETRIEVAL_TOP_K', 4)
+    started = time.perf_counter()
+    index = _ensure_fresh()
+    if index is None:
+        return []
+    matches = index.search(question, limit, owner_id=owner_id)
+    if not matches:
+        return []
+
+    scores = dict(matches)
+    query = PQR.query.filter(PQR.id.in_(list(scores)))
+    if owner_id is not None:
+        query = query.filter(PQR.user_id == owner_id)
+    pqrs = {pqr.id: pqr for pqr in query}
+    last_ids = db.session.query(db.func.max(PQRComment.id))\
+        .filter(PQRComment.pqr_id.in_(list(pqrs)), _public_comments_filter()).group_by(PQRComment.pqr_id)
+    replies = dict(db.session.query(PQRComment.pqr_id, PQRComment.comment_text).filter(PQRComment.id.in_(last_ids)))
+
+    results = [(pqrs[pqr_id], replies.get(pqr_id), score) for pqr_id, score in matches if pqr_id in pqrs]
+    logger.debug('PQRs relevantes recuperadas', extra={
+        'results': len(results), 'scoped': owner_id is not None,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+    })
+    return results
+
+
+def snippet(text, length=SNIPPET_CHARS):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= length else text[:length].rstrip() + '…'
+
+
+def _on_event(event):
+    # Se reindexa al consultar: la petición que publica no paga la lectura
+    event_type = event.get('type')
+    if event_type in ('pqr.created', 'pqr.updated') or (event_type == 'comment.created' and not event.get('internal')):
+        if event.get('pqr_id'):
+            with _dirty_lock:
+                _dirty.add(event['pqr_id'])
+
+
+def init_retrieval(app, broker):
+    """Marcar PQRs para reindexar con los eventos del broker y construir el índice con la primera petición del worker"""
+    if not RETRIEVAL_AVAILABLE or not app.config.get('RETRIEVAL_ENABLED', True):
+        return
+    broker.add_listener(_on_event)
+
+    @app.before_request
+    def retrieval_warmup():
+        if _index is None and not _state['warming']:
+            start_warmup(app)
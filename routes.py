@@ -1,21 +1,53 @@
 # routes.py - Código completo con restricciones reforzadas para clientes
-from flask import jsonify, request, url_for, send_from_directory, current_app
-from models import db, User, PQR, PQRComment, bcrypt
+from flask import jsonify, request, url_for, send_from_directory, current_app, Response, g
+from models import db, User, PQR, PQRComment, PQRStatusHistory, ComplaintAlert, bcrypt
+from events import broker, publish_pqr_event, format_sse
+from jobs import enqueue, start_backfill
+from workload import AGENT_ROLES, agent_workload, invalidate_workload
+from triage import schedule_triage
+from clusters import ALERT_STATUSES, schedule_cluster_scan
+from duplicates import check_new_pqr, similar_pqrs
+from sla import apply_bulk_changes, overdue_query, sla_flags, sla_summary
+from retrieval import retrieve_related_pqrs, snippet
+from conversations import history_messages, last_user_message, load_session, record_exchange, start_session
+from logging_config import get_logger
+from metrics import observe_upload, observe_openai_call
+from serialization import serialize_pqr_list
+from crm.linking import resolve_customer_id
+from crm.lots import resolve_lot_id
+from auth_tokens import issue_tokens, revoke, revoke_encoded
+from passwords import LoginBusy, hash_password, login_slot, verify_password
+import profiler
 from datetime import date, datetime
 from werkzeug.utils import secure_filename
 import os
 import uuid
 import json
+import queue
+import threading
+import time
 from dotenv import load_dotenv
-from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from sqlalchemy.orm import joinedload
 
 # Cargar variables de entorno
 load_dotenv() 
 
+logger = get_logger('routes')
+
 # Configuración para subir archivos
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'csv'}
 
+# Valores permitidos en actualizaciones de PQR
+VALID_STATUSES = {'abierto', 'en_proceso', 'cerrado'}
+VALID_PRIORITIES = {'baja', 'media', 'alta'}
+BULK_UPDATE_MAX_IDS = 500
+
+# Paginación de comentarios
+COMMENTS_PAGE_SIZE = 50
+COMMENTS_MAX_PAGE_SIZE = 200
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -29,7 +61,18 @@ def get_current_user_id():
 def get_current_user():
     """Helper para obtener el objeto User actual"""
     user_id = get_current_user_id()
-    return User.query.get(user_id) if user_id else None
+    user = User.query.get(user_id) if user_id else None
+    # Rol disponible para el log de acceso de la petición
+    g.current_user_role = user.role if user else None
+    return user
+
+def visible_comments_query(pqr_id, user):
+    """Query de comentarios de una PQR visibles para el usuario, con autores precargados"""
+    query = PQRComment.query.options(joinedload(PQRComment.author)).filter(PQRComment.pqr_id == pqr_id)
+    if user.role == 'cliente':
+        # Los clientes NO ven comentarios internos
+        query = query.filter(PQRComment.is_internal == False)
+    return query
 
 def require_admin(f):
     """Decorador para endpoints que requieren rol de administrador"""
@@ -55,6 +98,9 @@ def register_routes(app):
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
 
+    # Streams SSE simultáneos en este worker: cada uno retiene un hilo mientras está abierto
+    stream_slots = threading.BoundedSemaphore(app.config.get('EVENTS_MAX_STREAMS_PER_WORKER', 8))
+
     @app.route('/api/register', methods=['POST'])
     def register_user():
         data = request.get_json()
@@ -70,7 +116,7 @@ def register_routes(app):
             return jsonify({'message': 'El email ya está registrado.'}), 409
 
         new_user = User(email=email, name=name, role=role)
-        new_user.set_password(password)
+        new_user.password_hash = hash_password(password)
         db.session.add(new_user)
         db.session.commit()
         return jsonify({'message': 'Usuario registrado exitosamente.', 'user_id': new_user.id}), 201
@@ -84,18 +130,45 @@ def register_routes(app):
         if not email or not password:
             return jsonify({'error': 'Email y contraseña son requeridos.'}), 400
 
-        user = User.query.filter_by(email=email).first()
-
-        if not user or not user.check_password(password):
-            return jsonify({'error': 'Credenciales inválidas.'}), 401
+        try:
+            # bcrypt corre en el pool acotado; el resto de peticiones no queda detrás de los logins
+            with login_slot():
+                user = User.query.filter_by(email=email).first()
+                if not user or not verify_password(user, password):
+                    return jsonify({'error': 'Credenciales inválidas.'}), 401
+        except LoginBusy:
+            logger.warning('Login rechazado por exceso de concurrencia')
+            return jsonify({'error': 'Demasiados inicios de sesión simultáneos. Intente de nuevo.'}), 503, {'Retry-After': '2'}
 
         # CORREGIDO: Convertir user.id a string para JWT
-        access_token = create_access_token(identity=str(user.id))
         return jsonify({
             'message': 'Inicio de sesión exitoso.', 
-            'access_token': access_token,
+            **issue_tokens(user),
             'user': user.to_dict()
         }), 200
+
+    @app.route('/api/token/refresh', methods=['POST'])
+    @jwt_required(refresh=True)
+    def refresh_token():
+        """Renovar el token de acceso sin contraseña; el token de renovación usado queda revocado"""
+        jwt_payload = get_jwt()
+        if not revoke(jwt_payload, reason='rotado'):
+            # Otra renovación (posiblemente robada) ya consumió este token
+            logger.warning('Token de renovación reutilizado', extra={'user_id': jwt_payload.get('sub')})
+            return jsonify({'error': 'La sesión fue cerrada. Inicie sesión nuevamente.'}), 401
+
+        user = db.session.get(User, get_current_user_id())
+        if not user:
+            return jsonify({'error': 'Usuario no encontrado'}), 401
+        return jsonify(issue_tokens(user)), 200
+
+    @app.route('/api/logout', methods=['POST'])
+    def logout_user():
+        """Cerrar sesión revocando el token de renovación enviado en el cuerpo"""
+        data = request.get_json(silent=True) or {}
+        if data.get('refresh_token'):
+            revoke_encoded(data['refresh_token'], reason='logout')
+        return jsonify({'message': 'Sesión cerrada.'}), 200
     
     @app.route('/api/pqrs', methods=['POST'])
     @jwt_required()
@@ -111,15 +184,11 @@ def register_routes(app):
             timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
             ticket_id = f"PQR-{timestamp}-{str(uuid.uuid4())[:6].upper()}"
 
-            # Debug: Mostrar datos recibidos
-            print("🔍 Datos del formulario recibidos:")
-            for key, value in request.form.items():
-                print(f"   {key}: {value}")
-            
-            print("🔍 Archivos recibidos:")
-            for key in request.files:
-                file = request.files[key]
-                print(f"   {key}: {file.filename if file.filename else 'Sin archivo'}")
+            # Debug: solo nombres de campos y archivos, nunca valores (contienen datos del cliente)
+            logger.debug('create_pqr form', extra={
+                'form_fields': sorted(request.form.keys()),
+                'file_fields': sorted(request.files.keys())
+            })
             
             # Función para obtener valores de form con defaults
             def get_form_value(key, default=''):
@@ -133,7 +202,7 @@ def register_routes(app):
                 try:
                     return datetime.strptime(date_str.strip(), '%Y-%m-%d').date()
                 except Exception as e:
-                    print(f"⚠️ Error parseando fecha '{date_str}': {e}")
+                    logger.warning('Fecha inválida en formulario', extra={'value': date_str})
                     return None
 
             # Obtener campos básicos
@@ -162,7 +231,7 @@ def register_routes(app):
             
             if campos_faltantes:
                 error_msg = f'Campos obligatorios faltantes: {", ".join(campos_faltantes)}'
-                print(f"❌ {error_msg}")
+                logger.info('create_pqr rechazada', extra={'missing_fields': campos_faltantes})
                 return jsonify({'error': error_msg}), 400
 
             # Procesar fechas
@@ -177,12 +246,9 @@ def register_routes(app):
                 try:
                     cantidad_gramos = int(cantidad_str)
                 except ValueError:
-                    print(f"⚠️ Error parseando cantidad: {cantidad_str}")
+                    logger.warning('Cantidad inválida en formulario', extra={'value': cantidad_str})
                     cantidad_gramos = 0
 
-            print(f"✅ Campos validados correctamente")
-            print(f"✅ Creando PQR con ticket: {ticket_id}")
-
             # Crear nueva PQR
             new_pqr = PQR(
                 ticket_id=ticket_id,
@@ -193,10 +259,12 @@ def register_routes(app):
                 product_name=nombre_producto,
                 batch_number=lote,
                 expiration_date=fecha_vencimiento,
+                lot_id=resolve_lot_id(nombre_producto, lote, expiration_date=fecha_vencimiento),
                 quantity_grams=cantidad_gramos,
                 devolution_type=devolucion,
                 client_name=cliente,
                 client_email=email_contacto,
+                customer_id=resolve_customer_id(email_contacto, cliente),
                 ideal_temperature_range='Temperatura ambiente',
                 status='abierto',
                 priority='media'
@@ -204,8 +272,7 @@ def register_routes(app):
             
             db.session.add(new_pqr)
             db.session.flush()  # Para obtener el ID sin hacer commit completo
-            
-            print(f"✅ PQR creada en BD con ID: {new_pqr.id}")
+            duplicate = check_new_pqr(new_pqr)
             
             # Procesar archivos
             archivos_guardados = []
@@ -232,42 +299,42 @@ def register_routes(app):
                                 unique_filename = f"{new_pqr.id}_{file_key}_{timestamp_file}_{i}_{filename}"
                                 file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
                                 
+                                save_started = time.perf_counter()
                                 file.save(file_path)
+                                observe_upload(file_key, os.path.getsize(file_path), time.perf_counter() - save_started)
                                 archivos_guardados.append({
                                     'tipo': file_key,
                                     'nombre_original': filename,
                                     'nombre_guardado': unique_filename
                                 })
-                                print(f"✅ Archivo guardado: {filename} -> {unique_filename}")
                             except Exception as e:
                                 archivos_con_error.append({
                                     'tipo': file_key,
                                     'nombre': file.filename,
                                     'error': str(e)
                                 })
-                                print(f"❌ Error guardando archivo {file.filename}: {e}")
+                                logger.error('Error guardando archivo', extra={'pqr_id': new_pqr.id, 'file_field': file_key, 'error': str(e)})
             
-            # Crear comentario inicial
-            comentario_inicial = f"PQR registrada exitosamente.\n"
-            comentario_inicial += f"Tipo: {new_pqr.type}\n"
-            comentario_inicial += f"Producto: {new_pqr.product_name}\n"
-            comentario_inicial += f"Cliente: {new_pqr.client_name}\n"
-            comentario_inicial += f"Archivos adjuntos: {len(archivos_guardados)}"
-            
-            initial_comment = PQRComment(
-                pqr_id=new_pqr.id,
-                user_id=current_user_id,
-                comment_text=comentario_inicial,
-                author_name="Sistema Automatizado",
-                is_internal=False
-            )
-            db.session.add(initial_comment)
+            # Efectos secundarios (comentario inicial, futuras notificaciones) van a la cola;
+            # el trabajo se confirma en la misma transacción que la PQR
+            enqueue('pqr.post_create', {
+                'pqr_id': new_pqr.id,
+                'archivos_guardados': len(archivos_guardados)
+            }, idempotency_key=f'pqr.post_create:{new_pqr.id}')
+            schedule_triage(new_pqr)
+            schedule_cluster_scan()
             
             # Hacer commit final
             db.session.commit()
             
-            print(f"✅ PQR {ticket_id} creada exitosamente")
-            print(f"✅ Archivos procesados: {len(archivos_guardados)}")
+            publish_pqr_event('pqr.created', new_pqr)
+            
+            logger.info('PQR creada', extra={
+                'ticket_id': ticket_id,
+                'pqr_id': new_pqr.id,
+                'files_saved': len(archivos_guardados),
+                'files_failed': len(archivos_con_error)
+            })
             
             response_data = {
                 'message': 'PQR creada exitosamente',
@@ -276,6 +343,17 @@ def register_routes(app):
                 'archivos_guardados': len(archivos_guardados),
                 'detalles_archivos': archivos_guardados
             }
+
+            if duplicate:
+                duplicate_ticket, duplicate_owner = db.session.query(PQR.ticket_id, PQR.user_id)\
+                    .filter(PQR.id == duplicate[0]).one()
+                # Un cliente solo ve ids de sus propias PQRs (el mismo cliente CRM puede tener varios usuarios)
+                if current_user.role != 'cliente' or duplicate_owner == current_user.id:
+                    response_data['posible_duplicado'] = {
+                        'pqr_id': duplicate[0],
+                        'ticket_id': duplicate_ticket,
+                        'similitud': round(duplicate[1], 3)
+                    }
             
             if archivos_con_error:
                 response_data['advertencias'] = f"{len(archivos_con_error)} archivos no se pudieron guardar"
@@ -285,10 +363,7 @@ def register_routes(app):
             
         except Exception as e:
             db.session.rollback()
-            print(f"❌ Error completo al crear PQR:")
-            print(f"   Error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Error al crear PQR')
             
             return jsonify({
                 'error': 'Error interno del servidor al crear PQR',
@@ -310,15 +385,13 @@ def register_routes(app):
         # RESTRICCIÓN REFORZADA: Los clientes SOLO ven sus propias PQRs
         if current_user.role == 'cliente':
             query = PQR.query.filter_by(user_id=current_user.id)
-            print(f"🔒 Cliente {current_user.email} - Solo ve sus PQRs (user_id={current_user.id})")
         elif current_user.role in ['administrador', 'registrador', 'calidad']:
             # Otros roles pueden ver todas las PQRs
             query = PQR.query
-            print(f"👥 Usuario {current_user.email} ({current_user.role}) - Ve todas las PQRs")
         else:
             # Por seguridad, roles no reconocidos solo ven sus propias PQRs
             query = PQR.query.filter_by(user_id=current_user.id)
-            print(f"⚠️ Rol desconocido {current_user.role} - Solo ve sus PQRs")
+            logger.warning('Rol desconocido, solo ve sus PQRs', extra={'user_id': current_user.id, 'role': current_user.role})
 
         # Aplicar filtro de búsqueda si existe
         if search_query:
@@ -334,9 +407,10 @@ def register_routes(app):
             )
 
         # Ordenar por fecha de creación descendente
-        pqrs = query.order_by(PQR.created_at.desc()).all()
-        print(f"📊 Devolviendo {len(pqrs)} PQRs para {current_user.email}")
-        return jsonify([pqr.to_dict() for pqr in pqrs]), 200
+        # Proyección de columnas: sin objetos ORM ni consultas por autor/agente
+        pqrs = serialize_pqr_list(query.order_by(PQR.created_at.desc()))
+        logger.debug('get_pqrs', extra={'results': len(pqrs), 'search': bool(search_query)})
+        return jsonify(pqrs), 200
 
     @app.route('/api/pqrs/<pqr_id>', methods=['GET'])
     @jwt_required()
@@ -352,10 +426,67 @@ def register_routes(app):
 
         # RESTRICCIÓN REFORZADA: Validación de acceso estricta
         if current_user.role == 'cliente' and pqr.user_id != current_user.id:
-            print(f"🔒 ACCESO DENEGADO: Cliente {current_user.email} intentó acceder a PQR {pqr_id} de otro usuario")
+            logger.warning('Acceso denegado a PQR de otro usuario', extra={'user_id': current_user.id, 'pqr_id': pqr_id})
             return jsonify({"error": "Acceso denegado. Solo puedes ver tus propias PQRs."}), 403
 
-        return jsonify(pqr.to_dict()), 200
+        data = pqr.to_dict()
+        data['sla'] = sla_flags(pqr)
+        return jsonify(data), 200
+
+    @app.route('/api/pqrs/<pqr_id>/history', methods=['GET'])
+    @jwt_required()
+    def get_pqr_history(pqr_id):
+        """Historial de estado, prioridad y agente; el cliente dueño solo ve los cambios de estado"""
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        pqr = db.session.get(PQR, pqr_id)
+        if not pqr:
+            return jsonify({'error': 'PQR no encontrada'}), 404
+        if current_user.role == 'cliente' and pqr.user_id != current_user.id:
+            return jsonify({"error": "Acceso denegado. Solo puedes ver tus propias PQRs."}), 403
+
+        query = PQRStatusHistory.query.filter_by(pqr_id=pqr_id)
+        if current_user.role == 'cliente':
+            query = query.filter_by(field='status')
+        entries = query.order_by(PQRStatusHistory.changed_at, PQRStatusHistory.id).all()
+        return jsonify({'history': [entry.to_dict() for entry in entries], 'sla': sla_flags(pqr)}), 200
+
+    @app.route('/api/pqrs/<pqr_id>/duplicates', methods=['GET'])
+    @jwt_required()
+    @require_non_client
+    def get_pqr_duplicates(pqr_id):
+        """PQRs vinculadas como duplicadas y candidatas por similitud (índice LSH)"""
+        pqr = db.session.get(PQR, pqr_id)
+        if not pqr:
+            return jsonify({'error': 'PQR no encontrada'}), 404
+
+        scores = dict(similar_pqrs(pqr))
+        linked_ids = [row[0] for row in db.session.query(PQR.id).filter(PQR.duplicate_of_id == pqr.id)]
+        ids = set(scores) | set(linked_ids) | ({pqr.duplicate_of_id} if pqr.duplicate_of_id else set())
+        rows = db.session.query(PQR.id, PQR.ticket_id, PQR.subject, PQR.client_name, PQR.batch_number,
+                                PQR.status, PQR.created_at, PQR.duplicate_of_id)\
+            .filter(PQR.id.in_(ids)).all() if ids else []
+        items = [{
+            'id': row.id, 'ticket_id': row.ticket_id, 'subject': row.subject, 'client_name': row.client_name,
+            'batch_number': row.batch_number, 'status': row.status,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'similarity': round(scores[row.id], 3) if row.id in scores else None,
+            'relation': 'original' if row.id == pqr.duplicate_of_id
+            else 'duplicado' if row.duplicate_of_id == pqr.id else 'similar'
+        } for row in rows]
+        items.sort(key=lambda item: -(item['similarity'] or 0))
+        return jsonify({'pqr_id': pqr.id, 'duplicate_of_id': pqr.duplicate_of_id, 'duplicates': items}), 200
+
+    @app.route('/api/duplicates/backfill', methods=['POST'])
+    @jwt_required()
+    @require_admin
+    def backfill_duplicate_signatures():
+        """Calcular en segundo plano las firmas MinHash de las PQRs que no tienen"""
+        job = start_backfill('duplicates.backfill_signatures',
+                             f'duplicates.backfill_signatures:manual:{datetime.utcnow():%Y%m%d%H%M}')
+        db.session.commit()
+        return jsonify({'message': 'Cálculo de firmas encolado', 'job_id': job.id}), 202
 
     @app.route('/api/pqrs/<pqr_id>', methods=['PUT'])
     @jwt_required()
@@ -392,8 +523,102 @@ def register_routes(app):
             pqr.assigned_agent_id = data['assigned_agent_id']
 
         db.session.commit()
+        if 'status' in data or 'assigned_agent_id' in data:
+            invalidate_workload()
+        publish_pqr_event('pqr.updated', pqr, changes=sorted(data.keys()))
         return jsonify({'message': 'PQR actualizada exitosamente'}), 200
 
+    @app.route('/api/pqrs/bulk', methods=['PUT'])
+    @jwt_required()
+    def bulk_update_pqrs():
+        """Actualizar estado, prioridad o agente de varias PQRs en una sola transacción"""
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+
+        if current_user.role == 'cliente':
+            return jsonify({"error": "Los clientes no pueden editar PQRs una vez creadas. Contacta al departamento de calidad."}), 403
+
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids')
+        changes = data.get('changes') or {}
+
+        if not isinstance(ids, list) or not ids:
+            return jsonify({'error': 'Se requiere una lista de ids.'}), 400
+        if len(ids) > BULK_UPDATE_MAX_IDS:
+            return jsonify({'error': f'Máximo {BULK_UPDATE_MAX_IDS} PQRs por solicitud.'}), 400
+
+        # Validar el parche antes de tocar la base de datos
+        patch = {}
+        if 'status' in changes:
+            if changes['status'] not in VALID_STATUSES:
+                return jsonify({'error': f"Estado inválido: {changes['status']}"}), 400
+            patch['status'] = changes['status']
+        if 'priority' in changes:
+            if changes['priority'] not in VALID_PRIORITIES:
+                return jsonify({'error': f"Prioridad inválida: {changes['priority']}"}), 400
+            patch['priority'] = changes['priority']
+        if 'assigned_agent_id' in changes:
+            agent_id = changes['assigned_agent_id']
+            if agent_id is not None:
+                agent = db.session.get(User, agent_id)
+                if not agent or agent.role not in AGENT_ROLES:
+                    return jsonify({'error': f'Agente inválido: {agent_id}'}), 400
+            patch['assigned_agent_id'] = agent_id
+
+        if not patch:
+            return jsonify({'error': 'No se indicaron cambios (status, priority, assigned_agent_id).'}), 400
+
+        ids = list(dict.fromkeys(str(pqr_id) for pqr_id in ids))
+
+        # Permisos por conjunto: una sola consulta para todas las PQRs solicitadas
+        rows = db.session.query(PQR.id, PQR.ticket_id, PQR.user_id, PQR.customer_id, PQR.assigned_agent_id,
+                                PQR.status, PQR.priority, PQR.created_at, PQR.status_changed_at,
+                                PQR.first_response_at).filter(PQR.id.in_(ids)).all()
+        rows_by_id = {row.id: row for row in rows}
+        owners = {row.id: row.assigned_agent_id for row in rows}
+
+        results = {}
+        allowed_ids = []
+        for pqr_id in ids:
+            if pqr_id not in owners:
+                results[pqr_id] = 'not_found'
+            elif current_user.role != 'administrador' and owners[pqr_id] != current_user.id:
+                results[pqr_id] = 'forbidden'
+            else:
+                results[pqr_id] = 'updated'
+                allowed_ids.append(pqr_id)
+
+        if allowed_ids:
+            try:
+                # Historial y fechas SLA por fila en la misma transacción que el cambio
+                apply_bulk_changes([rows_by_id[pqr_id] for pqr_id in allowed_ids], patch,
+                                   actor_id=current_user.id)
+                db.session.commit()
+                invalidate_workload()
+            except Exception as e:
+                db.session.rollback()
+                return jsonify({'error': 'Error interno del servidor', 'details': str(e)}), 500
+
+            for pqr_id in allowed_ids:
+                row = rows_by_id[pqr_id]
+                broker.publish(
+                    'pqr.updated',
+                    pqr_id=row.id,
+                    ticket_id=row.ticket_id,
+                    owner_id=row.user_id,
+                    assigned_agent_id=patch.get('assigned_agent_id', row.assigned_agent_id),
+                    status=patch.get('status', row.status),
+                    customer_id=row.customer_id,
+                    changes=sorted(patch)
+                )
+
+        return jsonify({
+            'message': f'{len(allowed_ids)} PQRs actualizadas',
+            'updated': len(allowed_ids),
+            'results': [{'id': pqr_id, 'result': result} for pqr_id, result in results.items()]
+        }), 200
+
     @app.route('/api/pqrs/<pqr_id>/comments', methods=['GET'])
     @jwt_required()
     def get_pqr_comments(pqr_id):
@@ -411,15 +636,62 @@ def register_routes(app):
             return jsonify({"error": "Acceso denegado. Solo puedes ver comentarios de tus propias PQRs."}), 403
 
         # Obtener comentarios, filtrar internos si es cliente
-        comments_query = PQRComment.query.filter_by(pqr_id=pqr_id)
-        if current_user.role == 'cliente':
-            # Los clientes NO ven comentarios internos
-            comments_query = comments_query.filter_by(is_internal=False)
-            print(f"🔒 Cliente {current_user.email} - Solo ve comentarios públicos")
-        
+        comments_query = visible_comments_query(pqr_id, current_user)
+
         comments = comments_query.order_by(PQRComment.created_at.asc()).all()
         return jsonify([comment.to_dict() for comment in comments]), 200
 
+    @app.route('/api/pqrs/<pqr_id>/comments/timeline', methods=['GET'])
+    @jwt_required()
+    def get_pqr_comment_timeline(pqr_id):
+        """Línea de tiempo paginada de comentarios con consulta incremental (since_id / since)"""
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+
+        # Solo se necesita el dueño para validar acceso, no la PQR completa
+        owner = db.session.query(PQR.user_id).filter(PQR.id == pqr_id).first()
+        if not owner:
+            return jsonify({'error': 'PQR no encontrada'}), 404
+
+        if current_user.role == 'cliente' and owner.user_id != current_user.id:
+            return jsonify({"error": "Acceso denegado. Solo puedes ver comentarios de tus propias PQRs."}), 403
+
+        limit = min(max(request.args.get('limit', COMMENTS_PAGE_SIZE, type=int), 1), COMMENTS_MAX_PAGE_SIZE)
+        since_id = request.args.get('since_id', type=int)
+        before_id = request.args.get('before_id', type=int)
+        since = request.args.get('since', '').strip()
+
+        comments_query = visible_comments_query(pqr_id, current_user)
+
+        if since_id is not None or since:
+            # Refresco incremental: solo comentarios nuevos, en orden cronológico
+            if since_id is not None:
+                comments_query = comments_query.filter(PQRComment.id > since_id)
+            if since:
+                try:
+                    since_dt = datetime.fromisoformat(since)
+                except ValueError:
+                    return jsonify({'error': f'Fecha inválida en since: {since}'}), 400
+                comments_query = comments_query.filter(PQRComment.created_at > since_dt)
+            comments = comments_query.order_by(PQRComment.id.asc()).limit(limit + 1).all()
+            has_more = len(comments) > limit
+            comments = comments[:limit]
+        else:
+            # Página más reciente (o anterior a before_id), devuelta en orden cronológico
+            if before_id is not None:
+                comments_query = comments_query.filter(PQRComment.id < before_id)
+            comments = comments_query.order_by(PQRComment.id.desc()).limit(limit + 1).all()
+            has_more = len(comments) > limit
+            comments = list(reversed(comments[:limit]))
+
+        return jsonify({
+            'comments': [comment.to_dict() for comment in comments],
+            'has_more': has_more,
+            'oldest_id': comments[0].id if comments else None,
+            'latest_id': comments[-1].id if comments else since_id
+        }), 200
+
     @app.route('/api/pqrs/<pqr_id>/comments', methods=['POST'])
     @jwt_required()
     def add_comment_to_pqr(pqr_id):
@@ -442,7 +714,7 @@ def register_routes(app):
         # RESTRICCIÓN: Los clientes NO pueden crear comentarios internos
         if current_user.role == 'cliente' and is_internal:
             is_internal = False
-            print(f"🔒 Cliente {current_user.email} - Comentario convertido a público automáticamente")
+            logger.debug('Comentario de cliente convertido a público', extra={'user_id': current_user.id, 'pqr_id': pqr_id})
 
         if not comment_text:
             return jsonify({"error": "Se requiere un comentario."}), 400
@@ -458,11 +730,58 @@ def register_routes(app):
         db.session.add(new_comment)
         db.session.commit()
         
+        publish_pqr_event('comment.created', pqr, comment_id=new_comment.id, internal=is_internal)
+        
         return jsonify({
             'message': 'Comentario añadido exitosamente', 
             'comment': new_comment.to_dict()
         }), 201
 
+    @app.route('/api/events/stream', methods=['GET'])
+    # EventSource no puede enviar headers: solo esta ruta acepta el token en la URL
+    @jwt_required(locations=['query_string'])
+    def events_stream():
+        """Stream SSE de eventos de PQRs y comentarios, filtrados según el rol del usuario"""
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+
+        if not stream_slots.acquire(blocking=False):
+            # Sin cupo: el SPA pasa a consultar periódicamente y reintenta el stream más tarde
+            retry_after = current_app.config.get('EVENTS_RETRY_AFTER_SECONDS', 60)
+            response = jsonify({'error': 'Demasiadas conexiones de eventos abiertas.', 'retry_after': retry_after})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+
+        subscription = broker.subscribe(current_user.id, current_user.role)
+        stream_timeout = current_app.config.get('EVENTS_STREAM_TIMEOUT', 300)
+        heartbeat = current_app.config.get('EVENTS_HEARTBEAT_SECONDS', 15)
+
+        def generate():
+            # La conexión se cierra tras stream_timeout; EventSource reconecta solo
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + stream_timeout
+            while time.monotonic() < deadline:
+                try:
+                    event = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(event)
+
+        def release():
+            broker.unsubscribe(subscription)
+            stream_slots.release()
+
+        response = Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        # Al cerrar la respuesta (fin, desconexión o sin haber empezado a iterar) se libera el cupo
+        response.call_on_close(release)
+        return response
+
     @app.route('/uploads/<filename>')
     def uploaded_file(filename):
         return send_from_directory(UPLOAD_FOLDER, filename)
@@ -487,8 +806,6 @@ def register_routes(app):
                 pqr_types = db.session.query(PQR.type, db.func.count(PQR.id))\
                     .filter_by(user_id=current_user.id)\
                     .group_by(PQR.type).all()
-                
-                print(f"📊 Cliente {current_user.email} - Estadísticas propias: {total_pqrs} PQRs")
             else:
                 # Otros roles ven estadísticas globales
                 total_pqrs = PQR.query.count()
@@ -499,8 +816,6 @@ def register_routes(app):
                 # PQRs por tipo globales
                 pqr_types = db.session.query(PQR.type, db.func.count(PQR.id))\
                     .group_by(PQR.type).all()
-                
-                print(f"📊 Usuario {current_user.email} ({current_user.role}) - Estadísticas globales: {total_pqrs} PQRs")
 
             type_labels = [item[0] for item in pqr_types] if pqr_types else []
             type_data = [item[1] for item in pqr_types] if pqr_types else []
@@ -508,12 +823,14 @@ def register_routes(app):
             # PQRs por agente (NO disponible para clientes)
             agent_labels = []
             agent_data = []
+            cluster_alerts_open = 0
             if current_user.role in ['administrador', 'calidad', 'registrador']:
                 pqr_agents = db.session.query(User.name, db.func.count(PQR.id))\
                     .join(PQR, User.id == PQR.assigned_agent_id)\
                     .group_by(User.name).all()
                 agent_labels = [item[0] for item in pqr_agents] if pqr_agents else []
                 agent_data = [item[1] for item in pqr_agents] if pqr_agents else []
+                cluster_alerts_open = ComplaintAlert.query.filter_by(status='abierta').count()
 
             stats = {
                 "total_pqrs": total_pqrs,
@@ -528,6 +845,7 @@ def register_routes(app):
                     "labels": agent_labels,
                     "data": agent_data
                 },
+                "cluster_alerts_open": cluster_alerts_open,
                 # Agregar información específica para clientes
                 "user_role": current_user.role,
                 "is_client_view": current_user.role == 'cliente'
@@ -535,16 +853,87 @@ def register_routes(app):
             return jsonify(stats), 200
             
         except Exception as e:
-            print(f"Error al obtener estadísticas: {e}")
+            logger.exception('Error al obtener estadísticas')
             return jsonify({"error": "Error interno del servidor"}), 500
 
+    @app.route('/api/sla/overdue', methods=['GET'])
+    @jwt_required()
+    @require_non_client
+    def get_overdue_pqrs():
+        """PQRs abiertas con SLA vencido o por vencer (due_within_hours), las más atrasadas primero"""
+        current_user = get_current_user()
+        due_within_hours = max(request.args.get('due_within_hours', 0, type=float), 0)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        query = overdue_query(due_within_hours=due_within_hours)
+        if request.args.get('mine') in ('1', 'true'):
+            query = query.filter(PQR.assigned_agent_id == current_user.id)
+        pqrs = query.order_by(PQR.sla_due_at).limit(limit).all()
+
+        now = datetime.utcnow()
+        items = []
+        for pqr in pqrs:
+            item = {field: getattr(pqr, field) for field in (
+                'id', 'ticket_id', 'type', 'subject', 'client_name', 'product_name', 'status', 'priority',
+                'assigned_agent_id')}
+            for field in ('created_at', 'response_due_at', 'sla_due_at'):
+                value = getattr(pqr, field)
+                item[field] = value.isoformat() if value else None
+            item.update(sla_flags(pqr, now))
+            items.append(item)
+        return jsonify({'pqrs': items, 'count': len(items)}), 200
+
+    @app.route('/api/sla/summary', methods=['GET'])
+    @jwt_required()
+    @require_non_client
+    def get_sla_summary():
+        """Tiempo en estado, cumplimiento de resolución y percentiles por agente"""
+        days = min(max(request.args.get('days', 30, type=int), 1), 365)
+        return jsonify(sla_summary(days=days)), 200
+
+    @app.route('/api/quality/alerts', methods=['GET'])
+    @jwt_required()
+    @require_non_client
+    def get_cluster_alerts():
+        """Alertas de clústeres de PQRs por lote/producto para el tablero de calidad"""
+        status = request.args.get('status', 'abierta')
+        if status not in ALERT_STATUSES:
+            return jsonify({'error': f'Estado inválido. Use: {", ".join(ALERT_STATUSES)}'}), 400
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        alerts = ComplaintAlert.query.filter_by(status=status)\
+            .order_by(ComplaintAlert.created_at.desc()).limit(max(limit, 1)).all()
+        return jsonify({'alerts': [alert.to_dict() for alert in alerts]}), 200
+
+    @app.route('/api/quality/alerts/<int:alert_id>', methods=['PUT'])
+    @jwt_required()
+    @require_non_client
+    def update_cluster_alert(alert_id):
+        """Marcar una alerta como revisada o descartada"""
+        alert = db.session.get(ComplaintAlert, alert_id)
+        if not alert:
+            return jsonify({'error': 'Alerta no encontrada'}), 404
+        status = (request.get_json() or {}).get('status')
+        if status not in ALERT_STATUSES:
+            return jsonify({'error': f'Estado inválido. Use: {", ".join(ALERT_STATUSES)}'}), 400
+        alert.status = status
+        db.session.commit()
+        return jsonify(alert.to_dict()), 200
+
+    @app.route('/api/quality/alerts/rescan', methods=['POST'])
+    @jwt_required()
+    @require_admin
+    def rescan_cluster_alerts():
+        """Reprocesar toda la historia de PQRs (p. ej. tras cambiar la ventana o el umbral)"""
+        job = enqueue('quality.cluster_scan', {'rebuild': True},
+                      idempotency_key=f'quality.cluster_scan:rebuild:{datetime.utcnow():%Y%m%d%H%M}')
+        db.session.commit()
+        return jsonify({'message': 'Reproceso de clústeres encolado', 'job_id': job.id}), 202
+
     @app.route('/api/users', methods=['GET'])
     @jwt_required()
     @require_admin  # SOLO ADMINISTRADORES
     def get_users():
         try:
             users = User.query.all()
-            print(f"👥 Administrador consultó lista de usuarios: {len(users)} usuarios")
             return jsonify([user.to_dict() for user in users]), 200
         except Exception as e:
             return jsonify({"error": "Error interno del servidor"}), 500
@@ -582,11 +971,11 @@ def register_routes(app):
 
             # Crear usuario
             new_user = User(email=email, name=name, role=role)
-            new_user.set_password(password)
+            new_user.password_hash = hash_password(password)
             db.session.add(new_user)
             db.session.commit()
             
-            print(f"👤 Administrador creó usuario: {email} ({role})")
+            logger.info('Usuario creado por administrador', extra={'new_user_id': new_user.id, 'new_user_role': role})
             
             return jsonify({
                 'message': 'Usuario creado exitosamente',
@@ -595,31 +984,35 @@ def register_routes(app):
             
         except Exception as e:
             db.session.rollback()
-            print(f"Error creando usuario: {e}")
+            logger.exception('Error creando usuario')
             return jsonify({
                 'error': 'Error interno del servidor',
                 'details': str(e)
             }), 500
 
+    @app.route('/api/admin/sql-profile', methods=['GET', 'DELETE'])
+    @jwt_required()
+    @require_admin  # SOLO ADMINISTRADORES
+    def sql_profile():
+        """Rutas con más tiempo en base de datos según el perfilador SQL (por worker)"""
+        if not current_app.config.get('PROFILER_ENABLED'):
+            return jsonify({'error': 'Perfilador SQL desactivado (PROFILER_ENABLED=false)'}), 404
+        if request.method == 'DELETE':
+            profiler.reset()
+            return jsonify({'message': 'Estadísticas del perfilador reiniciadas'}), 200
+        limit = min(request.args.get('limit', 10, type=int), 100)
+        return jsonify(profiler.top_offenders(limit)), 200
+
     @app.route('/api/agents', methods=['GET'])
     @jwt_required()
     @require_non_client  # CLIENTES NO PUEDEN VER AGENTES
     def get_agents():
-        """Endpoint para obtener lista de agentes - NO disponible para clientes"""
+        """Endpoint para obtener lista de agentes con su carga de trabajo - NO disponible para clientes"""
         try:
-            # Obtener usuarios que pueden ser agentes (no clientes)
-            agents = User.query.filter(User.role.in_(['administrador', 'calidad', 'registrador'])).all()
-            
-            agents_list = []
-            for agent in agents:
-                agent_info = agent.to_dict()
-                # Agregar estadísticas del agente
-                assigned_pqrs = PQR.query.filter_by(assigned_agent_id=agent.id).count()
-                agent_info['assigned_pqrs_count'] = assigned_pqrs
-                agents_list.append(agent_info)
-            
-            return jsonify(agents_list), 200
+            # Una consulta agrupada (cacheada) en lugar de un count() por agente
+            return jsonify(agent_workload()), 200
         except Exception as e:
+            logger.exception('Error obteniendo agentes')
             return jsonify({"error": "Error interno del servidor"}), 500
 
     @app.route('/api/test-openai', methods=['GET'])
@@ -682,6 +1075,7 @@ def register_routes(app):
     def ai_chat():
         data = request.get_json()
         user_message = data.get('message')
+        conversation_id = data.get('conversation_id')
 
         if not user_message:
             return jsonify({"error": "Mensaje vacío"}), 400
@@ -698,23 +1092,62 @@ def register_routes(app):
             current_user = get_current_user()
             if not current_user:
                 return jsonify({"error": "Usuario no encontrado"}), 404
+
+            # Detectar tipo de consulta para dar respuestas más específicas (antes de armar el contexto:
+            # un saludo no paga la búsqueda de PQRs relacionadas ni la consulta de SLA)
+            message_lower = user_message.lower()
+            
+            # Respuestas específicas para clientes
+            if current_user.role == 'cliente':
+                if any(word in message_lower for word in ['usuario', 'agente', 'administr', 'otros', 'ver todo']):
+                    quick_response = f"🔒 Como cliente, solo tienes acceso a tus propias PQRs y funciones de registro.\n\nPuedo ayudarte con:\n• 📝 Cómo registrar nuevas PQRs\n• 🔍 Seguimiento de tus PQRs\n• 📎 Documentos requeridos\n• 📊 Estado de tus solicitudes\n\n¿En qué más puedo ayudarte con tus PQRs?"
+                    return jsonify({"reply": quick_response}), 200
+            
+            # Respuestas rápidas para consultas comunes
+            if any(word in message_lower for word in ['hola', 'buenas', 'ayuda', 'hi', 'hello']):
+                if current_user.role == 'cliente':
+                    quick_response = f"¡Hola {current_user.name}! 👋 Soy tu asistente para el sistema PQR.\n\n🔧 Como cliente, puedo ayudarte con:\n\n• 📝 Registro de nuevas PQRs\n• 🔍 Seguimiento de tus PQRs\n• 📎 Documentación requerida\n• 📊 Estado de tus solicitudes\n• 📋 Información sobre procesos\n\n¿En qué puedo ayudarte específicamente?"
+                else:
+                    quick_response = f"¡Hola {current_user.name}! 👋 Soy tu asistente para el sistema PQR.\n\n🔧 Como {current_user.role}, puedo ayudarte con:\n\n• 📝 Gestión completa de PQRs\n• 👥 Administración de usuarios\n• 📊 Estadísticas y reportes\n• 🔍 Procesos de calidad\n• 📋 Trazabilidad de productos\n\n¿En qué puedo ayudarte?"
+                return jsonify({"reply": quick_response}), 200
+
+            # Conversación previa: en una pregunta de seguimiento la anterior aporta los términos de búsqueda
+            chat_session = load_session(conversation_id, current_user.id)
+            retrieval_query = f"{last_user_message(chat_session) or ''} {user_message}"
             
             # CONTEXTO ESPECÍFICO SEGÚN ROL
             if current_user.role == 'cliente':
                 # Para clientes: solo información de sus propias PQRs
-                recent_pqrs = PQR.query.filter_by(user_id=current_user.id).order_by(PQR.created_at.desc()).limit(3).all()
+                related_pqrs = retrieve_related_pqrs(retrieval_query, owner_id=current_user.id)
+                recent_pqrs = [] if related_pqrs else PQR.query.filter_by(user_id=current_user.id).order_by(PQR.created_at.desc()).limit(3).all()
                 role_context = "Eres un asistente para CLIENTES. Solo puedes ayudar con información relacionada a las PQRs del cliente actual. No proporciones información sobre otros clientes o funciones administrativas."
             else:
                 # Para personal interno: información más amplia
-                recent_pqrs = PQR.query.order_by(PQR.created_at.desc()).limit(5).all()
+                related_pqrs = retrieve_related_pqrs(retrieval_query)
+                recent_pqrs = [] if related_pqrs else PQR.query.order_by(PQR.created_at.desc()).limit(5).all()
                 role_context = f"Eres un asistente para personal interno ({current_user.role}). Puedes proporcionar información sobre gestión de PQRs, procesos internos y funciones administrativas según el rol del usuario."
             
-            # Crear contexto con información relevante
+            # Crear contexto con información relevante: las PQRs que responden a la pregunta; si no hay, las recientes
             pqr_context = ""
-            if recent_pqrs:
+            if related_pqrs:
+                pqr_context = f"\n\nPQRs relacionadas con la consulta{' (del cliente)' if current_user.role == 'cliente' else ''}:\n"
+                for pqr, reply, _ in related_pqrs:
+                    pqr_context += f"- {pqr.ticket_id}: {pqr.type} de {pqr.client_name} sobre {pqr.product_name} (Estado: {pqr.status}). " \
+                                   f"{snippet(pqr.subject)}: {snippet(pqr.description)}"
+                    pqr_context += f" Última respuesta: {snippet(reply)}\n" if reply else "\n"
+            elif recent_pqrs:
                 pqr_context = f"\n\nPQRs recientes {'del cliente' if current_user.role == 'cliente' else 'en el sistema'}:\n"
                 for pqr in recent_pqrs:
                     pqr_context += f"- {pqr.ticket_id}: {pqr.type} de {pqr.client_name} sobre {pqr.product_name} (Estado: {pqr.status})\n"
+            if current_user.role != 'cliente':
+                # "¿Qué PQRs requieren atención urgente?": vencidas o por vencer en 24 h según el SLA
+                urgent_pqrs = overdue_query(due_within_hours=24).order_by(PQR.sla_due_at).limit(5).all()
+                if urgent_pqrs:
+                    pqr_context += "\n\nPQRs con SLA vencido o por vencer (más atrasadas primero):\n"
+                    for pqr in urgent_pqrs:
+                        flags = sla_flags(pqr)
+                        pqr_context += f"- {pqr.ticket_id}: prioridad {pqr.priority}, estado {pqr.status}, " \
+                                       f"vence {pqr.sla_due_at:%Y-%m-%d %H:%M} ({flags['hours_to_due']} h)\n"
             
             # Contexto específico para el asistente de PQR
             system_context = f"""
@@ -741,35 +1174,32 @@ def register_routes(app):
             {pqr_context}
             """
 
-            # Detectar tipo de consulta para dar respuestas más específicas
-            message_lower = user_message.lower()
-            
-            # Respuestas específicas para clientes
-            if current_user.role == 'cliente':
-                if any(word in message_lower for word in ['usuario', 'agente', 'administr', 'otros', 'ver todo']):
-                    quick_response = f"🔒 Como cliente, solo tienes acceso a tus propias PQRs y funciones de registro.\n\nPuedo ayudarte con:\n• 📝 Cómo registrar nuevas PQRs\n• 🔍 Seguimiento de tus PQRs\n• 📎 Documentos requeridos\n• 📊 Estado de tus solicitudes\n\n¿En qué más puedo ayudarte con tus PQRs?"
-                    return jsonify({"reply": quick_response}), 200
-            
-            # Respuestas rápidas para consultas comunes
-            if any(word in message_lower for word in ['hola', 'buenas', 'ayuda', 'hi', 'hello']):
-                if current_user.role == 'cliente':
-                    quick_response = f"¡Hola {current_user.name}! 👋 Soy tu asistente para el sistema PQR.\n\n🔧 Como cliente, puedo ayudarte con:\n\n• 📝 Registro de nuevas PQRs\n• 🔍 Seguimiento de tus PQRs\n• 📎 Documentación requerida\n• 📊 Estado de tus solicitudes\n• 📋 Información sobre procesos\n\n¿En qué puedo ayudarte específicamente?"
-                else:
-                    quick_response = f"¡Hola {current_user.name}! 👋 Soy tu asistente para el sistema PQR.\n\n🔧 Como {current_user.role}, puedo ayudarte con:\n\n• 📝 Gestión completa de PQRs\n• 👥 Administración de usuarios\n• 📊 Estadísticas y reportes\n• 🔍 Procesos de calidad\n• 📋 Trazabilidad de productos\n\n¿En qué puedo ayudarte?"
-                return jsonify({"reply": quick_response}), 200
+            # Memoria de la conversación: resumen de lo antiguo y turnos recientes dentro del presupuesto de tokens
+            if chat_session is None:
+                chat_session = start_session(current_user.id)
+            summary, history = history_messages(chat_session)
+            if summary:
+                system_context += f"\nResumen de la conversación hasta ahora: {summary}\n"
 
             # Llamada a OpenAI usando la nueva API
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_context},
-                    {"role": "user", "content": user_message}
-                ],
-                max_tokens=800,
-                temperature=0.7,
-                presence_penalty=0.1,
-                frequency_penalty=0.1
-            )
+            openai_started = time.perf_counter()
+            try:
+                response = openai_client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": system_context},
+                        *history,
+                        {"role": "user", "content": user_message}
+                    ],
+                    max_tokens=800,
+                    temperature=0.7,
+                    presence_penalty=0.1,
+                    frequency_penalty=0.1
+                )
+            except Exception as e:
+                observe_openai_call('ai_chat', time.perf_counter() - openai_started, error=e)
+                raise
+            observe_openai_call('ai_chat', time.perf_counter() - openai_started, response=response)
             
             reply = response.choices[0].message.content.strip()
             
@@ -777,12 +1207,17 @@ def register_routes(app):
             if len(reply) > 600:
                 # Si la respuesta es muy larga, resumirla un poco
                 reply = reply[:600] + "...\n\n❓ ¿Te gustaría que profundice en algún punto específico?"
+
+            if chat_session is not None:
+                record_exchange(chat_session, user_message, reply)
+                db.session.commit()
+                return jsonify({"reply": reply, "conversation_id": chat_session.id}), 200
             
             return jsonify({"reply": reply}), 200
             
         except Exception as e:
             error_msg = str(e)
-            print(f"Error inesperado con OpenAI: {e}")
+            logger.exception('Error inesperado con OpenAI')
             
             # Respuestas específicas según el tipo de error
             if "api_key" in error_msg.lower():
@@ -874,5 +1309,5 @@ def register_routes(app):
             return jsonify({"suggestions": suggestions}), 200
             
         except Exception as e:
-            print(f"Error obteniendo sugerencias: {e}")
+            logger.exception('Error obteniendo sugerencias')
             return jsonify({"suggestions": []}), 200
\ No newline at end of file
@@ -0,0 +1,56 @@
+# schema.py - Completar tablas existentes con columnas e índices nuevos (db.create_all solo crea tablas faltantes)
+from sqlalchemy import inspect, text
+
+from logging_config import get_logger
+
+logger = get_logger('schema')
+
+# Llave del advisory lock de PostgreSQL que serializa la sincronización entre procesos
+SCHEMA_LOCK_KEY = 7240431
+
+
+def _column_ddl(column, dialect):
+    """Definición de columna con su referencia (FOREIGN KEY en línea, válido en PostgreSQL y SQLite)"""
+    quote = dialect.identifier_preparer.quote
+    ddl = f'{quote(column.name)} {column.type.compile(dialect=dialect)}'
+    if column.foreign_keys:
+        fk = next(iter(column.foreign_keys))
+        ddl += f' REFERENCES {quote(fk.column.table.name)}({quote(fk.column.name)})'
+    return ddl
+
+
+def sync_schema(engine, metadata):
+    """Agregar columnas anulables e índices declarados en los modelos que aún no existen en la base.
+
+    Solo cubre cambios aditivos (columnas nuevas con NULL permitido e índices);
+    renombres o cambios de tipo siguen requiriendo una migración manual.
+    """
+    added = []
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            # Los workers de gunicorn arrancan a la vez: uno aplica los cambios, los demás esperan y ven el resultado
+            conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if not column.nullable:
+                    logger.warning('Columna obligatoria sin migración', extra={'table': table.name, 'column': column.name})
+                    continue
+                table_name = engine.dialect.identifier_preparer.quote(table.name)
+                conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {_column_ddl(column, engine.dialect)}'))
+                added.append(f'{table.name}.{column.name}')
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+                    added.append(index.name)
+    if added:
+        logger.info('Esquema actualizado', extra={'added': added})
+    return added
@@ -0,0 +1,108 @@
+# serialization.py - Proveedor JSON rápido (orjson) y proyección de columnas sin objetos ORM
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.orm import aliased
+
+from logging_config import get_logger
+from models import User, PQR
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+logger = get_logger('serialization')
+
+# Campos de PQR.to_dict() que salen directo de columnas de la tabla
+PQR_COLUMN_FIELDS = (
+    'id', 'ticket_id', 'user_id', 'type', 'subject', 'description', 'product_name', 'batch_number',
+    'expiration_date', 'lot_id', 'quantity_grams', 'devolution_type', 'client_name', 'client_email', 'customer_id',
+    'duplicate_of_id', 'duplicate_score', 'ideal_temperature_range', 'status', 'priority', 'assigned_agent_id',
+    'status_changed_at', 'first_response_at', 'resolved_at', 'response_due_at', 'sla_due_at', 'created_at',
+    'updated_at'
+)
+PQR_LIST_FIELDS = PQR_COLUMN_FIELDS + ('author_name', 'assigned_agent_name')
+
+
+def _default(obj):
+    """Tipos que orjson no serializa de forma nativa"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Objeto de tipo {type(obj).__name__} no serializable a JSON')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask sobre orjson: datetime, date y UUID nativos, salida en bytes"""
+
+    # El frontend no depende del orden de las llaves; ordenar cuesta en listados grandes
+    sort_keys = False
+
+    def _options(self, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=self._options(pretty=self._app.debug)), mimetype=self.mimetype)
+
+
+def native_datetimes():
+    """True si el proveedor JSON activo serializa fechas en ISO 8601 sin conversión previa"""
+    return isinstance(current_app.json, FastJSONProvider)
+
+
+def project_rows(rows, fields):
+    """Tuplas de columnas -> dicts; con el proveedor stdlib las fechas se pasan a isoformat como en to_dict()"""
+    if native_datetimes():
+        return [dict(zip(fields, row)) for row in rows]
+    result = []
+    for row in rows:
+        item = {}
+        for field, value in zip(fields, row):
+            item[field] = value.isoformat() if isinstance(value, (datetime, date)) else value
+        result.append(item)
+    return result
+
+
+def pqr_list_query(query):
+    """Proyectar una consulta de PQR a las columnas de to_dict() con nombres de autor y agente por JOIN"""
+    author = aliased(User)
+    agent = aliased(User)
+    columns = [getattr(PQR, field) for field in PQR_COLUMN_FIELDS]
+    return query.outerjoin(author, PQR.user_id == author.id)\
+        .outerjoin(agent, PQR.assigned_agent_id == agent.id)\
+        .with_entities(*columns, author.name, agent.name)
+
+
+def serialize_pqr_list(query):
+    """Lista de PQRs equivalente a [pqr.to_dict() ...] sin construir objetos ORM"""
+    return project_rows(pqr_list_query(query).all(), PQR_LIST_FIELDS)
+
+
+def init_json(app):
+    """Activar el proveedor orjson (JSON_PROVIDER=auto|orjson|stdlib)"""
+    choice = app.config.get('JSON_PROVIDER', 'auto')
+    if choice == 'stdlib':
+        return
+    if not ORJSON_AVAILABLE:
+        if choice == 'orjson':
+            logger.warning('JSON_PROVIDER=orjson pero orjson no está instalado; se usa json estándar')
+        return
+    app.json = FastJSONProvider(app)
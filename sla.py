@@ -0,0 +1,301 @@
+# sla.py - Historial de estados de PQRs y motor de SLA (tiempo en estado, vencimientos y percentiles por agente)
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from jobs import BACKFILL_BATCH_SIZE, BACKFILL_MAX_BATCHES_PER_JOB, backfill_by_id
+from logging_config import get_logger
+from models import db, AgentResolutionBucket, PQR, PQRStatusHistory, User
+
+logger = get_logger('sla')
+
+TRACKED_FIELDS = ('status', 'priority', 'assigned_agent_id')
+OPEN_STATUSES = ['abierto', 'en_proceso']
+CLOSED_STATUS = 'cerrado'
+# Horas para la primera respuesta (salir de "abierto") y para el cierre, según prioridad
+RESPONSE_HOURS = {'alta': 4, 'media': 24, 'baja': 48}
+RESOLUTION_HOURS = {'alta': 48, 'media': 120, 'baja': 240}
+DEFAULT_PRIORITY = 'media'
+# Límites superiores (horas) del histograma de resolución; la última cubeta es "más de 720 h"
+RESOLUTION_BUCKETS_HOURS = (1, 2, 4, 8, 12, 24, 48, 72, 120, 168, 240, 336, 504, 720)
+PERCENTILES = (50, 90)
+
+
+def due_dates(created_at, priority):
+    priority = priority if priority in RESPONSE_HOURS else DEFAULT_PRIORITY
+    return {
+        'response_due_at': created_at + timedelta(hours=RESPONSE_HOURS[priority]),
+        'sla_due_at': created_at + timedelta(hours=RESOLUTION_HOURS[priority])
+    }
+
+
+def resolution_bucket(seconds):
+    hours = seconds / 3600
+    for index, limit in enumerate(RESOLUTION_BUCKETS_HOURS):
+        if hours <= limit:
+            return index
+    return len(RESOLUTION_BUCKETS_HOURS)
+
+
+def _as_text(value):
+    return None if value is None else str(value)
+
+
+def plan_transition(current, changes, now):
+    """Efectos de un cambio sobre una PQR: (columnas SLA a actualizar, entradas de historial, muestras de resolución).
+
+    `current` trae los valores previos (status, priority, assigned_agent_id,
+    created_at, status_changed_at, first_response_at); `changes` los nuevos.
+    Lo usan tanto el listener del ORM como las actualizaciones masivas.
+    """
+    updates = {}
+    entries = []
+    samples = []
+    created_at = current.get('created_at') or now
+    for field in TRACKED_FIELDS:
+        if field not in changes or changes[field] == current.get(field):
+            continue
+        old, new = current.get(field), changes[field]
+        entry = {'field': field, 'old_value': _as_text(old), 'new_value': _as_text(new),
+                 'duration_seconds': None, 'changed_at': now}
+        if field == 'status':
+            since = current.get('status_changed_at') or created_at
+            entry['duration_seconds'] = max((now - since).total_seconds(), 0)
+            updates['status_changed_at'] = now
+            if old == 'abierto' and not current.get('first_response_at'):
+                updates['first_response_at'] = now
+            if new == CLOSED_STATUS:
+                updates['resolved_at'] = now
+                agent_id = changes.get('assigned_agent_id', current.get('assigned_agent_id'))
+                if agent_id:
+                    samples.append((agent_id, max((now - created_at).total_seconds(), 0)))
+            elif old == CLOSED_STATUS:
+                # Reabierta: vuelve a contar para el SLA
+                updates['resolved_at'] = None
+        elif field == 'priority':
+            updates.update(due_dates(created_at, new))
+        entries.append(entry)
+    return updates, entries, samples
+
+
+def record_samples(connection, samples):
+    """Sumar resoluciones al histograma por agente con un upsert por (agente, cubeta)"""
+    totals = defaultdict(lambda: [0, 0.0])
+    for agent_id, seconds in samples:
+        total = totals[(agent_id, resolution_bucket(seconds))]
+        total[0] += 1
+        total[1] += seconds
+    insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    table = AgentResolutionBucket.__table__
+    for (agent_id, bucket), (count, seconds) in totals.items():
+        stmt = insert(table).values(agent_id=agent_id, bucket=bucket, resolved_count=count, total_seconds=seconds)
+        connection.execute(stmt.on_conflict_do_update(index_elements=['agent_id', 'bucket'], set_={
+            'resolved_count': table.c.resolved_count + stmt.excluded.resolved_count,
+            'total_seconds': table.c.total_seconds + stmt.excluded.total_seconds
+        }))
+
+
+def current_actor_id():
+    """Usuario del JWT de la petición en curso; None en trabajos de la cola o sin petición"""
+    try:
+        from flask_jwt_extended import get_jwt_identity
+        identity = get_jwt_identity()
+        return int(identity) if identity else None
+    except Exception:
+        return None
+
+
+def _previous(state, attr):
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.obj(), attr)
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_pqr_changes(session, flush_context, instances):
+    """Historial y columnas SLA de las PQRs creadas o modificadas por el ORM en este flush"""
+    now = None
+    actor_id = None
+    samples = []
+    for obj in list(session.new):
+        if not isinstance(obj, PQR):
+            continue
+        now = now or datetime.utcnow()
+        actor_id = actor_id or current_actor_id()
+        # Los defaults de columna aún no se aplicaron: se fijan aquí para calcular las fechas límite
+        obj.created_at = obj.created_at or now
+        obj.status = obj.status or PQR.__table__.c.status.default.arg
+        obj.priority = obj.priority or PQR.__table__.c.priority.default.arg
+        obj.status_changed_at = obj.created_at
+        for key, value in due_dates(obj.created_at, obj.priority).items():
+            setattr(obj, key, value)
+        session.add(PQRStatusHistory(pqr=obj, field='status', new_value=obj.status,
+                                     changed_by_id=actor_id, changed_at=obj.created_at))
+
+    for obj in list(session.dirty):
+        if not isinstance(obj, PQR) or not session.is_modified(obj):
+            continue
+        state = inspect(obj)
+        changed = [field for field in TRACKED_FIELDS if state.attrs[field].history.has_changes()]
+        if not changed:
+            continue
+        now = now or datetime.utcnow()
+        actor_id = actor_id or current_actor_id()
+        current = {field: _previous(state, field) for field in TRACKED_FIELDS}
+        current.update({'created_at': obj.created_at, 'status_changed_at': obj.status_changed_at,
+                        'first_response_at': obj.first_response_at})
+        updates, entries, pqr_samples = plan_transition(
+            current, {field: getattr(obj, field) for field in changed}, now)
+        for key, value in updates.items():
+            setattr(obj, key, value)
+        for entry in entries:
+            session.add(PQRStatusHistory(pqr=obj, changed_by_id=actor_id, **entry))
+        samples.extend(pqr_samples)
+
+    if samples:
+        record_samples(session.connection(), samples)
+
+
+def apply_bulk_changes(rows, patch, actor_id=None):
+    """Actualizar varias PQRs con historial y SLA sin pasar por el ORM (una sentencia por tabla).
+
+    `rows` son filas con id, status, priority, assigned_agent_id, created_at,
+    status_changed_at y first_response_at tal como estaban antes del cambio.
+    """
+    now = datetime.utcnow()
+    updates = []
+    history = []
+    samples = []
+    for row in rows:
+        current = {key: getattr(row, key) for key in
+                   TRACKED_FIELDS + ('created_at', 'status_changed_at', 'first_response_at')}
+        sla_updates, entries, row_samples = plan_transition(current, patch, now)
+        updates.append({'id': row.id, **patch, **sla_updates, 'updated_at': now})
+        history.extend({'pqr_id': row.id, 'changed_by_id': actor_id, **entry} for entry in entries)
+        samples.extend(row_samples)
+    if updates:
+        db.session.execute(db.update(PQR), updates)
+    if history:
+        db.session.execute(db.insert(PQRStatusHistory), history)
+    if samples:
+        record_samples(db.session.connection(), samples)
+
+
+def overdue_query(now=None, due_within_hours=0):
+    """PQRs abiertas con la resolución vencida (o por vencer) o sin primera respuesta a tiempo.
+
+    Cada rama usa su índice (status, sla_due_at) / (status, response_due_at).
+    """
+    limit = (now or datetime.utcnow()) + timedelta(hours=due_within_hours)
+    return PQR.query.filter(db.or_(
+        db.and_(PQR.status.in_(OPEN_STATUSES), PQR.sla_due_at < limit),
+        db.and_(PQR.status == 'abierto', PQR.response_due_at < limit)
+    ))
+
+
+def sla_flags(pqr, now=None):
+    now = now or datetime.utcnow()
+    responded = pqr.first_response_at or (None if pqr.status == 'abierto' else pqr.status_changed_at)
+    resolved = pqr.resolved_at
+    return {
+        'response_breached': bool(pqr.response_due_at and (responded or now) > pqr.response_due_at),
+        'resolution_breached': bool(pqr.sla_due_at and (resolved or now) > pqr.sla_due_at),
+        'hours_to_due': round((pqr.sla_due_at - now).total_seconds() / 3600, 1)
+        if pqr.sla_due_at and not resolved else None
+    }
+
+
+def _percentile(buckets, total, percentile):
+    """Límite superior (horas) de la cubeta donde cae el percentil; None si es la cubeta abierta (>720 h)"""
+    target = total * percentile / 100
+    accumulated = 0
+    for bucket in sorted(buckets):
+        accumulated += buckets[bucket]
+        if accumulated >= target:
+            return RESOLUTION_BUCKETS_HOURS[bucket] if bucket < len(RESOLUTION_BUCKETS_HOURS) else None
+    return None
+
+
+def agent_resolution_stats():
+    """Resoluciones, promedio y percentiles por agente desde el histograma (pocas filas por agente)"""
+    agents = defaultdict(lambda: {'buckets': {}, 'count': 0, 'seconds': 0.0})
+    for agent_id, bucket, count, seconds in db.session.query(
+            AgentResolutionBucket.agent_id, AgentResolutionBucket.bucket,
+            AgentResolutionBucket.resolved_count, AgentResolutionBucket.total_seconds):
+        agent = agents[agent_id]
+        agent['buckets'][bucket] = count
+        agent['count'] += count
+        agent['seconds'] += seconds
+    if not agents:
+        return []
+    names = dict(db.session.query(User.id, User.name).filter(User.id.in_(list(agents))))
+
+    stats = []
+    for agent_id, agent in agents.items():
+        item = {
+            'agent_id': agent_id,
+            'agent_name': names.get(agent_id),
+            'resolved_count': agent['count'],
+            'avg_resolution_hours': round(agent['seconds'] / agent['count'] / 3600, 1) if agent['count'] else None
+        }
+        for percentile in PERCENTILES:
+            item[f'p{percentile}_resolution_hours'] = _percentile(agent['buckets'], agent['count'], percentile)
+        stats.append(item)
+    return sorted(stats, key=lambda item: -item['resolved_count'])
+
+
+def sla_summary(days=30, now=None):
+    """Tiempo promedio en cada estado, incumplimientos del periodo y PQRs vencidas abiertas"""
+    now = now or datetime.utcnow()
+    since = now - timedelta(days=days)
+    time_in_status = {
+        status: {'transitions': count, 'avg_hours': round((seconds or 0) / 3600, 1)}
+        for status, count, seconds in db.session.query(
+            PQRStatusHistory.old_value, db.func.count(PQRStatusHistory.id), db.func.avg(PQRStatusHistory.duration_seconds)
+        ).filter(PQRStatusHistory.field == 'status', PQRStatusHistory.changed_at >= since,
+                 PQRStatusHistory.old_value.isnot(None)).group_by(PQRStatusHistory.old_value)
+    }
+    resolved, resolved_late = db.session.query(
+        db.func.count(PQR.id),
+        db.func.coalesce(db.func.sum(db.case((PQR.resolved_at > PQR.sla_due_at, 1))), 0)
+    ).filter(PQR.status == CLOSED_STATUS, PQR.resolved_at >= since).one()
+    return {
+        'days': days,
+        'time_in_status': time_in_status,
+        'resolved': resolved,
+        'resolved_late': int(resolved_late),
+        'resolution_compliance': round(1 - int(resolved_late) / resolved, 3) if resolved else None,
+        'open_overdue': overdue_query(now).count(),
+        'due_next_24h': overdue_query(now, due_within_hours=24).count(),
+        'agents': agent_resolution_stats()
+    }
+
+
+def backfill_sla(after=None, batch_size=BACKFILL_BATCH_SIZE, max_batches=BACKFILL_MAX_BATCHES_PER_JOB):
+    """Fechas SLA de PQRs anteriores al historial (aproximadas con updated_at); retorna (actualizadas, id o None)"""
+    def apply_batch(rows):
+        changes = []
+        samples = []
+        for pqr_id, status, priority, agent_id, created_at, updated_at in rows:
+            created_at = created_at or datetime.utcnow()
+            change = {'id': pqr_id, 'status_changed_at': updated_at or created_at, **due_dates(created_at, priority)}
+            if status != 'abierto':
+                change['first_response_at'] = updated_at
+            if status == CLOSED_STATUS:
+                change['resolved_at'] = updated_at
+                if agent_id and updated_at:
+                    samples.append((agent_id, max((updated_at - created_at).total_seconds(), 0)))
+            changes.append(change)
+        db.session.execute(db.update(PQR), changes)
+        if samples:
+            record_samples(db.session.connection(), samples)
+        return len(changes)
+
+    query = db.session.query(PQR.id, PQR.status, PQR.priority, PQR.assigned_agent_id,
+                             PQR.created_at, PQR.updated_at).filter(PQR.sla_due_at.is_(None))
+    return backfill_by_id(query, apply_batch, 'Backfill de SLA en PQRs', after, batch_size, max_batches)
@@ -0,0 +1,101 @@
+# tasks.py - Tareas de la cola de trabajos (efectos secundarios fuera de la petición)
+import time
+
+from auth_tokens import purge_expired
+from clusters import SCAN_BATCH_SIZE, SCAN_MAX_BATCHES, reset_complaint_buckets, scan_new_complaints
+from conversations import purge_expired_sessions, schedule_session_purge, summarize_session
+from crm.rollups import rebuild_rollups
+from crm.linking import backfill_pqr_customers
+from crm.lots import backfill_pqr_lots
+from duplicates import backfill_signatures
+from sla import backfill_sla
+from events import publish_pqr_event
+from jobs import backfill_task, enqueue, task
+from models import db, PQR, PQRComment
+from triage import triage_pending
+
+TRIAGE_MAX_BATCHES_PER_JOB = 10
+
+
+@task('pqr.post_create')
+def pqr_post_create(payload):
+    """Efectos posteriores a la creación de una PQR: comentario inicial del sistema"""
+    pqr = db.session.get(PQR, payload['pqr_id'])
+    if not pqr:
+        return
+
+    # Idempotente: si un reintento llega después de un commit parcial no se duplica el comentario
+    already_commented = PQRComment.query.filter_by(pqr_id=pqr.id, author_name="Sistema Automatizado").first()
+    if already_commented:
+        return
+
+    comentario_inicial = f"PQR registrada exitosamente.\n"
+    comentario_inicial += f"Tipo: {pqr.type}\n"
+    comentario_inicial += f"Producto: {pqr.product_name}\n"
+    comentario_inicial += f"Cliente: {pqr.client_name}\n"
+    comentario_inicial += f"Archivos adjuntos: {payload.get('archivos_guardados', 0)}"
+
+    comment = PQRComment(
+        pqr_id=pqr.id,
+        user_id=pqr.user_id,
+        comment_text=comentario_inicial,
+        author_name="Sistema Automatizado",
+        is_internal=False
+    )
+    db.session.add(comment)
+    db.session.commit()
+
+    publish_pqr_event('comment.created', pqr, comment_id=comment.id, internal=False)
+
+
+@task('pqr.triage')
+def pqr_triage(payload):
+    """Triage por lotes de todas las PQRs pendientes (un llamado al modelo por lote)"""
+    for _ in range(TRIAGE_MAX_BATCHES_PER_JOB):
+        if not triage_pending():
+            break
+
+
+@task('tokens.purge_revoked')
+def tokens_purge_revoked(payload):
+    """Borrar revocaciones de tokens que ya expiraron (no pueden volver a usarse)"""
+    purge_expired()
+
+
+@task('crm.rebuild_rollups')
+def crm_rebuild_rollups(payload):
+    """Recalcular los agregados diarios y mensuales de ventas desde la tabla sale"""
+    rebuild_rollups()
+
+
+@task('quality.cluster_scan')
+def quality_cluster_scan(payload):
+    """Detección incremental de clústeres de PQRs; con rebuild reprocesa toda la historia"""
+    if payload.get('rebuild'):
+        reset_complaint_buckets()
+    processed, _ = scan_new_complaints()
+    if processed >= SCAN_BATCH_SIZE * SCAN_MAX_BATCHES:
+        # Historia larga (p. ej. tras un rebuild): se continúa en otro trabajo
+        enqueue('quality.cluster_scan', {}, idempotency_key=f'quality.cluster_scan:continuar:{int(time.time())}')
+        db.session.commit()
+
+
+@task('chat.summarize')
+def chat_summarize(payload):
+    """Resumir los turnos antiguos de una conversación del asistente que excedió su presupuesto de tokens"""
+    summarize_session(payload['session_id'])
+
+
+@task('chat.purge_sessions')
+def chat_purge_sessions(payload):
+    """Borrar conversaciones del asistente inactivas por más del TTL y programar la siguiente limpieza"""
+    purge_expired_sessions()
+    schedule_session_purge()
+    db.session.commit()
+
+
+# Backfills por id de columnas nuevas: cada trabajo encadena el siguiente de la misma corrida
+crm_backfill_pqr_customers = backfill_task('crm.backfill_pqr_customers', backfill_pqr_customers)
+lots_backfill_pqr_lots = backfill_task('lots.backfill_pqr_lots', backfill_pqr_lots)
+sla_backfill = backfill_task('sla.backfill', backfill_sla)
+duplicates_backfill_signatures = backfill_task('duplicates.backfill_signatures', backfill_signatures)
@@ -0,0 +1,259 @@
+# triage.py - Triage automático de PQRs nuevas (tipo, prioridad, temperatura y agente sugerido)
+import json
+import time
+
+from flask import current_app
+from sqlalchemy.orm import contains_eager
+
+from logging_config import get_logger
+from metrics import observe_openai_call
+from models import db, PQR, PQRComment, PQRStatusHistory, PQRTriage
+from workload import least_loaded_agents, invalidate_workload
+
+logger = get_logger('triage')
+
+VALID_TYPES = ['peticion', 'queja', 'reclamo', 'sugerencia']
+VALID_PRIORITIES = ['baja', 'media', 'alta']
+DEFAULT_TEMPERATURE = 'Temperatura ambiente'
+TEMPERATURE_RANGES = ['Congelado (-18°C o menos)', 'Refrigerado (0°C a 4°C)', DEFAULT_TEMPERATURE]
+
+# Valores con los que create_pqr registra la PQR; solo esos se reemplazan con el triage
+CREATION_PRIORITY = 'media'
+CLOSED_STATUS = 'cerrado'
+# Fila de triage creada con la PQR: solo las PQRs así marcadas se clasifican (nunca el histórico)
+PENDING_SOURCE = 'pendiente'
+
+HIGH_PRIORITY_WORDS = [
+    'intoxic', 'hospital', 'vidrio', 'metal', 'plastico', 'plástico', 'cuerpo extraño', 'insecto',
+    'moho', 'hongo', 'contamina', 'alerg', 'enferm', 'vómito', 'vomito', 'diarrea', 'descompuest', 'podrid'
+]
+MEDIUM_PRIORITY_WORDS = [
+    'olor', 'sabor', 'color', 'textura', 'empaque roto', 'vencid', 'temperatura', 'dañad', 'danad', 'faltante'
+]
+TYPE_WORDS = {
+    'sugerencia': ['sugiero', 'sugerencia', 'recomend', 'podrían', 'podrian', 'mejorar'],
+    'peticion': ['solicito', 'solicitud', 'certificado', 'ficha técnica', 'ficha tecnica', 'información', 'informacion'],
+    'reclamo': ['devoluci', 'reembolso', 'factura', 'cobro', 'nota crédito', 'nota credito', 'cambio del producto'],
+}
+FROZEN_WORDS = ['congelad', 'helado']
+CHILLED_WORDS = ['refrigerad', 'salchicha', 'jamón', 'jamon', 'carne', 'pollo', 'queso', 'lácteo', 'lacteo', 'chorizo']
+
+
+def ticket_text(ticket):
+    return ' '.join(str(ticket.get(key) or '') for key in ('subject', 'description', 'product_name', 'batch_number')).lower()
+
+
+class LocalTriageClassifier:
+    """Clasificador determinístico por palabras clave; respaldo cuando no hay modelo disponible"""
+
+    source = 'local'
+
+    def classify_batch(self, tickets):
+        return [self.classify(ticket) for ticket in tickets]
+
+    def classify(self, ticket):
+        text = ticket_text(ticket)
+
+        if any(word in text for word in HIGH_PRIORITY_WORDS):
+            priority = 'alta'
+        elif any(word in text for word in MEDIUM_PRIORITY_WORDS):
+            priority = 'media'
+        else:
+            priority = 'baja'
+
+        ticket_type = ticket.get('type') if ticket.get('type') in VALID_TYPES else 'queja'
+        for candidate, words in TYPE_WORDS.items():
+            if any(word in text for word in words):
+                ticket_type = candidate
+                break
+
+        if any(word in text for word in FROZEN_WORDS):
+            temperature = TEMPERATURE_RANGES[0]
+        elif any(word in text for word in CHILLED_WORDS):
+            temperature = TEMPERATURE_RANGES[1]
+        else:
+            temperature = DEFAULT_TEMPERATURE
+
+        return {
+            'type': ticket_type,
+            'priority': priority,
+            'temperature_range': temperature,
+            'reason': 'Clasificación local por palabras clave'
+        }
+
+
+class OpenAITriageClient:
+    """Clasificación con OpenAI: un solo llamado al modelo para todo el lote de PQRs"""
+
+    source = 'modelo'
+
+    def __init__(self, client, model='gpt-3.5-turbo'):
+        self.client = client
+        self.model = model
+
+    def classify_batch(self, tickets):
+        items = [{
+            'index': i,
+            'type': ticket.get('type'),
+            'subject': ticket.get('subject'),
+            'description': (ticket.get('description') or '')[:500],
+            'product_name': ticket.get('product_name'),
+            'batch_number': ticket.get('batch_number')
+        } for i, ticket in enumerate(tickets)]
+
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": (
+                        "Clasificas PQRs de una empresa de alimentos. Responde SOLO con un arreglo JSON, un objeto por PQR "
+                        "con las llaves: index, type (" + ', '.join(VALID_TYPES) + "), priority (" + ', '.join(VALID_PRIORITIES) + "), "
+                        "temperature_range (" + ' | '.join(TEMPERATURE_RANGES) + ") y reason (máximo 20 palabras). "
+                        "Prioridad alta para riesgos de inocuidad (cuerpos extraños, contaminación, afectaciones de salud)."
+                    )},
+                    {"role": "user", "content": json.dumps(items, ensure_ascii=False)}
+                ],
+                max_tokens=60 * len(items) + 50,
+                temperature=0
+            )
+        except Exception as e:
+            observe_openai_call('triage', time.perf_counter() - started, error=e)
+            raise
+        observe_openai_call('triage', time.perf_counter() - started, response=response)
+
+        parsed = json.loads(response.choices[0].message.content.strip())
+        by_index = {item.get('index'): item for item in parsed if isinstance(item, dict)}
+        return [by_index.get(i, {}) for i in range(len(tickets))]
+
+
+def get_model_client():
+    """Cliente de triage configurado: TRIAGE_MODEL_CLIENT (p. ej. un stub en pruebas) u OpenAI"""
+    client = current_app.config.get('TRIAGE_MODEL_CLIENT')
+    if client:
+        return client
+    openai_client = current_app.config.get('OPENAI_CLIENT')
+    if openai_client:
+        return OpenAITriageClient(openai_client, current_app.config.get('TRIAGE_MODEL', 'gpt-3.5-turbo'))
+    return None
+
+
+def classify_tickets(tickets):
+    """Clasificar un lote con el modelo y completar con el clasificador local lo que falte o sea inválido"""
+    local = LocalTriageClassifier()
+    fallback = local.classify_batch(tickets)
+
+    model_client = get_model_client()
+    model_results = None
+    if model_client:
+        try:
+            model_results = model_client.classify_batch(tickets)
+        except Exception as e:
+            logger.warning('Triage con modelo falló, usando clasificador local', extra={'error': str(e), 'batch': len(tickets)})
+
+    results = []
+    for i, local_result in enumerate(fallback):
+        candidate = model_results[i] if model_results and i < len(model_results) else None
+        if (candidate and candidate.get('type') in VALID_TYPES and candidate.get('priority') in VALID_PRIORITIES
+                and candidate.get('temperature_range') in TEMPERATURE_RANGES):
+            results.append(dict(candidate, source=getattr(model_client, 'source', 'modelo')))
+        else:
+            results.append(dict(local_result, source=local.source))
+    return results
+
+
+def pending_pqrs(limit):
+    """PQRs marcadas para triage al crearlas y aún sin clasificar, las más antiguas primero"""
+    # Con PostgreSQL dos trabajos simultáneos no toman las mismas filas (en SQLite las escrituras ya se serializan)
+    return PQR.query.join(PQR.triage).options(contains_eager(PQR.triage))\
+        .filter(PQRTriage.source == PENDING_SOURCE)\
+        .order_by(PQRTriage.created_at.asc())\
+        .with_for_update(of=PQRTriage, skip_locked=True)\
+        .limit(limit).all()
+
+
+def human_set_fields(pqr_ids):
+    """(pqr_id, campo) de prioridad o agente ya cambiados en el historial antes del triage (por el personal)"""
+    return set(db.session.query(PQRStatusHistory.pqr_id, PQRStatusHistory.field).filter(
+        PQRStatusHistory.pqr_id.in_(pqr_ids),
+        PQRStatusHistory.field.in_(['priority', 'assigned_agent_id'])))
+
+
+def triage_pending(batch_size=None):
+    """Clasificar un lote de PQRs pendientes y aplicar los resultados; retorna las PQRs procesadas"""
+    from events import publish_pqr_event
+
+    batch_size = batch_size or current_app.config.get('TRIAGE_BATCH_SIZE', 20)
+    pqrs = pending_pqrs(batch_size)
+    if not pqrs:
+        return []
+
+    tickets = [{
+        'type': pqr.type,
+        'subject': pqr.subject,
+        'description': pqr.description,
+        'product_name': pqr.product_name,
+        'batch_number': pqr.batch_number
+    } for pqr in pqrs]
+    results = classify_tickets(tickets)
+    auto_assign = current_app.config.get('TRIAGE_AUTO_ASSIGN', True)
+    # Carga por agente leída una vez por lote y actualizada localmente con cada asignación
+    candidates = least_loaded_agents()
+    human_set = human_set_fields([pqr.id for pqr in pqrs])
+
+    for pqr, result in zip(pqrs, results):
+        # Cerrada antes del triage: se guarda la sugerencia pero no se toca la PQR
+        applies = pqr.status != CLOSED_STATUS
+        agent_id = None
+        if applies and pqr.assigned_agent_id is None and (pqr.id, 'assigned_agent_id') not in human_set \
+                and candidates:
+            agent = candidates[0]
+            agent_id = agent['id']
+            agent['active_pqrs_count'] += 1
+            candidates = least_loaded_agents(candidates)
+
+        triage = pqr.triage
+        triage.suggested_type = result['type']
+        triage.suggested_priority = result['priority']
+        triage.suggested_agent_id = agent_id
+        triage.temperature_range = result['temperature_range']
+        triage.source = result['source']
+        triage.reason = result.get('reason')
+
+        # Solo se reemplazan los valores por defecto de creación, nunca cambios hechos por el personal
+        if applies and pqr.priority == CREATION_PRIORITY and (pqr.id, 'priority') not in human_set:
+            pqr.priority = result['priority']
+        if applies and pqr.ideal_temperature_range == DEFAULT_TEMPERATURE:
+            pqr.ideal_temperature_range = result['temperature_range']
+        if agent_id and auto_assign:
+            pqr.assigned_agent_id = agent_id
+
+        resumen = f"Triage automático ({result['source']}): prioridad {result['priority']}, tipo sugerido {result['type']}"
+        if result.get('reason'):
+            resumen += f". {result['reason']}"
+        db.session.add(PQRComment(
+            pqr_id=pqr.id,
+            user_id=pqr.user_id,
+            comment_text=resumen,
+            author_name="Triage Automático",
+            is_internal=True
+        ))
+
+    db.session.commit()
+    invalidate_workload()
+
+    for pqr in pqrs:
+        publish_pqr_event('pqr.updated', pqr, changes=['triage'])
+    return pqrs
+
+
+def schedule_triage(pqr):
+    """Marcar una PQR nueva para triage y encolar el lote actual; las PQRs creadas en la misma ventana comparten un trabajo"""
+    from jobs import enqueue
+
+    if not current_app.config.get('TRIAGE_ENABLED', True):
+        return None
+    db.session.add(PQRTriage(pqr_id=pqr.id, source=PENDING_SOURCE))
+    window = current_app.config.get('TRIAGE_WINDOW_SECONDS', 10)
+    bucket = int(time.time() // window)
+    return enqueue('pqr.triage', {}, idempotency_key=f'pqr.triage:{bucket}', delay_seconds=window)
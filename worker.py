@@ -0,0 +1,16 @@
+# worker.py - Proceso worker de la cola de trabajos (Procfile: worker)
+import os
+import signal
+
+# Este proceso es el worker: no iniciar además el hilo worker del proceso web
+os.environ['JOBS_INLINE_WORKER'] = 'false'
+
+from app import app
+from jobs import Worker
+import tasks  # noqa: F401 - registra las tareas
+
+
+if __name__ == '__main__':
+    worker = Worker(app)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    worker.run_forever()
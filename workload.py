@@ -0,0 +1,97 @@
+# workload.py - Carga de trabajo por agente (una consulta agrupada) con caché invalidada por eventos
+import threading
+import time
+from datetime import datetime
+
+from models import db, User, PQR
+
+AGENT_ROLES = ['administrador', 'calidad', 'registrador']
+# Roles elegibles para asignación automática, en orden de preferencia
+ASSIGNABLE_ROLES = ['calidad', 'administrador']
+WORKLOAD_CACHE_SECONDS = 60
+
+_lock = threading.Lock()
+_cache = {'rows': None, 'expires': 0.0}
+
+
+def compute_agent_workload():
+    """Asignadas, abiertas, en proceso y la abierta más antigua por agente en un solo LEFT JOIN agrupado"""
+    open_case = db.case((PQR.status == 'abierto', 1), else_=0)
+    in_process_case = db.case((PQR.status == 'en_proceso', 1), else_=0)
+    oldest_open = db.func.min(db.case((PQR.status == 'abierto', PQR.created_at)))
+
+    rows = db.session.query(
+        User,
+        db.func.count(PQR.id),
+        db.func.coalesce(db.func.sum(open_case), 0),
+        db.func.coalesce(db.func.sum(in_process_case), 0),
+        oldest_open
+    ).outerjoin(PQR, PQR.assigned_agent_id == User.id)\
+        .filter(User.role.in_(AGENT_ROLES))\
+        .group_by(User.id)\
+        .order_by(User.id)\
+        .all()
+
+    workload = []
+    for user, assigned, open_count, in_process, oldest in rows:
+        if isinstance(oldest, str):
+            oldest = datetime.fromisoformat(oldest)
+        agent = user.to_dict()
+        agent.update({
+            'assigned_pqrs_count': assigned,
+            'open_pqrs_count': int(open_count),
+            'in_process_pqrs_count': int(in_process),
+            'oldest_open_created_at': oldest
+        })
+        workload.append(agent)
+    return workload
+
+
+def agent_workload():
+    """Carga de trabajo cacheada; se recalcula al expirar o tras un cambio de asignación/estado"""
+    now = time.monotonic()
+    with _lock:
+        if _cache['rows'] is not None and now < _cache['expires']:
+            rows = _cache['rows']
+        else:
+            rows = None
+    if rows is None:
+        rows = compute_agent_workload()
+        with _lock:
+            _cache['rows'] = rows
+            _cache['expires'] = now + WORKLOAD_CACHE_SECONDS
+
+    # La antigüedad se calcula al leer para no servir edades congeladas desde la caché
+    result = []
+    utcnow = datetime.utcnow()
+    for row in rows:
+        agent = dict(row)
+        oldest = agent.pop('oldest_open_created_at')
+        agent['oldest_open_age_hours'] = round((utcnow - oldest).total_seconds() / 3600, 1) if oldest else None
+        agent['active_pqrs_count'] = agent['open_pqrs_count'] + agent['in_process_pqrs_count']
+        result.append(agent)
+    return result
+
+
+def invalidate_workload():
+    with _lock:
+        _cache['rows'] = None
+
+
+def least_loaded_agents(workload=None):
+    """Agentes asignables ordenados por preferencia de rol y menor número de PQRs activas"""
+    workload = workload if workload is not None else agent_workload()
+    candidates = [agent for agent in workload if agent['role'] in ASSIGNABLE_ROLES]
+    return sorted(candidates, key=lambda agent: (
+        ASSIGNABLE_ROLES.index(agent['role']), agent['active_pqrs_count'], agent['id']))
+
+
+def _on_event(event):
+    # Cualquier cambio de PQR puede mover contadores de asignación o estado
+    if event.get('type') == 'pqr.updated':
+        invalidate_workload()
+
+
+def init_workload(broker):
+    """Invalidar la caché con los eventos del broker (llegan de todos los workers con backend postgres)"""
+    broker.add_listener(_on_event)